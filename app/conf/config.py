@@ -12,6 +12,15 @@ class Settings(BaseSettings):
     VERSION: Optional[str] = '0.1.0'
     DEBUG: Optional[bool] = False
     PAGINATION_MAX_SIZE: Optional[int] = 25
+    # Largest page a list returns, larger lists are streamed with `Accept: application/x-ndjson`
+    PAGINATION_HARD_MAX: Optional[int] = 1000
+    # Rows fetched from the server side cursor at a time when streaming a list
+    PAGINATION_STREAM_CHUNK: Optional[int] = 500
+    # Most ids a batch get takes, they are looked up `BATCH_CHUNK_SIZE` per `IN` list
+    BATCH_MAX_IDS: Optional[int] = 1000
+    BATCH_CHUNK_SIZE: Optional[int] = 500
+    # Most operations one `POST /batch/` request runs
+    BATCH_MAX_OPERATIONS: Optional[int] = 50
 
     DOMAIN: Optional[str] = 'localhost:8000'
     ENABLE_SSL: Optional[bool] = False
@@ -51,6 +60,110 @@ class Settings(BaseSettings):
             raise ValueError("When IS_MULTI_TENANT_DB is false DATABASE_NAME required")
 
     TEST_DATABASE_NAME: Optional[str] = "test"
+    # Allowlist of tenant audiences, `{audience: database}` or `{audience: "host[:port]/database"}`.
+    # Tenants are also read from the `tenants` table of TENANT_DIRECTORY_DATABASE; with neither,
+    # every audience is a database on DATABASE_HOST
+    TENANTS: Optional[Dict[str, str]] = {}
+    TENANT_DIRECTORY_DATABASE: Optional[str] = None
+    TENANT_DIRECTORY_REFRESH: Optional[int] = 60
+    # Seconds an audience missing from the directory is rejected without asking the table again
+    TENANT_NEGATIVE_TTL: Optional[int] = 30
+    TENANT_NEGATIVE_MAX_SIZE: Optional[int] = 10000
+    # Connection pool of each database engine, engines are shared per database
+    DATABASE_POOL_SIZE: Optional[int] = 5
+    DATABASE_MAX_OVERFLOW: Optional[int] = 10
+    DATABASE_POOL_TIMEOUT: Optional[float] = 30
+    DATABASE_POOL_RECYCLE: Optional[int] = 3600
+    DATABASE_CONNECT_TIMEOUT: Optional[int] = 5
+    # Reads and whole write transactions of `CRUDBase` are replayed after deadlocks, lock wait
+    # timeouts and lost connections, waiting up to BACKOFF * 2^attempt seconds (random, capped
+    # at MAX_BACKOFF). BUDGET caps the replays of one request over all its operations
+    DATABASE_RETRY_ATTEMPTS: Optional[int] = 3
+    DATABASE_RETRY_BACKOFF: Optional[float] = 0.05
+    DATABASE_RETRY_MAX_BACKOFF: Optional[float] = 1.0
+    DATABASE_RETRY_BUDGET: Optional[int] = 3
+    # Time limit of each statement of a request, endpoints override it with `statement_timeout`.
+    # MySQL interrupts SELECTs at the limit (MAX_EXECUTION_TIME), the await gives up GRACE_MS later
+    DATABASE_STATEMENT_TIMEOUT_MS: Optional[int] = 10000
+    DATABASE_STATEMENT_TIMEOUT_GRACE_MS: Optional[int] = 1000
+    # Connections one request may use at once for independent reads (`gather_reads`)
+    DATABASE_PARALLEL_READS: Optional[int] = 2
+    # Per database circuit breaker, opened by connection errors and statements slower than
+    # CIRCUIT_BREAKER_SLOW_MS, FAILURE_THRESHOLD of them within WINDOW seconds. Requests get 503
+    # for RESET_TIMEOUT seconds, then HALF_OPEN_REQUESTS probe requests at a time are let through
+    CIRCUIT_BREAKER_ENABLED: Optional[bool] = True
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: Optional[int] = 5
+    CIRCUIT_BREAKER_WINDOW: Optional[float] = 30
+    CIRCUIT_BREAKER_SLOW_MS: Optional[int] = 5000
+    CIRCUIT_BREAKER_RESET_TIMEOUT: Optional[float] = 15
+    CIRCUIT_BREAKER_HALF_OPEN_REQUESTS: Optional[int] = 1
+
+    # Request timing and SQL instrumentation
+    TIMING_ENABLED: Optional[bool] = True
+    TIMING_SAMPLE_RATE: Optional[float] = 1.0
+    TIMING_SLOW_REQUEST_MS: Optional[int] = 1000
+
+    # Per-request statement budgets, enabled in debug mode by default
+    QUERY_BUDGET_ENABLED: Optional[bool] = None
+    QUERY_BUDGET_STRICT: Optional[bool] = False
+    QUERY_BUDGET_REPEAT_THRESHOLD: Optional[int] = 3
+
+    # Token bucket rate limits per audience, rates are tokens per second
+    RATE_LIMIT_ENABLED: Optional[bool] = True
+    RATE_LIMIT_BACKEND: Optional[str] = 'app.core.throttling.InMemoryRateLimitBackend'
+    RATE_LIMIT_REDIS_URL: Optional[str] = None
+    RATE_LIMIT_READ_RATE: Optional[float] = 50
+    RATE_LIMIT_READ_BURST: Optional[int] = 100
+    RATE_LIMIT_WRITE_RATE: Optional[float] = 10
+    RATE_LIMIT_WRITE_BURST: Optional[int] = 20
+    # In-flight requests per audience and worker, extra requests wait in a bounded queue
+    CONCURRENCY_LIMIT_PER_TENANT: Optional[int] = 20
+    CONCURRENCY_QUEUE_SIZE: Optional[int] = 50
+    CONCURRENCY_QUEUE_TIMEOUT: Optional[float] = 2.0
+
+    # Coalesce identical concurrent GET requests of a tenant
+    SINGLE_FLIGHT_ENABLED: Optional[bool] = True
+    SINGLE_FLIGHT_GRACE_MS: Optional[int] = 0
+
+    # Response compression, brotli and zstd are used when `brotli`/`zstandard` are installed
+    COMPRESSION_ENABLED: Optional[bool] = True
+    COMPRESSION_MINIMUM_SIZE: Optional[int] = 1024
+    COMPRESSION_GZIP_LEVEL: Optional[int] = 6
+    COMPRESSION_BROTLI_QUALITY: Optional[int] = 4
+    COMPRESSION_ZSTD_LEVEL: Optional[int] = 3
+
+    # Build `VisibleBase` responses from ORM rows without revalidating them
+    TRUSTED_OUTPUT: Optional[bool] = True
+
+    # Background jobs, processed by `python -m app.worker`
+    JOB_BACKEND: Optional[str] = 'app.contrib.job.backends.DatabaseJobBackend'
+    JOB_MODULES: Optional[List[str]] = ['app.contrib.user.jobs', 'app.contrib.school.jobs', 'app.contrib.job.purge']
+    JOB_MAX_ROWS: Optional[int] = 50000
+    JOB_CHUNK_SIZE: Optional[int] = 500
+    JOB_MAX_ERRORS: Optional[int] = 1000
+    JOB_MAX_ATTEMPTS: Optional[int] = 3
+    JOB_RETRY_DELAY: Optional[int] = 30
+    # Running jobs without progress for this many seconds are taken over by another worker
+    JOB_LOCK_TIMEOUT: Optional[int] = 300
+    JOB_POLL_INTERVAL: Optional[float] = 1.0
+    JOB_WORKER_CONCURRENCY: Optional[int] = 2
+
+    # Change feed, long-poll and SSE clients re-check the outbox every poll interval
+    CHANGES_POLL_INTERVAL: Optional[float] = 1.0
+    CHANGES_MAX_WAIT: Optional[int] = 30
+    CHANGES_MAX_LIMIT: Optional[int] = 1000
+    # Changes younger than this are held back, so ids committed out of order are not skipped
+    CHANGES_SETTLE_SECONDS: Optional[int] = 1
+    CHANGES_STREAM_HEARTBEAT: Optional[int] = 15
+    CHANGES_STREAM_MAX_SECONDS: Optional[int] = 300
+
+    # Soft deleted rows are hard deleted by `python -m app.worker --purge` after this many seconds
+    SOFT_DELETE_RETENTION: Optional[int] = 86400
+    # Rows referencing a purged row are deleted this many at a time
+    SOFT_DELETE_PURGE_BATCH: Optional[int] = 1000
+
+    # Largest radius of the nearby school search
+    NEARBY_MAX_RADIUS_KM: Optional[int] = 100
 
     TIME_ZONE: Optional[str] = "Asia/Ashgabat"
     USE_TZ: Optional[bool] = True
@@ -61,8 +174,9 @@ class Settings(BaseSettings):
 
 
 class JWTSettings(BaseSettings):
-    # Security
-    JWT_SECRET_KEY: Optional[str] = 'change_this'
+    # Security, service tokens (`/auth/token/`) are only issued and accepted once this is set
+    # to a random value of at least 32 characters
+    JWT_SECRET_KEY: Optional[str] = None
     # JWT
     JWT_PUBLIC_KEY: Optional[str] = None
     JWT_PRIVATE_KEY: Optional[str] = None
@@ -71,7 +185,7 @@ class JWTSettings(BaseSettings):
     JWT_VERIFY_EXPIRATION: Optional[bool] = True
     JWT_LEEWAY: Optional[int] = 0
     JWT_ARGUMENT_NAME: Optional[str] = 'token'
-    JWT_EXPIRATION_MINUTES: Optional[int] = 60 * 24
+    JWT_EXPIRATION_MINUTES: Optional[int] = 15
     JWT_ALLOW_REFRESH: Optional[bool] = True
     JWT_REFRESH_EXPIRATION_MINUTES: Optional[int] = 60 * 24 * 30 * 12
     JWT_AUTH_HEADER_NAME: Optional[str] = 'Authorization'
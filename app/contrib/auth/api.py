@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from app.conf.config import jwt_settings
+from app.core.batch import batchable
+from app.core.query_budget import query_budget
+from app.routers.dependency import get_audience, get_service_token, jwt_handler, throttle, verify_service_token
+from app.routers.route import ServiceRoute
+from app.utils.security import ACCESS, REFRESH, service_tokens_enabled
+from .schema import TokenPair, RefreshRequest
+
+api = APIRouter(route_class=ServiceRoute)
+
+
+def issue_access_token(audience: str) -> dict:
+    payload = jwt_handler('JWT_PAYLOAD_HANDLER')(audience, ACCESS)
+    return {
+        'access_token': jwt_handler('JWT_ENCODE_HANDLER')(payload),
+        'token_type': 'bearer',
+        'expires_in': jwt_settings.JWT_EXPIRATION_MINUTES * 60,
+    }
+
+
+@api.post('/auth/token/', tags=['auth'], name='auth-token', response_model=TokenPair, dependencies=[Depends(throttle)])
+@query_budget(0)
+@batchable(False)
+async def obtain_token(request: Request, audience: str = Depends(get_audience)) -> dict:
+    """
+    Exchange a Google ID token for a service token.
+
+    Send the access token as `Authorization: Bearer ...` afterwards, it is verified
+    with an HMAC instead of Google's certificates. Renew it at `/auth/refresh/`
+    with the refresh token, given when `JWT_ALLOW_REFRESH` is on.
+    """
+    if not service_tokens_enabled():
+        raise HTTPException(status_code=404, detail="Service tokens are disabled")
+    if get_service_token(request) is not None:
+        raise HTTPException(status_code=400, detail="Exchange a Google ID token, renew service tokens at /auth/refresh/")
+    tokens = issue_access_token(audience)
+    if jwt_settings.JWT_ALLOW_REFRESH:
+        payload = jwt_handler('JWT_PAYLOAD_HANDLER')(audience, REFRESH)
+        tokens['refresh_token'] = jwt_handler('JWT_ENCODE_HANDLER')(payload)
+    return tokens
+
+
+@api.post('/auth/refresh/', tags=['auth'], name='auth-refresh', response_model=TokenPair)
+@query_budget(0)
+@batchable(False)
+async def refresh_token(body: RefreshRequest) -> dict:
+    """
+    New access token for a refresh token.
+
+    The refresh token itself is returned unchanged, so a session never outlives
+    `JWT_REFRESH_EXPIRATION_MINUTES` from its Google ID token exchange.
+    """
+    if not service_tokens_enabled():
+        raise HTTPException(status_code=404, detail="Service tokens are disabled")
+    if not jwt_settings.JWT_ALLOW_REFRESH:
+        raise HTTPException(status_code=400, detail="Token refresh is disabled")
+    audience = verify_service_token(body.refresh_token, REFRESH)
+    return {**issue_access_token(audience), 'refresh_token': body.refresh_token}
@@ -0,0 +1,14 @@
+from typing import Optional
+
+from app.core.schema import BaseModel
+
+
+class TokenPair(BaseModel):
+    access_token: str
+    token_type: str = 'bearer'
+    expires_in: int
+    refresh_token: Optional[str] = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
@@ -0,0 +1,122 @@
+from typing import Any, Callable, Optional
+from urllib.parse import urlencode
+
+import orjson
+from fastapi import APIRouter, Depends, Request
+from fastapi.middleware.asyncexitstack import AsyncExitStackMiddleware
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.middleware.exceptions import ExceptionMiddleware
+from starlette.routing import Match
+from starlette.types import ASGIApp, Scope
+
+from app.conf.config import settings
+from app.core.batch import BATCH_CONTEXT, BatchContext, batchable
+from app.core.query_budget import query_budget
+from app.routers.dependency import get_async_db, get_audience
+from app.routers.route import ServiceRoute
+from .schema import BatchRequest, BatchOperation, BatchResult
+
+api = APIRouter(route_class=ServiceRoute)
+
+# Request headers an operation does not inherit from the batch request
+_OWN_HEADERS = {b'content-length', b'content-type', b'accept', b'accept-encoding'}
+_INHERITED_SCOPE = ('type', 'asgi', 'http_version', 'scheme', 'server', 'client', 'root_path', 'app')
+
+
+def operation_scope(request: Request, context: BatchContext, operation: BatchOperation, body: bytes) -> Scope:
+    path = f'{settings.API_V1_STR}{operation.path}'
+    headers = [(name, value) for name, value in request.scope['headers'] if name not in _OWN_HEADERS]
+    headers.extend((
+        (b'accept', b'application/json'),
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+    ))
+    return {
+        **{key: request.scope[key] for key in _INHERITED_SCOPE if key in request.scope},
+        'method': operation.method,
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': urlencode(operation.query, doseq=True).encode(),
+        'headers': headers,
+        BATCH_CONTEXT: context,
+    }
+
+
+def find_endpoint(request: Request, scope: Scope) -> Optional[Callable]:
+    for route in request.app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, 'endpoint', None)
+    return None
+
+
+async def run_operation(app: ASGIApp, request: Request, context: BatchContext, operation: BatchOperation) -> dict:
+    """
+    Dispatch one operation to its route and collect the response
+    """
+    body = b'' if operation.body is None else orjson.dumps(operation.body)
+    scope = operation_scope(request, context, operation, body)
+    endpoint = find_endpoint(request, scope)
+    if endpoint is not None and not getattr(endpoint, 'batchable', True):
+        return {'status': 400, 'body': {'detail': f'{operation.method} {operation.path} can not run in a batch'}}
+
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response = {'status': 500, 'body': b''}
+
+    async def receive() -> dict:
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message: dict) -> None:
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    await app(scope, receive, send)
+    content: Any = None
+    if response['body']:
+        try:
+            content = orjson.loads(response['body'])
+        except orjson.JSONDecodeError:
+            content = response['body'].decode(errors='replace')
+    return {'status': response['status'], 'body': content}
+
+
+@api.post('/batch/', tags=['batch'], name='batch', response_model=BatchResult)
+@query_budget(None, repeat_threshold=0)
+@batchable(False)
+async def run_batch(
+        request: Request,
+        batch: BatchRequest,
+        audience: str = Depends(get_audience),
+        async_db: AsyncSession = Depends(get_async_db),
+) -> dict:
+    """
+    Run `operations` against the API routes, in order, in one transaction.
+
+    The request is authenticated once and every operation gets the same session,
+    whose commits release a savepoint only. A failed operation rolls back its own
+    savepoint; with `atomic` the batch stops there and nothing is committed,
+    otherwise the remaining operations still run and the successful ones are committed.
+    Each operation reports the status and body its route responded with.
+    """
+    connection = await async_db.connection()
+    session = AsyncSession(bind=connection, join_transaction_mode='create_savepoint', expire_on_commit=False)
+    context = BatchContext(audience, session)
+    app = ExceptionMiddleware(AsyncExitStackMiddleware(request.app.router), handlers=request.app.exception_handlers)
+    results = []
+    try:
+        for operation in batch.operations:
+            result = await run_operation(app, request, context, operation)
+            results.append(result)
+            if batch.atomic and result['status'] >= 400:
+                break
+    finally:
+        await session.close()
+
+    committed = not (batch.atomic and results[-1]['status'] >= 400)
+    if committed:
+        await async_db.commit()
+    else:
+        await async_db.rollback()
+    return {'committed': committed, 'results': results}
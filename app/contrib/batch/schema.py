@@ -0,0 +1,28 @@
+from typing import Optional, Any, Dict, List, Literal
+
+from pydantic import Field
+
+from app.conf.config import settings
+from app.core.schema import BaseModel
+
+
+class BatchOperation(BaseModel):
+    method: Literal['GET', 'POST', 'PUT', 'PATCH', 'DELETE']
+    path: str = Field(..., pattern=r'^/', max_length=2048, description="Path below the API prefix, e.g. `/group/create/`")
+    query: Dict[str, Any] = {}
+    body: Optional[Any] = None
+
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=settings.BATCH_MAX_OPERATIONS)
+    atomic: bool = Field(True, description="Stop at the first failed operation and roll back all of them")
+
+
+class BatchOperationResult(BaseModel):
+    status: int
+    body: Optional[Any] = None
+
+
+class BatchResult(BaseModel):
+    committed: bool
+    results: List[BatchOperationResult]
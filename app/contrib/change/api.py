@@ -0,0 +1,102 @@
+import asyncio
+import time
+from typing import Optional, AsyncIterator
+
+import orjson
+from fastapi import APIRouter, Depends, Header, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import StreamingResponse
+
+from app.conf.config import settings
+from app.core.batch import batchable
+from app.core.query_budget import query_budget
+from app.core.schema import ICursorPageBase
+from app.core.single_flight import single_flight
+from app.core.throttling import throttle_class, STREAM
+from app.db.outbox import Change
+from app.routers.dependency import get_async_db
+from app.routers.route import ServiceRoute
+from .schema import ChangeVisible
+from .repository import change_repo
+
+api = APIRouter(route_class=ServiceRoute)
+
+
+def format_event(change: Change) -> bytes:
+    data = orjson.dumps(ChangeVisible.from_trusted(change).model_dump(mode='json'))
+    return b'id: %d\nevent: change\ndata: %s\n\n' % (change.id, data)
+
+
+@api.get("/changes/", tags=["changes"], name='change-list', response_model=ICursorPageBase[ChangeVisible])
+@query_budget(None, repeat_threshold=0)
+@throttle_class(STREAM)
+@batchable(False)
+async def get_change_list(
+        since: Optional[int] = Query(0, ge=0),
+        limit: Optional[int] = Query(100, ge=1, le=settings.CHANGES_MAX_LIMIT),
+        table: Optional[str] = None,
+        wait: Optional[int] = Query(0, ge=0, le=settings.CHANGES_MAX_WAIT),
+        async_db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Changes of users, groups and schools after the `since` cursor.
+
+    Pass the returned `cursor` as `since` to continue. With `wait` the request is
+    held up to that many seconds until a change arrives (long polling).
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        rows = await change_repo.get_since(async_db, since=since, limit=limit + 1, table_name=table)
+        if rows or time.monotonic() >= deadline:
+            break
+        # End the transaction to see new commits and give the connection back while sleeping
+        await async_db.rollback()
+        await asyncio.sleep(settings.CHANGES_POLL_INTERVAL)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = rows[-1].id if rows else since
+    return {'rows': rows, 'cursor': str(cursor), 'has_more': has_more}
+
+
+@api.get("/changes/stream/", tags=["changes"], name='change-stream')
+@query_budget(None, repeat_threshold=0)
+@single_flight(False)
+@throttle_class(STREAM)
+@batchable(False)
+async def stream_changes(
+        since: Optional[int] = Query(None, ge=0),
+        table: Optional[str] = None,
+        last_event_id: Optional[int] = Header(None, ge=0),
+        async_db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Server-sent events of changes after `since`, or the `Last-Event-ID` header on reconnect.
+
+    The stream ends after `CHANGES_STREAM_MAX_SECONDS`, clients reconnect with the last id.
+    """
+    cursor = last_event_id if last_event_id is not None else since or 0
+
+    async def events() -> AsyncIterator[bytes]:
+        nonlocal cursor
+        started_at = last_sent_at = time.monotonic()
+        while time.monotonic() - started_at < settings.CHANGES_STREAM_MAX_SECONDS:
+            rows = await change_repo.get_since(
+                async_db, since=cursor, limit=settings.CHANGES_MAX_LIMIT, table_name=table
+            )
+            await async_db.rollback()
+            if rows:
+                cursor = rows[-1].id
+                last_sent_at = time.monotonic()
+                yield b''.join(format_event(row) for row in rows)
+                if len(rows) == settings.CHANGES_MAX_LIMIT:
+                    continue
+            elif time.monotonic() - last_sent_at >= settings.CHANGES_STREAM_HEARTBEAT:
+                last_sent_at = time.monotonic()
+                yield b': keep-alive\n\n'
+            await asyncio.sleep(settings.CHANGES_POLL_INTERVAL)
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
@@ -0,0 +1,30 @@
+from typing import Optional, List, TYPE_CHECKING
+
+from app.conf.config import settings
+from app.db.outbox import Change, settled_before
+from app.db.repository import CRUDBase
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class CRUDChange(CRUDBase[Change]):
+
+    async def get_since(
+            self, async_db: "AsyncSession", *,
+            since: int,
+            limit: int,
+            table_name: Optional[str] = None,
+    ) -> List[Change]:
+        """
+        Changes after the `since` cursor in feed order, keyset paginated
+        """
+        expressions = [self.model.id > since]
+        if table_name:
+            expressions.append(self.model.table_name == table_name)
+        if settings.CHANGES_SETTLE_SECONDS:
+            expressions.append(self.model.created_at < settled_before())
+        return await self.get_all(async_db, limit=limit, order_by=(self.model.id,), expressions=expressions)
+
+
+change_repo = CRUDChange(Change)
@@ -0,0 +1,13 @@
+from typing import Optional, List
+from datetime import datetime
+
+from app.core.schema import VisibleBase
+
+
+class ChangeVisible(VisibleBase):
+    id: int
+    table_name: str
+    object_id: int
+    op: str
+    fields: Optional[List[str]] = None
+    created_at: datetime
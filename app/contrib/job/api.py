@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+
+from app.core.query_budget import query_budget
+from app.routers.dependency import get_async_db
+from app.routers.route import ServiceRoute
+from .models import Job
+from .schema import JobVisible
+from .repository import job_repo
+
+api = APIRouter(route_class=ServiceRoute)
+
+
+@api.get("/jobs/{obj_id}/", tags=["jobs"], name='job-detail', response_model=JobVisible)
+@query_budget(1)
+async def get_single_job(
+        obj_id: int,
+        async_db: AsyncSession = Depends(get_async_db),
+):
+    # Status polling doesn't need the rows
+    return await job_repo.get(async_db=async_db, obj_id=obj_id, options=(defer(Job.payload),))
@@ -0,0 +1,150 @@
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, TYPE_CHECKING
+
+from sqlalchemy import select, update, and_, or_, func, literal_column
+
+from app.conf.config import settings
+from app.utils.import_utils import import_from_string
+
+from .models import Job, JobStatus
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def _seconds_from_now(seconds: int):
+    return func.timestampadd(literal_column('SECOND'), seconds, func.now())
+
+
+class JobBackend:
+    """
+    Job queue storage.
+
+    Every method runs on the session of the database the job belongs to.
+    `save_progress` must commit the pending writes of the processed chunk
+    together with the progress, so a job resumed after a crash never applies
+    a chunk twice.
+    """
+
+    async def enqueue(self, async_db: "AsyncSession", *, kind: str, payload: dict, total: int) -> Job:
+        raise NotImplementedError('subclasses of JobBackend must provide an enqueue() method')
+
+    async def claim(self, async_db: "AsyncSession", worker_id: str) -> Optional[Job]:
+        """
+        Lock the next runnable job for `worker_id`, None when the queue is empty
+        """
+        raise NotImplementedError('subclasses of JobBackend must provide a claim() method')
+
+    async def save_progress(
+            self, async_db: "AsyncSession", job: Job, *,
+            processed: int, succeeded: int, failed: int, errors: List[Dict[str, Any]],
+    ) -> None:
+        raise NotImplementedError('subclasses of JobBackend must provide a save_progress() method')
+
+    async def finish(self, async_db: "AsyncSession", job: Job, *, status: str, error: Optional[str] = None) -> None:
+        raise NotImplementedError('subclasses of JobBackend must provide a finish() method')
+
+    async def release(self, async_db: "AsyncSession", job: Job, *, delay: int = 0, error: Optional[str] = None) -> None:
+        """
+        Put a claimed job back into the queue, to be resumed after `delay` seconds
+        """
+        raise NotImplementedError('subclasses of JobBackend must provide a release() method')
+
+
+class DatabaseJobBackend(JobBackend):
+    """
+    Jobs kept in the `jobs` table of each tenant database, no outside service required.
+
+    Workers claim jobs with `SELECT ... FOR UPDATE SKIP LOCKED`, so any number
+    of them can poll the same database.
+    """
+
+    async def enqueue(self, async_db: "AsyncSession", *, kind: str, payload: dict, total: int) -> Job:
+        job = Job(kind=kind, payload=payload, total=total, status=JobStatus.PENDING.value)
+        async_db.add(job)
+        await async_db.commit()
+        await async_db.refresh(job)
+        return job
+
+    async def claim(self, async_db: "AsyncSession", worker_id: str) -> Optional[Job]:
+        """
+        Running jobs whose lock went stale lost their worker and count as a failed attempt,
+        they are resumed until `JOB_MAX_ATTEMPTS` attempts and failed after that
+        """
+        model = Job
+        stale = and_(
+            model.status == JobStatus.RUNNING.value,
+            model.locked_at < _seconds_from_now(-settings.JOB_LOCK_TIMEOUT),
+        )
+        await async_db.execute(
+            update(model).where(stale, model.attempts >= settings.JOB_MAX_ATTEMPTS).values(
+                status=JobStatus.FAILED.value,
+                error='Worker lost, out of attempts',
+                locked_by=None,
+                locked_at=None,
+                finished_at=func.now(),
+            ).execution_options(synchronize_session=False)
+        )
+        runnable = or_(
+            and_(model.status == JobStatus.PENDING.value, model.run_after <= func.now()),
+            and_(stale, model.attempts < settings.JOB_MAX_ATTEMPTS),
+        )
+        stmt = select(model).where(runnable).order_by(model.id).limit(1).with_for_update(skip_locked=True)
+        job = (await async_db.execute(stmt)).scalars().first()
+        if job is None:
+            await async_db.commit()
+            return None
+        await async_db.execute(
+            update(model).where(model.id == job.id).values(
+                status=JobStatus.RUNNING.value,
+                locked_by=worker_id,
+                locked_at=func.now(),
+                attempts=model.attempts + 1,
+            ).execution_options(synchronize_session=False)
+        )
+        await async_db.commit()
+        return job
+
+    async def save_progress(
+            self, async_db: "AsyncSession", job: Job, *,
+            processed: int, succeeded: int, failed: int, errors: List[Dict[str, Any]],
+    ) -> None:
+        await async_db.execute(
+            update(Job).where(Job.id == job.id).values(
+                processed=processed,
+                succeeded=succeeded,
+                failed=failed,
+                errors=errors or None,
+                locked_at=func.now(),
+            ).execution_options(synchronize_session=False)
+        )
+        await async_db.commit()
+
+    async def finish(self, async_db: "AsyncSession", job: Job, *, status: str, error: Optional[str] = None) -> None:
+        await async_db.execute(
+            update(Job).where(Job.id == job.id).values(
+                status=status,
+                error=error,
+                locked_by=None,
+                locked_at=None,
+                finished_at=func.now(),
+            ).execution_options(synchronize_session=False)
+        )
+        await async_db.commit()
+
+    async def release(self, async_db: "AsyncSession", job: Job, *, delay: int = 0, error: Optional[str] = None) -> None:
+        await async_db.execute(
+            update(Job).where(Job.id == job.id).values(
+                status=JobStatus.PENDING.value,
+                error=error,
+                locked_by=None,
+                locked_at=None,
+                run_after=_seconds_from_now(delay),
+            ).execution_options(synchronize_session=False)
+        )
+        await async_db.commit()
+
+
+@lru_cache
+def get_job_backend() -> JobBackend:
+    return import_from_string(settings.JOB_BACKEND, 'JOB_BACKEND')()
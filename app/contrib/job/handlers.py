@@ -0,0 +1,119 @@
+from importlib import import_module
+from typing import Callable, Awaitable, Dict, List, AsyncIterator, TYPE_CHECKING
+
+import sqlalchemy as sa
+from pydantic import ValidationError
+from sqlalchemy import select
+
+from app.conf.config import settings
+from app.utils.stream_parsers import ParsedRow
+
+from .backends import get_job_backend
+from .models import Job
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+JobHandler = Callable[["AsyncSession", List[dict]], Awaitable[Dict[int, str]]]
+
+_handlers: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """
+    Register a handler processing the rows of `kind` jobs.
+
+    The handler gets one chunk of rows at a time and returns the errors of the
+    rows it skipped, keyed by their index in the chunk. It must not commit, the
+    worker commits the chunk together with the job progress.
+    """
+
+    def decorator(func: JobHandler) -> JobHandler:
+        if kind in _handlers and _handlers[kind] is not func:
+            raise ValueError(f'Job handler for `{kind}` is already registered')
+        func.job_kind = kind
+        _handlers[kind] = func
+        return func
+
+    return decorator
+
+
+def get_job_handler(kind: str) -> JobHandler:
+    return _handlers[kind]
+
+
+def load_job_modules() -> None:
+    for module in settings.JOB_MODULES:
+        import_module(module)
+
+
+def format_validation_error(error: ValidationError) -> str:
+    return '; '.join(f"{'.'.join(str(i) for i in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+async def enqueue_job(async_db: "AsyncSession", handler: JobHandler, rows: List[dict], **options) -> Job:
+    """
+    Queue `rows` for `handler`, extra `options` are stored with the job payload
+    """
+    return await get_job_backend().enqueue(
+        async_db, kind=handler.job_kind, payload={**options, 'rows': rows}, total=len(rows),
+    )
+
+
+async def enqueue_all(async_db: "AsyncSession", handler: JobHandler, table: sa.Table) -> List[Job]:
+    """
+    Queue `handler` over the ids of every row of `table`, as `{'id': ...}` rows, `JOB_MAX_ROWS` per job
+    """
+    jobs = []
+    last_id = 0
+    while True:
+        result = await async_db.execute(
+            select(table.c.id).where(table.c.id > last_id).order_by(table.c.id).limit(settings.JOB_MAX_ROWS)
+        )
+        ids = result.scalars().all()
+        if not ids:
+            return jobs
+        jobs.append(await enqueue_job(async_db, handler, [{'id': obj_id} for obj_id in ids]))
+        last_id = ids[-1]
+
+
+async def import_rows(async_db: "AsyncSession", handler: JobHandler, rows: AsyncIterator[ParsedRow]) -> dict:
+    """
+    Run `handler` inline over a stream of parsed rows, committing every `JOB_CHUNK_SIZE` rows.
+
+    Only one chunk is held in memory. Returns the counts and the errors of the
+    rejected rows, keyed by the row index in the stream, up to `JOB_MAX_ERRORS`.
+    """
+    report = {'total': 0, 'succeeded': 0, 'failed': 0, 'errors': []}
+    chunk = []
+    chunk_indexes = []
+
+    def add_error(index: int, detail: str) -> None:
+        report['failed'] += 1
+        if len(report['errors']) < settings.JOB_MAX_ERRORS:
+            report['errors'].append({'row': index, 'detail': detail})
+
+    async def flush() -> None:
+        chunk_errors = await handler(async_db, chunk)
+        await async_db.commit()
+        for i, detail in chunk_errors.items():
+            add_error(chunk_indexes[i], detail)
+        report['succeeded'] += len(chunk) - len(chunk_errors)
+        chunk.clear()
+        chunk_indexes.clear()
+
+    async for row, error in rows:
+        index = report['total']
+        report['total'] += 1
+        if error is not None:
+            add_error(index, error)
+            continue
+        chunk.append(row)
+        chunk_indexes.append(index)
+        if len(chunk) >= settings.JOB_CHUNK_SIZE:
+            await flush()
+    if chunk:
+        await flush()
+
+    report['errors'].sort(key=lambda e: e['row'])
+    return report
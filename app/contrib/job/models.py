@@ -0,0 +1,40 @@
+from datetime import datetime
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import mapped_column, Mapped
+from sqlalchemy.sql import func
+
+from app.core.enums import TextChoices
+from app.db.models import CreationModificationDateBase
+
+
+class JobStatus(TextChoices):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+
+class Job(CreationModificationDateBase):
+    __tablename__ = 'jobs'
+    kind: Mapped[str] = mapped_column(sa.String(100), nullable=False)
+    status: Mapped[str] = mapped_column(sa.String(20), default=JobStatus.PENDING.value, nullable=False)
+    payload: Mapped[Optional[dict]] = mapped_column(sa.JSON, nullable=True)
+
+    total: Mapped[int] = mapped_column(sa.Integer, default=0)
+    processed: Mapped[int] = mapped_column(sa.Integer, default=0)
+    succeeded: Mapped[int] = mapped_column(sa.Integer, default=0)
+    failed: Mapped[int] = mapped_column(sa.Integer, default=0)
+    errors: Mapped[Optional[list]] = mapped_column(sa.JSON, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(sa.Text, nullable=True)
+
+    attempts: Mapped[int] = mapped_column(sa.Integer, default=0)
+    run_after: Mapped[datetime] = mapped_column(sa.DateTime(timezone=True), server_default=func.now())
+    locked_by: Mapped[Optional[str]] = mapped_column(sa.String(100), nullable=True)
+    locked_at: Mapped[Optional[datetime]] = mapped_column(sa.DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(sa.DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        sa.Index('ix_jobs_status_run_after', 'status', 'run_after'),
+    )
@@ -0,0 +1,113 @@
+from collections import defaultdict
+from typing import Dict, List, Iterator, Optional, TYPE_CHECKING
+
+import sqlalchemy as sa
+from sqlalchemy import select, delete, func, literal_column
+
+from app.conf.config import settings
+from app.db.counters import relation_counters, counters_by_key, recount_stmts
+from app.db.models import metadata
+
+from .handlers import job_handler, enqueue_job
+from .models import Job
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def soft_delete_tables() -> List[sa.Table]:
+    return [table for table in metadata.sorted_tables if 'deleted_at' in table.c]
+
+
+def referencing_columns(table: sa.Table) -> Iterator[sa.Column]:
+    """
+    Foreign key columns of other tables pointing at `table`
+    """
+    for other in metadata.sorted_tables:
+        for foreign_key in other.foreign_keys:
+            if foreign_key.column.table is table:
+                yield foreign_key.parent
+
+
+@job_handler('soft-delete.purge')
+async def purge_deleted(async_db: "AsyncSession", rows: List[dict]) -> Dict[int, str]:
+    """
+    Hard delete soft deleted rows, given as `{'table': ..., 'id': ...}`.
+
+    Rows referencing them are deleted first, `SOFT_DELETE_PURGE_BATCH` at a time
+    with a commit after each full batch, so that cascades of large schools or
+    groups never lock many rows at once. Relation rows counted on other rows are
+    read before they are deleted and those counters recounted in the same batch.
+    Purging is idempotent, a chunk cut off half way is purged again from the start.
+    """
+    errors = {}
+    obj_ids = defaultdict(list)
+    for index, row in enumerate(rows):
+        table = metadata.tables.get(row.get('table'))
+        if table is None or 'deleted_at' not in table.c:
+            errors[index] = f"Table `{row.get('table')}` has no soft delete"
+            continue
+        obj_ids[table].append(row['id'])
+
+    batch_size = settings.SOFT_DELETE_PURGE_BATCH
+    for table, ids in obj_ids.items():
+        for column in referencing_columns(table):
+            # Counters on the purged rows themselves are gone with them
+            counters = counters_by_key(relation_counters.get(column.table, ()), skip=column.key)
+            if counters:
+                await purge_counted(async_db, column, ids, counters)
+                continue
+            stmt = delete(column.table).where(column.in_(ids)).with_dialect_options(mysql_limit=batch_size)
+            while (await async_db.execute(stmt)).rowcount >= batch_size:
+                await async_db.commit()
+        await async_db.execute(delete(table).where(table.c.id.in_(ids), table.c.deleted_at.is_not(None)))
+    return errors
+
+
+async def purge_counted(
+        async_db: "AsyncSession", column: sa.Column, ids: List[int], counters: Dict[str, list],
+) -> None:
+    """
+    Delete the relation rows whose `column` is in `ids` in batches, recounting the `counters`,
+    grouped by foreign key, of the rows each batch deleted
+    """
+    relation = column.table
+    batch_size = settings.SOFT_DELETE_PURGE_BATCH
+    stmt = (
+        select(relation.c.id, *(relation.c[key] for key in counters))
+        .where(column.in_(ids))
+        .order_by(relation.c.id)
+        .limit(batch_size)
+    )
+    while True:
+        batch = (await async_db.execute(stmt)).all()
+        if not batch:
+            return
+        await async_db.execute(delete(relation).where(relation.c.id.in_([row.id for row in batch])))
+        for key, key_counters in counters.items():
+            target_ids = sorted({getattr(row, key) for row in batch})
+            for recount in recount_stmts(key_counters, relation, target_ids):
+                await async_db.execute(recount)
+        if len(batch) < batch_size:
+            return
+        await async_db.commit()
+
+
+async def enqueue_purge(async_db: "AsyncSession") -> Optional[Job]:
+    """
+    Queue the purge of rows soft deleted more than `SOFT_DELETE_RETENTION` seconds ago,
+    at most `JOB_MAX_ROWS` of them. None when there is nothing to purge.
+    """
+    cutoff = func.timestampadd(literal_column('SECOND'), -settings.SOFT_DELETE_RETENTION, func.now())
+    rows = []
+    for table in soft_delete_tables():
+        limit = settings.JOB_MAX_ROWS - len(rows)
+        if limit <= 0:
+            break
+        result = await async_db.execute(
+            select(table.c.id).where(table.c.deleted_at < cutoff).order_by(table.c.id).limit(limit)
+        )
+        rows.extend({'table': table.name, 'id': obj_id} for obj_id in result.scalars())
+    if not rows:
+        return None
+    return await enqueue_job(async_db, purge_deleted, rows)
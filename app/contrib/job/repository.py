@@ -0,0 +1,10 @@
+from app.db.repository import CRUDBase
+
+from .models import Job
+
+
+class CRUDJob(CRUDBase[Job]):
+    pass
+
+
+job_repo = CRUDJob(Job)
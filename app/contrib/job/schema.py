@@ -0,0 +1,31 @@
+from typing import Optional, List, Dict, Any
+from datetime import datetime
+
+from pydantic import Field
+
+from app.core.schema import VisibleBase
+
+
+class JobVisible(VisibleBase):
+    id: int
+    kind: str
+    status: str
+
+    total: int
+    processed: int
+    succeeded: int
+    failed: int
+    errors: Optional[List[Dict[str, Any]]] = Field(None, examples=[[{"row": 3, "detail": "Name already exists"}]])
+    error: Optional[str] = None
+
+    attempts: int
+    created_at: datetime
+    modified_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class ImportReport(VisibleBase):
+    total: int
+    succeeded: int
+    failed: int
+    errors: List[Dict[str, Any]] = Field([], examples=[[{"row": 3, "detail": "Name already exists"}]])
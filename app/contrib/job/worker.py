@@ -0,0 +1,123 @@
+import asyncio
+import os
+import socket
+from typing import List, Optional
+
+from loguru import logger
+
+from app.conf.config import settings
+from app.db.session import get_async_session
+
+from .backends import JobBackend, get_job_backend
+from .handlers import get_job_handler, load_job_modules
+from .models import Job, JobStatus
+
+
+class JobWorker:
+    """
+    Poll the job tables of `databases` and process jobs chunk by chunk.
+
+    Each chunk is committed together with the job progress, so a job taken over
+    after a crash or a stop resumes at the first unprocessed row.
+    """
+
+    def __init__(
+            self,
+            databases: List[str],
+            concurrency: Optional[int] = None,
+            backend: Optional[JobBackend] = None,
+    ):
+        self.databases = databases
+        self.concurrency = concurrency or settings.JOB_WORKER_CONCURRENCY
+        self.backend = backend or get_job_backend()
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.sessions = {}
+        self._stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        logger.info("Job worker {worker_id} stopping", worker_id=self.worker_id)
+        self._stopping.set()
+
+    async def run(self) -> None:
+        load_job_modules()
+        self.sessions = {database: get_async_session(database) for database in self.databases}
+        logger.info(
+            "Job worker {worker_id} polling {databases}", worker_id=self.worker_id, databases=self.databases
+        )
+        try:
+            await asyncio.gather(*[self._poll() for _ in range(self.concurrency)])
+        finally:
+            for _, async_engine in self.sessions.values():
+                await async_engine.dispose()
+
+    async def _poll(self) -> None:
+        while not self._stopping.is_set():
+            found = False
+            for database in self.databases:
+                if self._stopping.is_set():
+                    return
+                found = await self.run_once(database) or found
+            if not found:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run_once(self, database: str) -> bool:
+        """
+        Claim and process one job of `database`, return False when there was none
+        """
+        async_session_local, _ = self.sessions[database]
+        try:
+            async with async_session_local() as async_db:
+                job = await self.backend.claim(async_db, self.worker_id)
+                if job is None:
+                    return False
+                await self.process(async_db, job)
+        except Exception:
+            logger.exception("Job worker failed to poll {database}", database=database)
+            return False
+        return True
+
+    async def process(self, async_db, job: Job) -> None:
+        logger.info("Job {job_id} {kind} started", job_id=job.id, kind=job.kind)
+        try:
+            handler = get_job_handler(job.kind)
+        except KeyError:
+            await self.backend.finish(async_db, job, status=JobStatus.FAILED.value, error=f'Unknown job `{job.kind}`')
+            return
+
+        rows = (job.payload or {}).get('rows') or []
+        processed, succeeded, failed = job.processed, job.succeeded, job.failed
+        errors = list(job.errors or [])
+        try:
+            while processed < len(rows):
+                if self._stopping.is_set():
+                    await self.backend.release(async_db, job)
+                    return
+                chunk = rows[processed:processed + settings.JOB_CHUNK_SIZE]
+                chunk_errors = await handler(async_db, chunk)
+                for index, detail in sorted(chunk_errors.items()):
+                    if len(errors) < settings.JOB_MAX_ERRORS:
+                        errors.append({'row': processed + index, 'detail': detail})
+                processed += len(chunk)
+                failed += len(chunk_errors)
+                succeeded += len(chunk) - len(chunk_errors)
+                await self.backend.save_progress(
+                    async_db, job, processed=processed, succeeded=succeeded, failed=failed, errors=errors,
+                )
+        except Exception as e:
+            await async_db.rollback()
+            attempt = job.attempts + 1
+            logger.exception("Job {job_id} failed, attempt {attempt}", job_id=job.id, attempt=attempt)
+            if attempt < settings.JOB_MAX_ATTEMPTS:
+                await self.backend.release(async_db, job, delay=settings.JOB_RETRY_DELAY * attempt, error=str(e))
+            else:
+                await self.backend.finish(async_db, job, status=JobStatus.FAILED.value, error=str(e))
+            return
+
+        await self.backend.finish(async_db, job, status=JobStatus.SUCCEEDED.value)
+        logger.info(
+            "Job {job_id} finished, {succeeded} succeeded, {failed} failed",
+            job_id=job.id, succeeded=succeeded, failed=failed,
+        )
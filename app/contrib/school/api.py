@@ -1,40 +1,101 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.exceptions import RequestValidationError
 from pydantic_core import ErrorDetails
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
-from app.core.schema import IResponseBase, IPaginationDataBase, CommonsModel
-from app.routers.dependency import get_async_db, get_commons
+from app.conf.config import settings
+from app.contrib.job.handlers import enqueue_job, import_rows
+from app.contrib.job.schema import JobVisible, ImportReport
+from app.core.batch import batchable
+from app.core.query_budget import query_budget
+from app.core.schema import (
+    IResponseBase, IPaginationDataBase, ISyncPageBase, IBatchBase, CommonsModel, SyncParams, BatchIds,
+)
+from app.core.throttling import throttle_class, READ, WRITE
+from app.db.repository import gather_reads, raise_dead_parents
+from app.routers.dependency import (
+    get_async_db, get_commons, get_sync_params, encode_sync_cursor, get_batch_ids, batch_page,
+)
+from app.routers.route import ServiceRoute
+from app.utils.stream_parsers import iter_upload_rows, UPLOAD_REQUEST_BODY
+from app.utils.stream_writers import stream_rows, NDJSON_RESPONSE
 from .schema import (
-    SchoolBase, SchoolVisible, SchoolCreate,
+    SchoolBase, SchoolVisible, SchoolCreate, SchoolNearbyVisible,
 
-    UserToSchoolBase, UserToSchoolCreate, UserToSchoolVisible
+    UserToSchoolBase, UserToSchoolCreate, UserToSchoolVisible, UserToSchoolBulkCreate
 )
+from .jobs import bulk_create_schools, bulk_create_user_to_school
 from .repository import school_repo, user_to_school_repo
 
-api = APIRouter()
+api = APIRouter(route_class=ServiceRoute)
 
 
-@api.get('/', name='school-list', response_model=IPaginationDataBase[SchoolVisible])
+@api.get('/', name='school-list', response_model=IPaginationDataBase[SchoolVisible], responses=NDJSON_RESPONSE)
+@query_budget(2)
 async def get_user_list(
         async_db: AsyncSession = Depends(get_async_db),
         commons: CommonsModel = Depends(get_commons),
 
 ) -> dict:
-    obj_list = await school_repo.get_all(async_db=async_db, offset=commons.offset, limit=commons.limit)
-    count = await school_repo.count(async_db=async_db)
+    stmt = school_repo.get_all_stmt(offset=commons.offset, limit=commons.limit, order_by=commons.sort)
+    if commons.stream:
+        return stream_rows(async_db, stmt, SchoolVisible)
+    rows, count = await gather_reads(async_db, stmt, school_repo.count_stmt())
     return {
 
         'page': commons.page,
         'limit': commons.limit,
-        'rows': obj_list,
-        'count': count,
+        'rows': rows.scalars().all(),
+        'count': count.scalar_one(),
     }
 
 
+@api.get('/sync/', name='school-sync', response_model=ISyncPageBase[SchoolVisible])
+@query_budget(2)
+async def school_sync(
+        async_db: AsyncSession = Depends(get_async_db),
+        params: SyncParams = Depends(get_sync_params),
+) -> dict:
+    """
+    Rows created or changed since `updated_since`, oldest change first, and the ids deleted meanwhile.
+
+    Pass the returned `cursor` to get the next page, and to the next sync once `has_more` is false.
+    """
+    rows, deleted, has_more = await school_repo.get_modified_since(
+        async_db, after=(params.modified_at, params.id), limit=params.limit
+    )
+    last = (rows[-1].modified_at, rows[-1].id) if rows else (params.modified_at, params.id)
+    return {
+        'rows': rows,
+        'deleted': deleted,
+        'cursor': encode_sync_cursor(*last),
+        'has_more': has_more,
+    }
+
+
+@api.get('/nearby/', name='school-nearby', response_model=List[SchoolNearbyVisible])
+@query_budget(1)
+async def get_nearby_schools(
+        lat: float = Query(..., ge=-90, le=90),
+        lon: float = Query(..., ge=-180, le=180),
+        radius_km: float = Query(..., gt=0, le=settings.NEARBY_MAX_RADIUS_KM),
+        limit: int = Query(settings.PAGINATION_MAX_SIZE, ge=1, le=settings.PAGINATION_HARD_MAX),
+        async_db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Schools within `radius_km` of the `lat`, `lon` point, nearest first
+    """
+    return await school_repo.get_nearby(
+        async_db, latitude=lat, longitude=lon, radius_km=radius_km, limit=limit
+    )
+
+
 @api.post("/school/create/", tags=["schools"], name='school-create', response_model=IResponseBase[SchoolVisible], status_code=201)
+@query_budget(4)
 async def create_school(
         obj_in: SchoolCreate,
         async_db: AsyncSession = Depends(get_async_db),
@@ -58,7 +119,50 @@ async def create_school(
     }
 
 
+@api.post("/school/import/", tags=["schools"], name='school-import', response_model=IResponseBase[ImportReport],
+          openapi_extra={'requestBody': UPLOAD_REQUEST_BODY})
+@query_budget(None, repeat_threshold=0)
+@batchable(False)
+async def import_schools(
+        request: Request,
+        async_db: AsyncSession = Depends(get_async_db),
+) -> dict:
+    report = await import_rows(async_db, bulk_create_schools, iter_upload_rows(request))
+    return {
+        "message": "Schools imported",
+        "data": report
+    }
+
+
+@api.get("/batch/", name='school-batch', response_model=IBatchBase[SchoolVisible])
+@query_budget(2)
+async def get_school_batch(
+        batch: BatchIds = Depends(get_batch_ids),
+        async_db: AsyncSession = Depends(get_async_db),
+) -> dict:
+    """
+    Schools of `ids` in the same order, null and listed in `missing` when they do not exist
+    """
+    rows = await school_repo.get_many(async_db, batch.ids)
+    return batch_page(batch.ids, rows)
+
+
+@api.post("/batch/", name='school-batch-post', response_model=IBatchBase[SchoolVisible])
+@query_budget(2)
+@throttle_class(READ)
+async def post_school_batch(
+        batch: BatchIds,
+        async_db: AsyncSession = Depends(get_async_db),
+) -> dict:
+    """
+    Same as the GET, for id lists too long for a URL
+    """
+    rows = await school_repo.get_many(async_db, batch.ids)
+    return batch_page(batch.ids, rows)
+
+
 @api.get("/school/{obj_id}/detail/", tags=["schools"], name='school-detail', response_model=SchoolVisible)
+@query_budget(1)
 async def get_single_school(
         obj_id: int,
         async_db: AsyncSession = Depends(get_async_db),
@@ -69,6 +173,7 @@ async def get_single_school(
 
 @api.patch("/school/{obj_id}/update/", tags=["schools"], name='school-update',
            response_model=IResponseBase[SchoolVisible])
+@query_budget(5)
 async def update_school(
         obj_id: int,
         obj_in: SchoolBase,
@@ -106,6 +211,8 @@ async def update_school(
 
 @api.get('/school/{obj_id}/delete/', tags=["schools"], name='school-delete',
          response_model=IResponseBase[SchoolVisible])
+@query_budget(4)
+@throttle_class(WRITE)
 async def delete_school(
 
         obj_id: int,
@@ -124,30 +231,36 @@ async def delete_school(
 
 
 @api.get('/user-to-school/', tags=['users', 'schools'], name='user-to-school-list',
-         response_model=IPaginationDataBase[UserToSchoolVisible])
+         response_model=IPaginationDataBase[UserToSchoolVisible], responses=NDJSON_RESPONSE)
+@query_budget(2)
 async def user_to_school_list(
 
         async_db: AsyncSession = Depends(get_async_db),
         commons: CommonsModel = Depends(get_commons),
 ) -> dict:
-    obj_list = await user_to_school_repo.get_all(async_db=async_db, offset=commons.offset, limit=commons.limit)
-    count = await user_to_school_repo.count(async_db=async_db)
+    stmt = user_to_school_repo.get_all_stmt(offset=commons.offset, limit=commons.limit, order_by=commons.sort)
+    if commons.stream:
+        return stream_rows(async_db, stmt, UserToSchoolVisible)
+    rows, count = await gather_reads(async_db, stmt, user_to_school_repo.count_stmt())
     return {
 
         'page': commons.page,
         'limit': commons.limit,
-        'rows': obj_list,
-        'count': count,
+        'rows': rows.scalars().all(),
+        'count': count.scalar_one(),
     }
 
 
 @api.post("/user-to-group/create/", tags=['users', 'schools'], name='user-to-school-create',
           response_model=IResponseBase[UserToSchoolVisible], status_code=201)
+@query_budget(5)
 async def create_user_to_school(
         obj_in: UserToSchoolCreate,
         async_db: AsyncSession = Depends(get_async_db),
 
 ) -> dict:
+    obj_data = obj_in.model_dump()
+    raise_dead_parents(await user_to_school_repo.dead_parents(async_db, obj_data), obj_data)
     is_exists = await user_to_school_repo.exists(
         async_db=async_db,
         params={'user_id': obj_in.user_id, "school_id": obj_in.school_id}
@@ -162,15 +275,31 @@ async def create_user_to_school(
                 input=obj_in.user_id
             )]
         )
-    result = await user_to_school_repo.create(async_db=async_db, obj_in=obj_in.model_dump())
+    result = await user_to_school_repo.create(async_db=async_db, obj_in=obj_data)
     return {
         "message": "User to school relation created",
         "data": result
     }
 
 
+@api.post("/user-to-school/bulk-create/", tags=['users', 'schools'], name='user-to-school-bulk-create',
+          response_model=IResponseBase[JobVisible], status_code=202)
+@query_budget(2)
+async def bulk_create_user_to_school_relations(
+        obj_in: UserToSchoolBulkCreate,
+        async_db: AsyncSession = Depends(get_async_db),
+) -> dict:
+    rows = [row.model_dump(mode='json') for row in obj_in.rows]
+    job = await enqueue_job(async_db, bulk_create_user_to_school, rows)
+    return {
+        "message": "User to school relations queued for creation",
+        "data": job
+    }
+
+
 @api.get("/user-to-school/{obj_id}/detail/", tags=['users', 'schools'], name='user-to-school-detail',
          response_model=UserToSchoolVisible)
+@query_budget(1)
 async def get_single_user_to_school(
         obj_id: int,
         async_db: AsyncSession = Depends(get_async_db),
@@ -181,6 +310,8 @@ async def get_single_user_to_school(
 
 @api.get("/user-to-school/{obj_id}/update/", tags=['users', 'schools'], name='user-to-school-update',
          response_model=UserToSchoolVisible)
+@query_budget(4)
+@throttle_class(WRITE)
 async def update_user_to_school(
         obj_id: int,
         obj_in: UserToSchoolBase,
@@ -199,6 +330,8 @@ async def update_user_to_school(
 
 @api.get('/user-to-school/{obj_id}/delete/', tags=["users", "schools"], name='user-to-school-delete',
          response_model=IResponseBase[UserToSchoolVisible])
+@query_budget(3)
+@throttle_class(WRITE)
 async def delete_user_to_school(
 
         obj_id: int,
@@ -0,0 +1,98 @@
+from typing import Dict, List, TYPE_CHECKING
+
+from pydantic import ValidationError
+from sqlalchemy import select, tuple_
+
+from app.contrib.job.handlers import job_handler, format_validation_error
+from app.db.repository import dead_parent_message
+
+from .models import School, UserToSchool
+from .repository import school_repo, user_to_school_repo
+from .schema import SchoolCreate, UserToSchoolCreate
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+@job_handler('school.bulk-create')
+async def bulk_create_schools(async_db: "AsyncSession", rows: List[dict]) -> Dict[int, str]:
+    errors = {}
+    objs_in = {}
+    for index, row in enumerate(rows):
+        try:
+            objs_in[index] = SchoolCreate.model_validate(row).model_dump()
+        except ValidationError as e:
+            errors[index] = format_validation_error(e)
+
+    names = {obj_in['name'] for obj_in in objs_in.values()}
+    existing = set()
+    if names:
+        result = await async_db.execute(
+            select(School.name).where(School.name.in_(names), *school_repo.live_expressions())
+        )
+        existing = set(result.scalars())
+
+    to_create = {}
+    for index, obj_in in objs_in.items():
+        if obj_in['name'] in existing:
+            errors[index] = 'School with this name already exists'
+            continue
+        existing.add(obj_in['name'])
+        to_create[index] = obj_in
+
+    indexes = list(to_create)
+    insert_errors = await school_repo.bulk_create(
+        async_db, objs_in=list(to_create.values()), unique_fields=('name',)
+    )
+    errors.update({indexes[i]: detail for i, detail in insert_errors.items()})
+    return errors
+
+
+@job_handler('user-to-school.bulk-create')
+async def bulk_create_user_to_school(async_db: "AsyncSession", rows: List[dict]) -> Dict[int, str]:
+    errors = {}
+    objs_in = {}
+    for index, row in enumerate(rows):
+        try:
+            objs_in[index] = UserToSchoolCreate.model_validate(row).model_dump()
+        except ValidationError as e:
+            errors[index] = format_validation_error(e)
+
+    pairs = {(obj_in['user_id'], obj_in['school_id']) for obj_in in objs_in.values()}
+    existing = set()
+    if pairs:
+        model = UserToSchool
+        result = await async_db.execute(
+            select(model.user_id, model.school_id).where(tuple_(model.user_id, model.school_id).in_(pairs))
+        )
+        existing = set(result.tuples())
+    live_ids = await user_to_school_repo.live_parent_ids(async_db, objs_in.values())
+
+    to_create = {}
+    for index, obj_in in objs_in.items():
+        pair = (obj_in['user_id'], obj_in['school_id'])
+        dead = user_to_school_repo.dead_parent_fields(obj_in, live_ids)
+        if dead:
+            errors[index] = ', '.join(dead_parent_message(field) for field in dead)
+            continue
+        if pair in existing:
+            errors[index] = 'User to school relation already exists'
+            continue
+        existing.add(pair)
+        to_create[index] = obj_in
+
+    indexes = list(to_create)
+    insert_errors = await user_to_school_repo.bulk_create(
+        async_db, objs_in=list(to_create.values()), unique_fields=('user_id', 'school_id')
+    )
+    errors.update({indexes[i]: detail for i, detail in insert_errors.items()})
+    return errors
+
+
+@job_handler('school.recount-members')
+async def recount_school_members(async_db: "AsyncSession", rows: List[dict]) -> Dict[int, str]:
+    """
+    Repair the member counters of the schools given as `{'id': ...}`
+    """
+    await user_to_school_repo.recount(async_db, [row['id'] for row in rows])
+    return {}
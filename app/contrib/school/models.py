@@ -3,24 +3,37 @@ from decimal import Decimal
 import sqlalchemy as sa
 from sqlalchemy.orm import mapped_column, Mapped
 
-from app.db.models import CreationModificationDateBase, Base
+from app.db.models import SoftDeleteBase, Base
 
 
-class School(CreationModificationDateBase):
+class School(SoftDeleteBase):
     __tablename__ = 'schools'
-    name: Mapped[str] = mapped_column(sa.String(254), unique=True, index=True, nullable=False)
+    live_unique = (('name',),)
+    name: Mapped[str] = mapped_column(sa.String(254), nullable=False)
     address_line_1: Mapped[Optional[str]] = mapped_column(sa.String(254), default="", nullable=True)
     address_line_2: Mapped[Optional[str]] = mapped_column(sa.String(254), default="", nullable=True)
     pin_code: Mapped[Optional[int]] = mapped_column(sa.Integer(), nullable=True)
     web_site: Mapped[Optional[str]] = mapped_column(sa.String(100), default="", nullable=True)
     latitude: Mapped[Optional[Decimal]] = mapped_column(
-        sa.DECIMAL(precision=18, scale=18, asdecimal=True),
+        sa.DECIMAL(precision=9, scale=6, asdecimal=True),
         nullable=True
     )
     longitude: Mapped[Optional[Decimal]] = mapped_column(
-        sa.DECIMAL(precision=18, scale=18, asdecimal=True),
+        sa.DECIMAL(precision=9, scale=6, asdecimal=True),
         nullable=True
     )
+    # Computed by MySQL so it follows every write of the coordinates, bulk inserts included
+    geohash: Mapped[Optional[str]] = mapped_column(
+        sa.String(12), sa.Computed('ST_GeoHash(longitude, latitude, 12)', persisted=True),
+        nullable=True
+    )
+    # Maintained by `user_to_school_repo`, active members are those with `UserToSchool.is_active`
+    member_count: Mapped[int] = mapped_column(sa.Integer, default=0, server_default='0', nullable=False)
+    active_member_count: Mapped[int] = mapped_column(sa.Integer, default=0, server_default='0', nullable=False)
+
+
+# Nearby searches narrow schools down by geohash prefix, see `CRUDSchool.get_nearby`
+sa.Index('ix_schools_geohash', School.geohash)
 
 
 class UserToSchool(Base):
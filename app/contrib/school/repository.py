@@ -1,14 +1,66 @@
+from typing import Optional, List, TYPE_CHECKING
+
+from sqlalchemy import select, func, or_
+
+from app.db.counters import Counter
 from app.db.repository import CRUDBase
+from app.utils.geohash import bounding_box, cover
 
 from .models import School, UserToSchool
 
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
 
 class CRUDSchool(CRUDBase[School]):
-    pass
+    track_changes = True
+    soft_delete = True
+    sortable_fields = ('name', 'modified_at')
+
+    async def get_nearby(
+            self, async_db: "AsyncSession", *,
+            latitude: float,
+            longitude: float,
+            radius_km: float,
+            limit: Optional[int] = 25,
+    ) -> List[School]:
+        """
+        Schools within `radius_km` of a point, nearest first, with their `distance_km` set.
+
+        The geohash index narrows the search down to the cells covering the circle's bounding
+        box and the latitude range of the box, only those rows get the exact distance computed.
+        """
+        model = self.model
+        distance = func.ST_Distance_Sphere(func.point(model.longitude, model.latitude), func.point(longitude, latitude))
+        min_lat, max_lat, _, _ = bounding_box(latitude, longitude, radius_km)
+        expressions = [
+            *self.live_expressions(),
+            model.latitude.between(min_lat, max_lat),
+            distance <= radius_km * 1000,
+        ]
+        prefixes = cover(latitude, longitude, radius_km)
+        if prefixes:
+            expressions.append(or_(*(model.geohash.like(f'{prefix}%') for prefix in prefixes)))
+        stmt = (
+            select(model, (distance / 1000).label('distance_km'))
+            .where(*expressions)
+            .order_by(distance, model.id)
+            .limit(limit)
+        )
+        rows = []
+        for school, distance_km in await self.read(async_db, stmt):
+            school.distance_km = distance_km
+            rows.append(school)
+        return rows
 
 
 class CRUDUserToSchool(CRUDBase[UserToSchool]):
-    pass
+    live_parents = True
+    sortable_fields = ('user_id', 'school_id')
+    counters = (
+        Counter('school_id', School.member_count),
+        Counter('school_id', School.active_member_count, condition='is_active'),
+    )
 
 
 school_repo = CRUDSchool(School)
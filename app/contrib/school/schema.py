@@ -1,8 +1,9 @@
 from datetime import datetime
-from typing import Optional, Annotated
+from typing import Optional, Annotated, List
 from decimal import Decimal
 from pydantic import Field
 
+from app.conf.config import settings
 from app.core.schema import BaseModel, VisibleBase
 
 
@@ -12,14 +13,12 @@ class SchoolBase(BaseModel):
     address_line_2: Optional[str] = Field(None, max_length=254)
     pin_code: Optional[int] = Field(None, gt=0)
     web_site: Optional[str] = Field(None, max_length=100)
-    latitude: Annotated[Decimal, Field(decimal_places=18, max_digits=18, gt=0)] | None
-    longitude: Annotated[Decimal, Field(decimal_places=18, max_digits=18, gt=0)] | None
-    is_active: bool = Field(alias='is_active')
+    latitude: Annotated[Decimal, Field(decimal_places=6, max_digits=9, ge=-90, le=90)] | None
+    longitude: Annotated[Decimal, Field(decimal_places=6, max_digits=9, ge=-180, le=180)] | None
 
 
 class SchoolCreate(SchoolBase):
     name: str = Field(..., max_length=254)
-    is_active: bool = Field(True, alias='is_active')
 
 
 class SchoolVisible(VisibleBase):
@@ -32,9 +31,14 @@ class SchoolVisible(VisibleBase):
     web_site: Optional[str] = None
     latitude: Optional[Decimal] = None
     longitude: Optional[Decimal] = None
+    member_count: int = 0
+    active_member_count: int = 0
     created_at: datetime
     modified_at: Optional[datetime] = None
-    is_active: bool
+
+
+class SchoolNearbyVisible(SchoolVisible):
+    distance_km: float
 
 
 class UserToSchoolBase(BaseModel):
@@ -53,3 +57,7 @@ class UserToSchoolVisible(VisibleBase):
     user_id: int
     school_id: int
     is_active: bool
+
+
+class UserToSchoolBulkCreate(BaseModel):
+    rows: List[UserToSchoolCreate] = Field(..., min_length=1, max_length=settings.JOB_MAX_ROWS)
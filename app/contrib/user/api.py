@@ -1,41 +1,83 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
 from pydantic_core import ErrorDetails
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
-from app.core.schema import IResponseBase, IPaginationDataBase, CommonsModel
-from app.routers.dependency import get_async_db, get_commons
+from app.contrib.job.handlers import enqueue_job, import_rows
+from app.contrib.job.schema import JobVisible, ImportReport
+from app.core.batch import batchable
+from app.core.query_budget import query_budget
+from app.core.schema import (
+    IResponseBase, IPaginationDataBase, ISyncPageBase, IBatchBase, CommonsModel, SyncParams, BatchIds,
+)
+from app.core.throttling import throttle_class, READ, WRITE
+from app.db.repository import gather_reads, raise_dead_parents
+from app.routers.dependency import (
+    get_async_db, get_commons, get_sync_params, encode_sync_cursor, get_batch_ids, batch_page,
+)
+from app.routers.route import ServiceRoute
+from app.utils.stream_parsers import iter_upload_rows, UPLOAD_REQUEST_BODY
+from app.utils.stream_writers import stream_rows, NDJSON_RESPONSE
+from .jobs import bulk_create_users
 from .schema import (
-    UserVisible, UserBase, UserCreate,
+    UserVisible, UserBase, UserCreate, UserBulkCreate,
     GroupVisible, GroupBase, GroupCreate,
     UserToGroupCreate, UserToGroupVisible,
 )
 from .repository import user_repo, group_repo, user_to_group_repo
 
-api = APIRouter()
+api = APIRouter(route_class=ServiceRoute)
 
 
-@api.get('/user/', tags=["users"], name='user-list', response_model=IPaginationDataBase[UserVisible])
+@api.get('/user/', tags=["users"], name='user-list', response_model=IPaginationDataBase[UserVisible],
+         responses=NDJSON_RESPONSE)
+@query_budget(2)
 async def get_user_list(
         async_db: AsyncSession = Depends(get_async_db),
         commons: CommonsModel = Depends(get_commons),
 
 ) -> dict:
-    obj_list = await user_repo.get_all(async_db=async_db, offset=commons.offset, limit=commons.limit)
-    count = await user_repo.count(async_db=async_db)
+    stmt = user_repo.get_all_stmt(offset=commons.offset, limit=commons.limit, order_by=commons.sort)
+    if commons.stream:
+        return stream_rows(async_db, stmt, UserVisible)
+    rows, count = await gather_reads(async_db, stmt, user_repo.count_stmt())
     return {
 
         'page': commons.page,
         'limit': commons.limit,
-        'rows': obj_list,
-        'count': count,
+        'rows': rows.scalars().all(),
+        'count': count.scalar_one(),
+    }
+
+
+@api.get('/user/sync/', tags=["users"], name='user-sync', response_model=ISyncPageBase[UserVisible])
+@query_budget(2)
+async def user_sync(
+        async_db: AsyncSession = Depends(get_async_db),
+        params: SyncParams = Depends(get_sync_params),
+) -> dict:
+    """
+    Rows created or changed since `updated_since`, oldest change first, and the ids deleted meanwhile.
+
+    Pass the returned `cursor` to get the next page, and to the next sync once `has_more` is false.
+    """
+    rows, deleted, has_more = await user_repo.get_modified_since(
+        async_db, after=(params.modified_at, params.id), limit=params.limit
+    )
+    last = (rows[-1].modified_at, rows[-1].id) if rows else (params.modified_at, params.id)
+    return {
+        'rows': rows,
+        'deleted': deleted,
+        'cursor': encode_sync_cursor(*last),
+        'has_more': has_more,
     }
 
 
 @api.post("/user/create/", tags=["users"], name='user-create', response_model=IResponseBase[UserVisible],
           status_code=201)
+@query_budget(4)
 async def create_user(
         obj_in: UserCreate,
         async_db: AsyncSession = Depends(get_async_db),
@@ -58,7 +100,65 @@ async def create_user(
     }
 
 
+@api.post("/user/bulk-create/", tags=["users"], name='user-bulk-create', response_model=IResponseBase[JobVisible],
+          status_code=202)
+@query_budget(2)
+async def bulk_create_user(
+        obj_in: UserBulkCreate,
+        async_db: AsyncSession = Depends(get_async_db),
+) -> dict:
+    rows = [row.model_dump(mode='json') for row in obj_in.rows]
+    job = await enqueue_job(async_db, bulk_create_users, rows)
+    return {
+        "message": "Users queued for creation",
+        "data": job
+    }
+
+
+@api.post("/user/import/", tags=["users"], name='user-import', response_model=IResponseBase[ImportReport],
+          openapi_extra={'requestBody': UPLOAD_REQUEST_BODY})
+@query_budget(None, repeat_threshold=0)
+@batchable(False)
+async def import_users(
+        request: Request,
+        async_db: AsyncSession = Depends(get_async_db),
+) -> dict:
+    report = await import_rows(async_db, bulk_create_users, iter_upload_rows(request))
+    return {
+        "message": "Users imported",
+        "data": report
+    }
+
+
+@api.get("/user/batch/", tags=["users"], name='user-batch', response_model=IBatchBase[UserVisible])
+@query_budget(2)
+async def get_user_batch(
+        batch: BatchIds = Depends(get_batch_ids),
+        async_db: AsyncSession = Depends(get_async_db),
+) -> dict:
+    """
+    Users of `ids` in the same order, null and listed in `missing` when they do not exist
+    """
+    rows = await user_repo.get_many(async_db, batch.ids)
+    return batch_page(batch.ids, rows)
+
+
+@api.post("/user/batch/", tags=["users"], name='user-batch-post', response_model=IBatchBase[UserVisible])
+@query_budget(2)
+@throttle_class(READ)
+async def post_user_batch(
+        batch: BatchIds,
+        async_db: AsyncSession = Depends(get_async_db),
+) -> dict:
+    """
+    Same as the GET, for id lists too long for a URL
+    """
+    rows = await user_repo.get_many(async_db, batch.ids)
+    return batch_page(batch.ids, rows)
+
+
 @api.get("/user/{obj_id}/detail/", tags=["users"], name='user-detail', response_model=UserVisible)
+@query_budget(1)
 async def get_single_user(
         obj_id: int,
         async_db: AsyncSession = Depends(get_async_db),
@@ -68,6 +168,7 @@ async def get_single_user(
 
 
 @api.patch("/user/{obj_id}/update/", tags=["users"], name='user-update', response_model=IResponseBase[UserVisible])
+@query_budget(5)
 async def update_user(
         obj_id: int,
         obj_in: UserBase,
@@ -104,6 +205,8 @@ async def update_user(
 
 
 @api.get('/user/{obj_id}/delete/', tags=["users"], name='user-delete', response_model=IResponseBase[UserVisible])
+@query_budget(6)
+@throttle_class(WRITE)
 async def delete_user(
 
         obj_id: int,
@@ -121,24 +224,52 @@ async def delete_user(
     return {"message": "User deleted", "data": db_obj}
 
 
-@api.get('/group/', name='group-list', tags=["groups"], response_model=IPaginationDataBase[GroupVisible])
+@api.get('/group/', name='group-list', tags=["groups"], response_model=IPaginationDataBase[GroupVisible],
+         responses=NDJSON_RESPONSE)
+@query_budget(2)
 async def group_list(
         async_db: AsyncSession = Depends(get_async_db),
         commons: CommonsModel = Depends(get_commons),
 
 ) -> dict:
-    obj_list = await group_repo.get_all(async_db=async_db, offset=commons.offset, limit=commons.limit)
-    count = await group_repo.count(async_db=async_db)
+    stmt = group_repo.get_all_stmt(offset=commons.offset, limit=commons.limit, order_by=commons.sort)
+    if commons.stream:
+        return stream_rows(async_db, stmt, GroupVisible)
+    rows, count = await gather_reads(async_db, stmt, group_repo.count_stmt())
     return {
         'page': commons.page,
         'limit': commons.limit,
-        'rows': obj_list,
-        'count': count,
+        'rows': rows.scalars().all(),
+        'count': count.scalar_one(),
+    }
+
+
+@api.get('/group/sync/', tags=["groups"], name='group-sync', response_model=ISyncPageBase[GroupVisible])
+@query_budget(2)
+async def group_sync(
+        async_db: AsyncSession = Depends(get_async_db),
+        params: SyncParams = Depends(get_sync_params),
+) -> dict:
+    """
+    Rows created or changed since `updated_since`, oldest change first, and the ids deleted meanwhile.
+
+    Pass the returned `cursor` to get the next page, and to the next sync once `has_more` is false.
+    """
+    rows, deleted, has_more = await group_repo.get_modified_since(
+        async_db, after=(params.modified_at, params.id), limit=params.limit
+    )
+    last = (rows[-1].modified_at, rows[-1].id) if rows else (params.modified_at, params.id)
+    return {
+        'rows': rows,
+        'deleted': deleted,
+        'cursor': encode_sync_cursor(*last),
+        'has_more': has_more,
     }
 
 
 @api.post('/group/create/', name='group-create', tags=['groups'], response_model=IResponseBase[GroupVisible],
           status_code=201)
+@query_budget(4)
 async def group_create(
         obj_in: GroupCreate,
         async_db: AsyncSession = Depends(get_async_db),
@@ -162,7 +293,35 @@ async def group_create(
     }
 
 
+@api.get("/group/batch/", tags=["groups"], name='group-batch', response_model=IBatchBase[GroupVisible])
+@query_budget(2)
+async def get_group_batch(
+        batch: BatchIds = Depends(get_batch_ids),
+        async_db: AsyncSession = Depends(get_async_db),
+) -> dict:
+    """
+    Groups of `ids` in the same order, null and listed in `missing` when they do not exist
+    """
+    rows = await group_repo.get_many(async_db, batch.ids)
+    return batch_page(batch.ids, rows)
+
+
+@api.post("/group/batch/", tags=["groups"], name='group-batch-post', response_model=IBatchBase[GroupVisible])
+@query_budget(2)
+@throttle_class(READ)
+async def post_group_batch(
+        batch: BatchIds,
+        async_db: AsyncSession = Depends(get_async_db),
+) -> dict:
+    """
+    Same as the GET, for id lists too long for a URL
+    """
+    rows = await group_repo.get_many(async_db, batch.ids)
+    return batch_page(batch.ids, rows)
+
+
 @api.get("/group/{obj_id}/detail/", tags=["groups"], name='group-detail', response_model=GroupVisible)
+@query_budget(1)
 async def get_single_group(
         obj_id: int,
         async_db: AsyncSession = Depends(get_async_db),
@@ -175,6 +334,7 @@ async def get_single_group(
     "/group/{obj_id}/update/", tags=["groups"], name='group-update',
     response_model=IResponseBase[GroupVisible]
 )
+@query_budget(5)
 async def update_group(
         obj_id: int,
         obj_in: GroupBase,
@@ -211,6 +371,8 @@ async def update_group(
 
 
 @api.get('/group/{obj_id}/delete/', tags=["groups"], name='group-delete', response_model=IResponseBase[GroupVisible])
+@query_budget(4)
+@throttle_class(WRITE)
 async def delete_user(
         obj_id: int,
         async_db: AsyncSession = Depends(get_async_db)
@@ -228,30 +390,36 @@ async def delete_user(
 
 
 @api.get('/user-to-group/', tags=['users', 'groups'], name='user-to-group-list',
-         response_model=IPaginationDataBase[UserToGroupVisible])
+         response_model=IPaginationDataBase[UserToGroupVisible], responses=NDJSON_RESPONSE)
+@query_budget(2)
 async def user_to_group_list(
 
         async_db: AsyncSession = Depends(get_async_db),
         commons: CommonsModel = Depends(get_commons),
 ) -> dict:
-    obj_list = await user_to_group_repo.get_all(async_db=async_db, offset=commons.offset, limit=commons.limit)
-    count = await user_to_group_repo.count(async_db=async_db)
+    stmt = user_to_group_repo.get_all_stmt(offset=commons.offset, limit=commons.limit, order_by=commons.sort)
+    if commons.stream:
+        return stream_rows(async_db, stmt, UserToGroupVisible)
+    rows, count = await gather_reads(async_db, stmt, user_to_group_repo.count_stmt())
     return {
 
         'page': commons.page,
         'limit': commons.limit,
-        'rows': obj_list,
-        'count': count,
+        'rows': rows.scalars().all(),
+        'count': count.scalar_one(),
     }
 
 
 @api.post("/user-to-group/create/", tags=['users', 'groups'], name='user-to-group-create',
           response_model=IResponseBase[UserToGroupVisible], status_code=201)
+@query_budget(5)
 async def create_user_to_group(
         obj_in: UserToGroupCreate,
         async_db: AsyncSession = Depends(get_async_db),
 
 ) -> dict:
+    obj_data = obj_in.model_dump()
+    raise_dead_parents(await user_to_group_repo.dead_parents(async_db, obj_data), obj_data)
     is_exists = await user_to_group_repo.exists(
         async_db=async_db,
         params={'user_id': obj_in.user_id, "group_id": obj_in.group_id}
@@ -266,7 +434,7 @@ async def create_user_to_group(
                 input=obj_in.user_id
             )]
         )
-    result = await user_to_group_repo.create(async_db=async_db, obj_in=obj_in.model_dump())
+    result = await user_to_group_repo.create(async_db=async_db, obj_in=obj_data)
     return {
         "message": "User to group relation created",
         "data": result
@@ -275,6 +443,7 @@ async def create_user_to_group(
 
 @api.get("/user-to-group/{obj_id}/detail/", tags=['users', 'groups'], name='user-to-group-detail',
          response_model=UserToGroupVisible)
+@query_budget(1)
 async def get_single_user_to_group(
         obj_id: int,
         async_db: AsyncSession = Depends(get_async_db),
@@ -285,6 +454,8 @@ async def get_single_user_to_group(
 
 @api.get('/user-to-group/{obj_id}/delete/', tags=["users", "groups"], name='user-to-group-delete',
          response_model=IResponseBase[UserToGroupVisible])
+@query_budget(3)
+@throttle_class(WRITE)
 async def delete_user_to_group(
 
         obj_id: int,
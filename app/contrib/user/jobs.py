@@ -0,0 +1,56 @@
+from typing import Dict, List, TYPE_CHECKING
+
+from pydantic import ValidationError
+from sqlalchemy import select
+
+from app.contrib.job.handlers import job_handler, format_validation_error
+
+from .models import User
+from .repository import user_repo, user_to_group_repo
+from .schema import UserCreate
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+@job_handler('user.bulk-create')
+async def bulk_create_users(async_db: "AsyncSession", rows: List[dict]) -> Dict[int, str]:
+    errors = {}
+    objs_in = {}
+    for index, row in enumerate(rows):
+        try:
+            objs_in[index] = UserCreate.model_validate(row).model_dump()
+        except ValidationError as e:
+            errors[index] = format_validation_error(e)
+
+    names = {obj_in['name'] for obj_in in objs_in.values()}
+    existing = set()
+    if names:
+        result = await async_db.execute(
+            select(User.name).where(User.name.in_(names), *user_repo.live_expressions())
+        )
+        existing = set(result.scalars())
+
+    to_create = {}
+    for index, obj_in in objs_in.items():
+        if obj_in['name'] in existing:
+            errors[index] = 'User with this name already exists'
+            continue
+        existing.add(obj_in['name'])
+        to_create[index] = obj_in
+
+    indexes = list(to_create)
+    insert_errors = await user_repo.bulk_create(
+        async_db, objs_in=list(to_create.values()), unique_fields=('name',)
+    )
+    errors.update({indexes[i]: detail for i, detail in insert_errors.items()})
+    return errors
+
+
+@job_handler('group.recount-members')
+async def recount_group_members(async_db: "AsyncSession", rows: List[dict]) -> Dict[int, str]:
+    """
+    Repair the member counters of the groups given as `{'id': ...}`
+    """
+    await user_to_group_repo.recount(async_db, [row['id'] for row in rows])
+    return {}
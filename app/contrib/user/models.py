@@ -4,12 +4,13 @@ from typing import Optional
 import sqlalchemy as sa
 from sqlalchemy.orm import mapped_column, Mapped
 
-from app.db.models import CreationModificationDateBase, Base
+from app.db.models import SoftDeleteBase, Base
 
 
-class User(CreationModificationDateBase):
+class User(SoftDeleteBase):
     __tablename__ = "users"
-    name: Mapped[str] = mapped_column(sa.String(254), unique=True, index=True, nullable=False)
+    live_unique = (('name',),)
+    name: Mapped[str] = mapped_column(sa.String(254), nullable=False)
     first_name: Mapped[Optional[str]] = mapped_column(sa.String(254), default="")
     middle_name: Mapped[Optional[str]] = mapped_column(sa.String(254), default="")
     last_name: Mapped[Optional[str]] = mapped_column(sa.String(254), default="")
@@ -24,9 +25,12 @@ class User(CreationModificationDateBase):
     is_active: Mapped[bool] = mapped_column(sa.Boolean, default=True)
 
 
-class Group(CreationModificationDateBase):
+class Group(SoftDeleteBase):
     __tablename__ = "groups"
-    name: Mapped[str] = mapped_column(sa.String(254), unique=True, nullable=False, index=True)
+    live_unique = (('name',),)
+    name: Mapped[str] = mapped_column(sa.String(254), nullable=False)
+    # Maintained by `user_to_group_repo`
+    member_count: Mapped[int] = mapped_column(sa.Integer, default=0, server_default='0', nullable=False)
 
 
 class UserToGroup(Base):
@@ -1,18 +1,25 @@
+from app.db.counters import Counter
 from app.db.repository import CRUDBase
 
 from .models import User, Group, UserToGroup
 
 
 class CRUDUser(CRUDBase[User]):
-    pass
+    track_changes = True
+    soft_delete = True
+    sortable_fields = ('name', 'modified_at')
 
 
 class CRUDGroup(CRUDBase[Group]):
-    pass
+    track_changes = True
+    soft_delete = True
+    sortable_fields = ('name', 'modified_at')
 
 
 class CRUDUserToGroup(CRUDBase[UserToGroup]):
-    pass
+    live_parents = True
+    sortable_fields = ('user_id', 'group_id')
+    counters = (Counter('group_id', Group.member_count),)
 
 
 user_repo = CRUDUser(User)
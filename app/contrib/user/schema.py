@@ -1,9 +1,10 @@
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime, date
 
-from pydantic import Field, EmailStr
+from pydantic import Field
 
-from app.core.schema import BaseModel, VisibleBase
+from app.conf.config import settings
+from app.core.schema import BaseModel, VisibleBase, EmailStr
 
 
 class UserBase(BaseModel):
@@ -56,6 +57,7 @@ class GroupVisible(VisibleBase):
     id: int
 
     name: str
+    member_count: int = 0
 
     created_at: datetime
     modified_at: Optional[datetime] = None
@@ -71,3 +73,7 @@ class UserToGroupVisible(VisibleBase):
 
     user_id: int
     group_id: int
+
+
+class UserBulkCreate(BaseModel):
+    rows: List[UserCreate] = Field(..., min_length=1, max_length=settings.JOB_MAX_ROWS)
@@ -0,0 +1,41 @@
+from typing import Optional, Callable, TypeVar, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from starlette.requests import HTTPConnection
+
+FuncType = TypeVar("FuncType", bound=Callable)
+
+# Scope key of the `BatchContext` the operations of `POST /batch/` run in
+BATCH_CONTEXT = 'batch_context'
+
+
+class BatchContext:
+    """
+    Shared by the operations of one batch request.
+
+    `audience` was authenticated once by the batch itself, `session` is bound to the
+    batch transaction and runs every commit of an operation as a savepoint release.
+    """
+    __slots__ = ('audience', 'session')
+
+    def __init__(self, audience: str, session: "AsyncSession"):
+        self.audience = audience
+        self.session = session
+
+
+def get_batch_context(connection: "HTTPConnection") -> Optional[BatchContext]:
+    return connection.scope.get(BATCH_CONTEXT)
+
+
+def batchable(enabled: Optional[bool] = True) -> Callable[[FuncType], FuncType]:
+    """
+    Whether an endpoint may run as an operation of a batch, `batchable(False)` for
+    streams, uploads and the batch endpoint itself
+    """
+
+    def decorator(func: FuncType) -> FuncType:
+        func.batchable = enabled
+        return func
+
+    return decorator
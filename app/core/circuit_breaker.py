@@ -0,0 +1,85 @@
+import math
+import time
+from collections import deque
+from typing import Optional, Deque
+
+from app.core.exceptions import HTTPServiceUnavailable
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """
+    Fail fast while a dependency is unhealthy.
+
+    `failure_threshold` failures within `window` seconds open the circuit, requests are
+    then refused with 503 for `reset_timeout` seconds. After that the circuit is half
+    open, `half_open_requests` probe requests at a time get through: a success closes
+    the circuit, a failure opens it again.
+    """
+    __slots__ = ('name', 'failure_threshold', 'window', 'reset_timeout', 'half_open_requests',
+                 'state', '_failures', '_opened_at', '_probes')
+
+    def __init__(
+            self,
+            name: str,
+            failure_threshold: Optional[int] = 5,
+            window: Optional[float] = 30,
+            reset_timeout: Optional[float] = 15,
+            half_open_requests: Optional[int] = 1,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_requests = half_open_requests
+        self.state = CLOSED
+        self._failures: Deque[float] = deque()
+        self._opened_at = 0.0
+        self._probes = 0
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self._opened_at = now
+        self._failures.clear()
+
+    def before_request(self) -> bool:
+        """
+        Raise 503 while the circuit is open, return whether the request is a half open probe
+        """
+        if self.state == CLOSED:
+            return False
+        if self.state == OPEN:
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise HTTPServiceUnavailable(retry_after=math.ceil(remaining), detail=f"{self.name} is unavailable")
+            self.state = HALF_OPEN
+            self._probes = 0
+        if self._probes >= self.half_open_requests:
+            raise HTTPServiceUnavailable(retry_after=1, detail=f"{self.name} is recovering")
+        self._probes += 1
+        return True
+
+    def after_request(self, probe: bool) -> None:
+        if probe and self._probes:
+            self._probes -= 1
+
+    def record_success(self) -> None:
+        if self.state == HALF_OPEN:
+            self.state = CLOSED
+            self._failures.clear()
+
+    def record_failure(self) -> None:
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._open(now)
+            return
+        if self.state == OPEN:
+            return
+        self._failures.append(now)
+        while self._failures and self._failures[0] <= now - self.window:
+            self._failures.popleft()
+        if len(self._failures) >= self.failure_threshold:
+            self._open(now)
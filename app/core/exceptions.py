@@ -1,5 +1,5 @@
 from fastapi import status, HTTPException
-from typing import Any, Optional, Dict
+from typing import Any, Optional, Dict, Tuple
 
 
 class ImproperlyConfigured(Exception):
@@ -7,6 +7,33 @@ class ImproperlyConfigured(Exception):
     pass
 
 
+class InvalidSortField(ValueError):
+    """A list was asked to sort by a field which is not in the repository's `sortable_fields`"""
+
+    def __init__(self, field: str, allowed: Tuple[str, ...]):
+        self.field = field
+        self.allowed = allowed
+        super().__init__(f"Can't sort by `{field}`, sortable fields are: {', '.join(allowed)}")
+
+
+class InvalidToken(ValueError):
+    """A service token is malformed, forged or of the wrong type"""
+    pass
+
+
+class ExpiredSignature(InvalidToken):
+    """A service token is past its expiration"""
+    pass
+
+
+class StatementTimeout(Exception):
+    """A statement outlived its `statement_timeout`"""
+
+    def __init__(self, milliseconds: int):
+        self.milliseconds = milliseconds
+        super().__init__(f"Statement exceeded its time limit of {milliseconds}ms")
+
+
 class HTTPExpiredSignatureError(HTTPException):
     def __init__(
             self,
@@ -68,3 +95,32 @@ class HTTP404(HTTPException):
             detail = "Does not exist"
         super().__init__(status_code=status_code, detail=detail, headers=headers)
 
+
+class HTTPTooManyRequests(HTTPException):
+    def __init__(
+            self,
+            retry_after: Optional[int] = 1,
+            detail: Optional[str] = None,
+            headers: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        if headers is None:
+            headers = {}
+        headers.setdefault("Retry-After", str(retry_after))
+        if detail is None:
+            detail = "Too many requests"
+        super().__init__(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=detail, headers=headers)
+
+
+class HTTPServiceUnavailable(HTTPException):
+    def __init__(
+            self,
+            retry_after: Optional[int] = 1,
+            detail: Optional[str] = None,
+            headers: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        if headers is None:
+            headers = {}
+        headers.setdefault("Retry-After", str(retry_after))
+        if detail is None:
+            detail = "Service temporarily unavailable"
+        super().__init__(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail, headers=headers)
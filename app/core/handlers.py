@@ -1,13 +1,55 @@
+import math
 from typing import TYPE_CHECKING
 from fastapi.responses import ORJSONResponse
-from starlette.status import HTTP_404_NOT_FOUND, HTTP_422_UNPROCESSABLE_ENTITY
+from starlette.status import (
+    HTTP_404_NOT_FOUND, HTTP_422_UNPROCESSABLE_ENTITY, HTTP_503_SERVICE_UNAVAILABLE, HTTP_504_GATEWAY_TIMEOUT,
+)
+
+from app.conf.config import settings
 
 if TYPE_CHECKING:
     from fastapi import Request
     from fastapi.exceptions import RequestValidationError
+    from sqlalchemy.exc import OperationalError, TimeoutError
+
+    from .exceptions import DocumentRawNotFound, InvalidSortField, StatementTimeout
 
-    from .exceptions import DocumentRawNotFound
+# MySQL error of a SELECT interrupted by MAX_EXECUTION_TIME
+MAX_EXECUTION_TIME_EXCEEDED = 3024
 
 
 async def request_document_raw_not_found_exception(request: "Request", exc: "DocumentRawNotFound"):
     return ORJSONResponse(status_code=HTTP_404_NOT_FOUND, content={"detail": str(exc)})
+
+
+async def invalid_sort_field_exception(request: "Request", exc: "InvalidSortField"):
+    # Same shape as request validation errors
+    return ORJSONResponse(status_code=HTTP_422_UNPROCESSABLE_ENTITY, content={"detail": [{
+        "type": "value_error",
+        "loc": ["query", "sort"],
+        "msg": str(exc),
+        "input": request.query_params.get("sort"),
+        "ctx": {"allowed": list(exc.allowed)},
+    }]})
+
+
+async def statement_timeout_exception(request: "Request", exc: "StatementTimeout"):
+    return ORJSONResponse(status_code=HTTP_504_GATEWAY_TIMEOUT, content={"detail": str(exc)})
+
+
+async def operational_error_exception(request: "Request", exc: "OperationalError"):
+    args = getattr(exc.orig, 'args', None)
+    if not args or args[0] != MAX_EXECUTION_TIME_EXCEEDED:
+        raise exc
+    return ORJSONResponse(
+        status_code=HTTP_504_GATEWAY_TIMEOUT, content={"detail": "Statement exceeded its time limit"},
+    )
+
+
+async def pool_timeout_exception(request: "Request", exc: "TimeoutError"):
+    # Every connection of the pool stayed busy for DATABASE_POOL_TIMEOUT seconds
+    return ORJSONResponse(
+        status_code=HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database is busy"},
+        headers={"Retry-After": str(max(1, math.ceil(settings.DATABASE_POOL_TIMEOUT)))},
+    )
@@ -0,0 +1,130 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Optional, List, Dict, Iterator, Tuple, Any
+
+_request_metrics: ContextVar[Optional["RequestMetrics"]] = ContextVar("request_metrics", default=None)
+_statement_listeners: ContextVar[Tuple[Any, ...]] = ContextVar("statement_listeners", default=())
+
+
+class RequestMetrics:
+    """
+    Per-request timing totals.
+
+    Holds named timings (auth, session setup, ...) and every SQL statement
+    executed while the request was being handled.
+    """
+    __slots__ = ('started_at', 'finished_at', 'timings', 'statements', 'db_time', 'retries')
+
+    def __init__(self):
+        self.started_at: float = time.perf_counter()
+        self.finished_at: Optional[float] = None
+        self.timings: Dict[str, float] = {}
+        self.statements: List[Tuple[str, float]] = []
+        self.db_time: float = 0.0
+        self.retries: int = 0
+
+    @property
+    def query_count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def duration(self) -> float:
+        finished_at = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return finished_at - self.started_at
+
+    @property
+    def slowest_statement(self) -> Optional[Tuple[str, float]]:
+        if not self.statements:
+            return None
+        return max(self.statements, key=lambda item: item[1])
+
+    def add_timing(self, name: str, duration: float) -> None:
+        self.timings[name] = self.timings.get(name, 0.0) + duration
+
+    def add_statement(self, statement: str, duration: float) -> None:
+        self.statements.append((statement, duration))
+        self.db_time += duration
+
+    def add_retry(self) -> None:
+        self.retries += 1
+
+    def finish(self) -> None:
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+
+    def server_timing(self) -> str:
+        """
+        Render metrics as a `Server-Timing` header value, durations in milliseconds
+        """
+        items = [f'{name};dur={duration * 1000:.2f}' for name, duration in self.timings.items()]
+        description = f'{self.query_count} queries'
+        if self.retries:
+            description += f', {self.retries} retries'
+        items.append(f'db;dur={self.db_time * 1000:.2f};desc="{description}"')
+        items.append(f'total;dur={self.duration * 1000:.2f}')
+        return ', '.join(items)
+
+    def as_dict(self) -> dict:
+        slowest = self.slowest_statement
+        return {
+            'duration_ms': round(self.duration * 1000, 2),
+            'query_count': self.query_count,
+            'db_ms': round(self.db_time * 1000, 2),
+            'retries': self.retries,
+            'slowest_statement': slowest[0] if slowest else None,
+            'slowest_statement_ms': round(slowest[1] * 1000, 2) if slowest else None,
+            'timings_ms': {name: round(duration * 1000, 2) for name, duration in self.timings.items()},
+        }
+
+
+def get_request_metrics() -> Optional[RequestMetrics]:
+    """Return metrics of the current request, None when the request is not sampled."""
+    return _request_metrics.get()
+
+
+def get_statement_listeners() -> Tuple[Any, ...]:
+    """
+    Return objects which should receive executed statements in the current context.
+
+    The request metrics, when sampled, go first. Every listener implements
+    `add_statement(statement, duration)`.
+    """
+    metrics = _request_metrics.get()
+    listeners = _statement_listeners.get()
+    if metrics is None:
+        return listeners
+    return (metrics, *listeners)
+
+
+def add_statement_listener(listener: Any) -> Token:
+    return _statement_listeners.set((*_statement_listeners.get(), listener))
+
+
+def remove_statement_listener(token: Token) -> None:
+    _statement_listeners.reset(token)
+
+
+def start_request_metrics() -> Tuple[RequestMetrics, Token]:
+    metrics = RequestMetrics()
+    return metrics, _request_metrics.set(metrics)
+
+
+def stop_request_metrics(token: Token) -> None:
+    _request_metrics.reset(token)
+
+
+@contextmanager
+def timer(name: str) -> Iterator[None]:
+    """
+    Add time spent inside the block to the current request metrics under `name`
+    """
+    metrics = _request_metrics.get()
+    if metrics is None:
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_timing(name, time.perf_counter() - started_at)
@@ -0,0 +1,41 @@
+from typing import Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.metrics import add_statement_listener, remove_statement_listener
+from app.core.query_budget import QueryBudget
+
+
+class QueryBudgetMiddleware:
+    """
+    Count statements per request and check them against the budget declared
+    on the endpoint with `query_budget`.
+
+    Endpoints without a declared budget fall back to `default_budget` and are
+    always checked for repeated statement shapes (N+1).
+    """
+
+    def __init__(self, app: ASGIApp, strict: Optional[bool] = False, default_budget: Optional[int] = None) -> None:
+        self.app = app
+        self.strict = strict
+        self.default_budget = default_budget
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = QueryBudget(strict=self.strict, name=f'{scope["method"]} {scope["path"]}')
+        token = add_statement_listener(budget)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            remove_statement_listener(token)
+
+        # Routing stores the matched endpoint in the scope
+        endpoint = scope.get("endpoint")
+        budget.max_queries = getattr(endpoint, 'query_budget', self.default_budget)
+        repeat_threshold = getattr(endpoint, 'query_repeat_threshold', None)
+        if repeat_threshold is not None:
+            budget.repeat_threshold = repeat_threshold
+        budget.check()
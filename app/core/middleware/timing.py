@@ -0,0 +1,70 @@
+import random
+from typing import Optional
+
+from loguru import logger
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.metrics import RequestMetrics, start_request_metrics, stop_request_metrics
+
+
+class TimingMiddleware:
+    """
+    Collect per-request timings and SQL statements.
+
+    Sampled requests get a `Server-Timing` header and a structured log line,
+    requests slower than `slow_request_ms` additionally log every statement.
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            sample_rate: Optional[float] = 1.0,
+            slow_request_ms: Optional[int] = None,
+    ) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        metrics, token = start_request_metrics()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                metrics.finish()
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", metrics.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stop_request_metrics(token)
+            metrics.finish()
+            self.log(scope, status_code, metrics)
+
+    def log(self, scope: Scope, status_code: int, metrics: RequestMetrics) -> None:
+        fields = {
+            'method': scope["method"],
+            'path': scope["path"],
+            'status_code': status_code,
+            **metrics.as_dict(),
+        }
+        if self.slow_request_ms is not None and fields['duration_ms'] >= self.slow_request_ms:
+            statements = [
+                {'statement': statement, 'duration_ms': round(duration * 1000, 2)}
+                for statement, duration in metrics.statements
+            ]
+            logger.warning(
+                "Slow request {method} {path} {status_code} {duration_ms}ms, {query_count} queries",
+                statements=statements, **fields
+            )
+        else:
+            logger.info("{method} {path} {status_code} {duration_ms}ms, {query_count} queries", **fields)
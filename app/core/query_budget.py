@@ -0,0 +1,162 @@
+import re
+import sys
+from collections import Counter
+from typing import Optional, List, Dict, Tuple, Callable, TypeVar
+
+import greenlet
+from loguru import logger
+
+from app.conf.config import settings
+from app.core.metrics import add_statement_listener, remove_statement_listener
+
+FuncType = TypeVar("FuncType", bound=Callable)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|:\w+|%\(\w+\)s)\s*,?)+\)', re.IGNORECASE)
+_VALUES_LIST_RE = re.compile(r'\bVALUES\s*(\([^()]*\)\s*,?\s*)+', re.IGNORECASE)
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+_APP_DIR = settings.PROJECT_DIR
+_IGNORED_DIRS = tuple(f'{_APP_DIR}/{name}/' for name in ('core', 'db'))
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode when a block runs more statements than it declared"""
+    pass
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Normalize a statement so that the same query with different values has the same shape
+    """
+    shape = _WHITESPACE_RE.sub(' ', statement).strip()
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    shape = _VALUES_LIST_RE.sub('VALUES (...)', shape)
+    return _LITERAL_RE.sub('?', shape)
+
+
+def _iter_frames():
+    frame = sys._getframe(2)
+    while frame is not None:
+        yield frame
+        frame = frame.f_back
+    # SQLAlchemy runs the DBAPI call in a child greenlet,
+    # the awaiting coroutines live in the parent greenlet's stack.
+    parent = greenlet.getcurrent().parent
+    frame = parent.gr_frame if parent is not None else None
+    while frame is not None:
+        yield frame
+        frame = frame.f_back
+
+
+def get_call_site() -> Optional[str]:
+    """
+    Return `path:line in function` of the first application frame outside `app/core` and `app/db`
+    """
+    for frame in _iter_frames():
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_DIR) and not filename.startswith(_IGNORED_DIRS):
+            return f'{filename[len(settings.BASE_DIR) + 1:]}:{frame.f_lineno} in {frame.f_code.co_name}'
+    return None
+
+
+class QueryBudget:
+    """
+    Count statements executed inside the block and check them against a budget.
+
+    Usage::
+
+        with QueryBudget(3):
+            await async_client.get(...)
+
+    `max_queries=None` only checks for repeated statement shapes (N+1).
+    A shape repeated `repeat_threshold` times or more is reported with the call sites
+    that issued it. With `strict=True` violations raise `QueryBudgetExceeded`,
+    otherwise they are logged as warnings.
+    """
+    __slots__ = ('max_queries', 'repeat_threshold', 'strict', 'name', 'statements', 'call_sites', '_token')
+
+    def __init__(
+            self,
+            max_queries: Optional[int] = None,
+            *,
+            repeat_threshold: Optional[int] = None,
+            strict: Optional[bool] = True,
+            name: Optional[str] = None,
+    ):
+        self.max_queries = max_queries
+        if repeat_threshold is None:
+            repeat_threshold = settings.QUERY_BUDGET_REPEAT_THRESHOLD
+        self.repeat_threshold = repeat_threshold
+        self.strict = strict
+        self.name = name
+        self.statements: List[str] = []
+        self.call_sites: Dict[str, List[Optional[str]]] = {}
+        self._token = None
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def add_statement(self, statement: str, duration: float) -> None:
+        self.statements.append(statement)
+        self.call_sites.setdefault(statement_shape(statement), []).append(get_call_site())
+
+    def __enter__(self) -> "QueryBudget":
+        self._token = add_statement_listener(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        remove_statement_listener(self._token)
+        self._token = None
+        if exc_type is None:
+            self.check()
+
+    def repeated(self) -> List[Tuple[str, int, List[Optional[str]]]]:
+        """Return (shape, count, call sites) for shapes repeated at least `repeat_threshold` times"""
+        if not self.repeat_threshold:
+            return []
+        counter = Counter({shape: len(sites) for shape, sites in self.call_sites.items()})
+        return [
+            (shape, count, sorted({site for site in self.call_sites[shape] if site}))
+            for shape, count in counter.most_common()
+            if count >= self.repeat_threshold
+        ]
+
+    def violations(self) -> List[str]:
+        name = self.name or 'block'
+        errors = []
+        if self.max_queries is not None and self.count > self.max_queries:
+            statements = '\n'.join(f'  {i}. {statement}' for i, statement in enumerate(self.statements, 1))
+            errors.append(f'{name} executed {self.count} queries, budget is {self.max_queries}:\n{statements}')
+        for shape, count, sites in self.repeated():
+            errors.append(f'{name} repeated a statement {count} times (possible N+1) at {", ".join(sites)}: {shape}')
+        return errors
+
+    def check(self) -> None:
+        errors = self.violations()
+        if not errors:
+            return
+        if self.strict:
+            raise QueryBudgetExceeded('\n'.join(errors))
+        for error in errors:
+            logger.warning(error)
+
+
+def query_budget(max_queries: Optional[int], repeat_threshold: Optional[int] = None) -> Callable[[FuncType], FuncType]:
+    """
+    Declare the maximum number of statements an endpoint may execute.
+
+    Put it below the route decorator so that the route registers the marked function::
+
+        @api.get('/user/')
+        @query_budget(2)
+        async def get_user_list(...): ...
+    """
+
+    def decorator(func: FuncType) -> FuncType:
+        func.query_budget = max_queries
+        func.query_repeat_threshold = repeat_threshold
+        return func
+
+    return decorator
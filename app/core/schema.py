@@ -1,10 +1,40 @@
-from typing import Generic, Optional, TypeVar, List
-from pydantic import BaseModel as PydanticBaseModel, ConfigDict
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Generic, Optional, TypeVar, List, Tuple, Any, Union, get_origin, get_args
+from pydantic import BaseModel as PydanticBaseModel, ConfigDict, Field, EmailStr as PydanticEmailStr
 
 from app.conf.config import settings
 
 DataType = TypeVar("DataType")
 
+# Dot-atom ASCII addresses, a subset of what email-validator accepts unchanged
+_SIMPLE_EMAIL = re.compile(
+    r"([A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*)@([A-Za-z0-9.-]+)"
+)
+
+
+@lru_cache(maxsize=1024)
+def _normalize_email_domain(domain: str) -> str:
+    return PydanticEmailStr._validate(f'user@{domain}').partition('@')[2]
+
+
+class EmailStr(PydanticEmailStr):
+    """
+    `pydantic.EmailStr` which validates every domain once.
+
+    Most of email-validator's time goes into IDNA checks of the domain, which
+    repeat for every address of an import. Plain ASCII addresses only get their
+    domain validated, through a cache; anything else takes the full validation.
+    """
+
+    @classmethod
+    def _validate(cls, value: str) -> str:
+        match = _SIMPLE_EMAIL.fullmatch(value)
+        if match is None or len(value) > 254 or len(match.group(1)) > 64:
+            return super()._validate(value)
+        return f'{match.group(1)}@{_normalize_email_domain(match.group(2))}'
+
 
 class BaseModel(PydanticBaseModel):
     model_config = ConfigDict(populate_by_name=True, str_strip_whitespace=True)
@@ -29,11 +59,119 @@ class IPaginationDataBase(PydanticBaseModel, Generic[DataType]):
     )
 
 
+class ICursorPageBase(PydanticBaseModel, Generic[DataType]):
+    rows: List[DataType]
+    cursor: Optional[str] = None
+    has_more: bool = False
+
+    model_config = ConfigDict(
+        from_attributes=True,
+        populate_by_name=True
+    )
+
+
+class ISyncPageBase(ICursorPageBase[DataType], Generic[DataType]):
+    deleted: List[int] = []
+
+
+class IBatchBase(PydanticBaseModel, Generic[DataType]):
+    """
+    Rows in the order of the requested ids, null for the ids listed in `missing`
+    """
+    rows: List[Optional[DataType]]
+    missing: List[int] = []
+
+    model_config = ConfigDict(
+        from_attributes=True,
+        populate_by_name=True
+    )
+
+
+class BatchIds(PydanticBaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=settings.BATCH_MAX_IDS)
+
+
+class SyncParams(PydanticBaseModel):
+    modified_at: datetime
+    id: int = 0
+    limit: Optional[int] = settings.PAGINATION_MAX_SIZE
+
+
 class CommonsModel(PydanticBaseModel):
     limit: Optional[int] = settings.PAGINATION_MAX_SIZE
     offset: Optional[int] = 0
     page: Optional[int] = 1
+    sort: Tuple[str, ...] = ()
+    # Stream every row from `offset` as NDJSON instead of returning a page
+    stream: bool = False
 
 
 class VisibleBase(PydanticBaseModel):
     model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+    @classmethod
+    def from_trusted(cls, obj: Any) -> "VisibleBase":
+        """
+        Build the model from a trusted source, e.g. an ORM row, without running validators.
+
+        Values are taken as they are, only missing fields get their defaults.
+        """
+        if isinstance(obj, cls):
+            return obj
+        if isinstance(obj, dict):
+            values = {name: obj[name] for name in cls.model_fields if name in obj}
+        else:
+            values = {name: getattr(obj, name) for name in cls.model_fields if hasattr(obj, name)}
+        return cls.model_construct(**values)
+
+
+def is_trusted_model(model: Any) -> bool:
+    """
+    Whether responses of `model` can be built with `construct_trusted`.
+
+    True for `VisibleBase` subclasses and for response envelopes of them,
+    e.g. `IPaginationDataBase[UserVisible]`, including lists of both.
+    """
+    if get_origin(model) in (list, List):
+        return is_trusted_model(get_args(model)[0])
+    if not isinstance(model, type):
+        return False
+    if issubclass(model, VisibleBase):
+        return True
+    if issubclass(model, (IResponseBase, IPaginationDataBase, ICursorPageBase, IBatchBase)):
+        args = model.__pydantic_generic_metadata__['args']
+        return bool(args) and all(is_trusted_model(arg) for arg in args)
+    return False
+
+
+def construct_trusted(annotation: Any, value: Any) -> Any:
+    """
+    Build `annotation` from `value` with `VisibleBase.from_trusted`, recursing into envelopes, lists and Optional
+    """
+    if value is None:
+        return None
+    origin = get_origin(annotation)
+    if origin in (list, List):
+        item_annotation = get_args(annotation)[0]
+        return [construct_trusted(item_annotation, item) for item in value]
+    if origin is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return construct_trusted(args[0], value) if len(args) == 1 else value
+    if not isinstance(annotation, type) or not issubclass(annotation, PydanticBaseModel):
+        return value
+    if issubclass(annotation, VisibleBase):
+        return annotation.from_trusted(value)
+    if isinstance(value, annotation):
+        return value
+    values = {}
+    for name, field in annotation.model_fields.items():
+        if isinstance(value, dict):
+            if name not in value:
+                continue
+            field_value = value[name]
+        elif hasattr(value, name):
+            field_value = getattr(value, name)
+        else:
+            continue
+        values[name] = construct_trusted(field.annotation, field_value)
+    return annotation.model_construct(**values)
@@ -0,0 +1,88 @@
+import asyncio
+from typing import Dict, Hashable, Callable, Awaitable, Any, Optional, TypeVar
+
+FuncType = TypeVar("FuncType", bound=Callable)
+
+
+def single_flight(enabled: Optional[bool] = True, grace_ms: Optional[int] = None) -> Callable[[FuncType], FuncType]:
+    """
+    Configure request coalescing for an endpoint, `single_flight(False)` bypasses it.
+
+    `grace_ms` keeps a finished result around for late identical requests,
+    falls back to `SINGLE_FLIGHT_GRACE_MS`.
+    """
+
+    def decorator(func: FuncType) -> FuncType:
+        func.single_flight = enabled
+        func.single_flight_grace_ms = grace_ms
+        return func
+
+    return decorator
+
+
+class _Call:
+    __slots__ = ('future', 'expires_at')
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.expires_at: Optional[float] = None
+
+    def is_active(self, now: float) -> bool:
+        return not self.future.done() or (self.expires_at is not None and now < self.expires_at)
+
+
+class SingleFlight:
+    """
+    Run one computation per key at a time and share its result with concurrent callers.
+
+    Callers arriving while the computation is running, or within `grace` seconds after it
+    finished, get the same result (or exception). If the running computation is cancelled,
+    waiting callers start it again.
+    """
+    __slots__ = ('_calls',)
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], grace: Optional[float] = 0) -> Any:
+        loop = asyncio.get_running_loop()
+        while True:
+            call = self._calls.get(key)
+            if call is None or not call.is_active(loop.time()):
+                break
+            try:
+                return await asyncio.shield(call.future)
+            except asyncio.CancelledError:
+                if not call.future.cancelled():
+                    raise
+                # The caller computing the result went away, take over
+
+        call = _Call(loop.create_future())
+        self._calls[key] = call
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self._forget(key, call)
+            call.future.cancel()
+            raise
+        except BaseException as e:
+            self._forget(key, call)
+            call.future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            call.future.exception()
+            raise
+
+        call.future.set_result(result)
+        if grace:
+            call.expires_at = loop.time() + grace
+            loop.call_later(grace, self._forget, key, call)
+        else:
+            self._forget(key, call)
+        return result
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -0,0 +1,48 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Callable, Iterator, TypeVar, Any
+
+FuncType = TypeVar("FuncType", bound=Callable)
+
+_UNSET: Any = object()
+_scope_timeout: ContextVar[Optional[int]] = ContextVar("statement_timeout", default=_UNSET)
+
+
+def statement_timeout(milliseconds: Optional[int]) -> Callable[[FuncType], FuncType]:
+    """
+    Time limit of each statement an endpoint runs, instead of `DATABASE_STATEMENT_TIMEOUT_MS`,
+    `statement_timeout(None)` for no limit::
+
+        @api.get('/report/')
+        @statement_timeout(30000)
+        async def get_report(...): ...
+    """
+
+    def decorator(func: FuncType) -> FuncType:
+        func.statement_timeout = milliseconds
+        return func
+
+    return decorator
+
+
+@contextmanager
+def statement_timeout_scope(milliseconds: Optional[int]) -> Iterator[None]:
+    """
+    Time limit of the statements run inside the block, e.g. around one repository call::
+
+        with statement_timeout_scope(500):
+            count = await user_repo.count(async_db)
+    """
+    token = _scope_timeout.set(milliseconds)
+    try:
+        yield
+    finally:
+        _scope_timeout.reset(token)
+
+
+def current_statement_timeout(default: Optional[int]) -> Optional[int]:
+    """
+    Limit of the enclosing `statement_timeout_scope`, `default` outside of one
+    """
+    milliseconds = _scope_timeout.get()
+    return default if milliseconds is _UNSET else milliseconds
@@ -0,0 +1,194 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Optional, Dict, Tuple, AsyncIterator, Callable, TypeVar
+
+from app.conf.config import settings
+from app.core.exceptions import HTTPTooManyRequests, HTTPServiceUnavailable, ImproperlyConfigured
+from app.utils.import_utils import import_from_string
+
+FuncType = TypeVar("FuncType", bound=Callable)
+
+READ = 'read'
+WRITE = 'write'
+# Long-lived reads (long-poll, SSE), rate limited as reads but not counted as in-flight requests
+STREAM = 'stream'
+
+
+def throttle_class(name: str) -> Callable[[FuncType], FuncType]:
+    """
+    Override the read/write class an endpoint is throttled as, e.g. for GET routes which delete
+    """
+
+    def decorator(func: FuncType) -> FuncType:
+        func.throttle_class = name
+        return func
+
+    return decorator
+
+
+class RateLimitBackend:
+    """
+    Token bucket storage.
+
+    Subclasses must implement `consume`, which takes `cost` tokens from the bucket `key`
+    refilled with `rate` tokens per second up to `capacity` tokens.
+    """
+
+    async def consume(self, key: str, rate: float, capacity: int, cost: Optional[int] = 1) -> float:
+        """
+        Return 0 when the tokens were taken, otherwise seconds until enough tokens are available
+        """
+        raise NotImplementedError('subclasses of RateLimitBackend must provide a consume() method')
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    Buckets kept in the worker process memory, limits apply per gunicorn worker
+    """
+    __slots__ = ('max_keys', '_buckets')
+
+    def __init__(self, max_keys: Optional[int] = 10000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def _prune(self, now: float) -> None:
+        # Drop buckets which were not touched for a minute
+        for key, (tokens, updated_at) in list(self._buckets.items()):
+            if now - updated_at > 60:
+                del self._buckets[key]
+
+    async def consume(self, key: str, rate: float, capacity: int, cost: Optional[int] = 1) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+        if tokens >= cost:
+            wait = 0.0
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        if key not in self._buckets and len(self._buckets) >= self.max_keys:
+            self._prune(now)
+        self._buckets[key] = (tokens, now)
+        return wait
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """
+    Buckets shared by all workers and hosts, requires the `redis` package and `RATE_LIMIT_REDIS_URL`
+    """
+    __slots__ = ('_client', '_script')
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated_at) * rate)
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+    else
+        wait = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: Optional[str] = None):
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise ImproperlyConfigured("RedisRateLimitBackend requires the `redis` package") from e
+        url = url or settings.RATE_LIMIT_REDIS_URL
+        if not url:
+            raise ImproperlyConfigured("RedisRateLimitBackend requires RATE_LIMIT_REDIS_URL")
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    async def consume(self, key: str, rate: float, capacity: int, cost: Optional[int] = 1) -> float:
+        wait = await self._script(keys=[f'rate-limit:{key}'], args=[rate, capacity, cost])
+        return float(wait)
+
+
+@lru_cache
+def get_rate_limit_backend() -> RateLimitBackend:
+    return import_from_string(settings.RATE_LIMIT_BACKEND, 'RATE_LIMIT_BACKEND')()
+
+
+async def check_rate_limit(audience: str, route_class: str) -> None:
+    """
+    Take a token from the audience bucket of `route_class`, raise 429 when it is empty
+    """
+    if route_class == WRITE:
+        rate, capacity = settings.RATE_LIMIT_WRITE_RATE, settings.RATE_LIMIT_WRITE_BURST
+    else:
+        rate, capacity = settings.RATE_LIMIT_READ_RATE, settings.RATE_LIMIT_READ_BURST
+    wait = await get_rate_limit_backend().consume(f'{audience}:{route_class}', rate=rate, capacity=capacity)
+    if wait > 0:
+        raise HTTPTooManyRequests(retry_after=math.ceil(wait))
+
+
+class _Slot:
+    __slots__ = ('semaphore', 'waiting', 'active')
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+        self.active = 0
+
+
+class ConcurrencyLimiter:
+    """
+    Cap in-flight requests per key within the worker.
+
+    Requests over the cap wait up to `timeout` seconds for a free slot, at most
+    `queue_size` of them per key; the rest are shed with 503 immediately.
+    """
+    __slots__ = ('limit', 'queue_size', 'timeout', '_slots')
+
+    def __init__(self, limit: int, queue_size: int, timeout: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._slots: Dict[str, _Slot] = {}
+
+    @asynccontextmanager
+    async def acquire(self, key: str) -> AsyncIterator[None]:
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _Slot(self.limit)
+        retry_after = max(1, math.ceil(self.timeout))
+        if slot.semaphore.locked() and slot.waiting >= self.queue_size:
+            raise HTTPServiceUnavailable(retry_after=retry_after, detail="Too many concurrent requests")
+
+        slot.waiting += 1
+        try:
+            await asyncio.wait_for(slot.semaphore.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPServiceUnavailable(retry_after=retry_after, detail="Too many concurrent requests")
+        finally:
+            slot.waiting -= 1
+
+        slot.active += 1
+        try:
+            yield
+        finally:
+            slot.active -= 1
+            slot.semaphore.release()
+            if not slot.active and not slot.waiting:
+                self._slots.pop(key, None)
+
+
+concurrency_limiter = ConcurrencyLimiter(
+    limit=settings.CONCURRENCY_LIMIT_PER_TENANT,
+    queue_size=settings.CONCURRENCY_QUEUE_SIZE,
+    timeout=settings.CONCURRENCY_QUEUE_TIMEOUT,
+)
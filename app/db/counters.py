@@ -0,0 +1,132 @@
+from collections import defaultdict
+from typing import Optional, Iterable, List, Dict, Tuple, Any, Mapping, Union
+
+import sqlalchemy as sa
+from sqlalchemy import update, select, func, bindparam, or_
+
+from .models import live_parent_expressions
+
+# Counters of each relation table, registered by the repositories declaring them
+relation_counters: Dict[sa.Table, Tuple["Counter", ...]] = {}
+
+
+class Counter:
+    """
+    Denormalized count of relation rows kept on the row they point at.
+
+    `column` of the target model counts the relation rows whose `foreign_key`
+    references it, only those with the boolean `condition` field set when given.
+    """
+    __slots__ = ('foreign_key', 'column', 'condition')
+
+    def __init__(self, foreign_key: str, column: Any, condition: Optional[str] = None):
+        self.foreign_key = foreign_key
+        self.column = column
+        self.condition = condition
+
+    @property
+    def target(self) -> sa.Table:
+        return self.column.class_.__table__
+
+    def target_id(self, values: Mapping[str, Any]) -> Optional[int]:
+        """
+        Id of the row the relation row with `values` is counted on, None when it is not counted
+        """
+        if self.condition is not None and not values.get(self.condition):
+            return None
+        return values.get(self.foreign_key)
+
+
+def counter_updates(
+        counters: Iterable[Counter],
+        removed: Iterable[Mapping[str, Any]] = (),
+        added: Iterable[Mapping[str, Any]] = (),
+) -> List[Tuple[sa.Update, List[dict]]]:
+    """
+    Statements moving the counters by the relation rows `removed` and `added`.
+
+    One executemany UPDATE per target table, every counter of the table set at once,
+    with the targets in id order so that concurrent writers lock them in the same order.
+    """
+    removed, added = list(removed), list(added)
+    deltas: Dict[sa.Table, Dict[int, Dict[str, int]]] = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+    for counter in counters:
+        for rows, sign in ((removed, -1), (added, 1)):
+            for values in rows:
+                target_id = counter.target_id(values)
+                if target_id is not None:
+                    deltas[counter.target][target_id][counter.column.key] += sign
+
+    updates = []
+    for table, target_deltas in deltas.items():
+        keys = sorted({key for columns in target_deltas.values() for key in columns})
+        params = [
+            {'target_id': target_id, **{f'delta_{key}': columns.get(key, 0) for key in keys}}
+            for target_id, columns in sorted(target_deltas.items())
+            if any(columns.values())
+        ]
+        if params:
+            stmt = update(table).where(table.c.id == bindparam('target_id')).values(
+                {key: table.c[key] + bindparam(f'delta_{key}') for key in keys}
+            )
+            updates.append((stmt, params))
+    return updates
+
+
+def recount_stmts(
+        counters: Iterable[Counter], relation: sa.Table, target_ids: Union[Iterable[int], sa.Select],
+) -> List[sa.Update]:
+    """
+    Statements setting the counters of `target_ids`, ids or a select of them, to the actual
+    count of `relation` rows. Rows with a soft deleted parent are not counted.
+
+    Only rows which drifted are updated, so the others keep their `modified_at`.
+    """
+    if not isinstance(target_ids, sa.Select):
+        target_ids = list(target_ids)
+    values: Dict[sa.Table, dict] = defaultdict(dict)
+    for counter in counters:
+        table = counter.target
+        expressions = [
+            relation.c[counter.foreign_key] == table.c.id,
+            *live_parent_expressions(relation, skip=(counter.foreign_key,)),
+        ]
+        if counter.condition is not None:
+            expressions.append(relation.c[counter.condition].is_(True))
+        values[table][counter.column.key] = (
+            select(func.count()).select_from(relation).where(*expressions).scalar_subquery()
+        )
+    return [
+        update(table)
+        .where(table.c.id.in_(target_ids), or_(*(table.c[key] != count for key, count in columns.items())))
+        .values(columns)
+        for table, columns in values.items()
+    ]
+
+
+def counters_by_key(counters: Iterable[Counter], skip: Optional[str] = None) -> Dict[str, List[Counter]]:
+    """
+    `counters` grouped by their foreign key, those on `skip` excepted
+    """
+    grouped: Dict[str, List[Counter]] = defaultdict(list)
+    for counter in counters:
+        if counter.foreign_key != skip:
+            grouped[counter.foreign_key].append(counter)
+    return grouped
+
+
+def reference_recount_stmts(table: sa.Table, obj_id: int) -> List[sa.Update]:
+    """
+    Statements recounting the counters relation rows referencing the row `obj_id` of `table`
+    are counted on, so that they stop counting once the row is soft deleted
+    """
+    stmts = []
+    for relation, counters in relation_counters.items():
+        for foreign_key in sorted(relation.foreign_keys, key=lambda foreign_key: foreign_key.parent.key):
+            if foreign_key.column.table is not table:
+                continue
+            column = foreign_key.parent
+            for key, key_counters in counters_by_key(counters, skip=column.key).items():
+                target_ids = select(relation.c[key]).where(column == obj_id)
+                stmts.extend(recount_stmts(key_counters, relation, target_ids))
+    return stmts
@@ -0,0 +1,114 @@
+import time
+import weakref
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.conf.config import settings
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.metrics import get_statement_listeners
+
+_QUERY_START_KEY = 'query_start_time'
+_BREAKER_START_KEY = 'circuit_breaker_start_time'
+# MySQL errors telling that the server is unreachable or overloaded rather than that a statement is wrong:
+# too many connections, shutdown, connection killed, can't connect, gone away, lost connection, timeout
+UNHEALTHY_ERROR_CODES = frozenset({1040, 1053, 1927, 2002, 2003, 2005, 2006, 2013, 2055, 3024})
+
+_circuit_breakers: "weakref.WeakKeyDictionary[Engine, CircuitBreaker]" = weakref.WeakKeyDictionary()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not get_statement_listeners():
+        return
+    conn.info.setdefault(_QUERY_START_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    listeners = get_statement_listeners()
+    started = conn.info.get(_QUERY_START_KEY)
+    if not listeners or not started:
+        return
+    duration = time.perf_counter() - started.pop()
+    for listener in listeners:
+        listener.add_statement(statement, duration)
+
+
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get(_QUERY_START_KEY) if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def setup_query_events() -> None:
+    """
+    Register statement timing hooks on every engine (sync and the sync side of async ones).
+
+    Safe to call more than once.
+    """
+    for name, fn in (
+            ('before_cursor_execute', _before_cursor_execute),
+            ('after_cursor_execute', _after_cursor_execute),
+            ('handle_error', _handle_error),
+    ):
+        if not event.contains(Engine, name, fn):
+            event.listen(Engine, name, fn)
+
+
+def is_unhealthy(exception_context) -> bool:
+    if exception_context.is_disconnect:
+        return True
+    error = exception_context.original_exception
+    if isinstance(error, OSError):
+        return True
+    code = error.args[0] if error.args else None
+    return code in UNHEALTHY_ERROR_CODES
+
+
+def _breaker_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info[_BREAKER_START_KEY] = time.perf_counter()
+
+
+def _breaker_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop(_BREAKER_START_KEY, None)
+    breaker = _circuit_breakers.get(conn.engine)
+    if started is None or breaker is None:
+        return
+    if (time.perf_counter() - started) * 1000 > settings.CIRCUIT_BREAKER_SLOW_MS:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def _breaker_handle_error(exception_context):
+    if exception_context.connection is not None:
+        exception_context.connection.info.pop(_BREAKER_START_KEY, None)
+    breaker = _circuit_breakers.get(exception_context.engine)
+    # A failed pre ping is followed by a reconnect, which reports its own failure
+    if breaker is not None and not exception_context.is_pre_ping and is_unhealthy(exception_context):
+        breaker.record_failure()
+
+
+def setup_circuit_breaker(engine: Engine) -> CircuitBreaker:
+    """
+    Open a circuit breaker of `engine` on connection errors and statements slower than `CIRCUIT_BREAKER_SLOW_MS`
+    """
+    breaker = CircuitBreaker(
+        f"Database `{engine.url.database}`",
+        failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        window=settings.CIRCUIT_BREAKER_WINDOW,
+        reset_timeout=settings.CIRCUIT_BREAKER_RESET_TIMEOUT,
+        half_open_requests=settings.CIRCUIT_BREAKER_HALF_OPEN_REQUESTS,
+    )
+    _circuit_breakers[engine] = breaker
+    for name, fn in (
+            ('before_cursor_execute', _breaker_before_cursor_execute),
+            ('after_cursor_execute', _breaker_after_cursor_execute),
+            ('handle_error', _breaker_handle_error),
+    ):
+        event.listen(engine, name, fn)
+    return breaker
+
+
+def get_circuit_breaker(engine: Engine) -> Optional[CircuitBreaker]:
+    return _circuit_breakers.get(engine)
@@ -1,10 +1,10 @@
 import re
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Iterable, List
 
 import sqlalchemy as sa
 from sqlalchemy.orm import declarative_base, declared_attr, Mapped, mapped_column
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, select
 
 metadata = sa.MetaData()
 
@@ -32,7 +32,56 @@ class Base(PlainBase):
 class CreationModificationDateBase(Base):
     __abstract__ = True
     created_at: Mapped[datetime] = mapped_column(sa.DateTime(timezone=True), server_default=func.now())
+    # Set on insert too, so it is the watermark of incremental sync
     modified_at: Mapped[Optional[datetime]] = mapped_column(
-        sa.DateTime(timezone=True), onupdate=func.now(),
+        sa.DateTime(timezone=True), server_default=func.now(), onupdate=func.now(),
         nullable=True
     )
+
+    @declared_attr
+    def __table_args__(cls) -> tuple:
+        return (
+            sa.Index(f'ix_{cls.__tablename__}_modified_at_id', 'modified_at', 'id'),
+        )
+
+
+class SoftDeleteBase(CreationModificationDateBase):
+    """
+    Rows are deleted by setting `deleted_at` and hard deleted later by the purge job.
+
+    MySQL has no partial indexes, so columns unique among live rows are listed in
+    `live_unique` and made unique together with `is_live`, which is NULL on deleted rows.
+    """
+    __abstract__ = True
+    live_unique: tuple = ()
+
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(sa.DateTime(timezone=True), nullable=True)
+    is_live: Mapped[Optional[bool]] = mapped_column(
+        sa.Boolean, sa.Computed('IF(deleted_at IS NULL, 1, NULL)'), nullable=True
+    )
+
+    @declared_attr
+    def __table_args__(cls) -> tuple:
+        return (
+            sa.Index(f'ix_{cls.__tablename__}_modified_at_id', 'modified_at', 'id'),
+            sa.Index(f'ix_{cls.__tablename__}_deleted_at', 'deleted_at'),
+            *(
+                sa.UniqueConstraint(*columns, 'is_live', name=f'ux_{cls.__tablename__}_{"_".join(columns)}_live')
+                for columns in cls.live_unique
+            ),
+        )
+
+
+def live_parent_expressions(table: sa.Table, skip: Iterable[str] = ()) -> List[sa.ColumnElement]:
+    """
+    Filter of the rows of `table` whose soft deletable parents are all live, one EXISTS per
+    foreign key, those of the columns named in `skip` excepted
+    """
+    expressions = []
+    for foreign_key in sorted(table.foreign_keys, key=lambda foreign_key: foreign_key.parent.key):
+        column, parent = foreign_key.parent, foreign_key.column.table
+        if 'deleted_at' not in parent.c or column.key in skip:
+            continue
+        live = select(foreign_key.column).where(foreign_key.column == column, parent.c.deleted_at.is_(None)).exists()
+        expressions.append(sa.or_(column.is_(None), live) if column.nullable else live)
+    return expressions
@@ -0,0 +1,72 @@
+from datetime import datetime
+from typing import Optional, Iterable, List, Union, TYPE_CHECKING
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+
+from app.conf.config import settings
+from app.core.enums import TextChoices
+
+from .models import Base
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class ChangeOp(TextChoices):
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+
+
+class Change(Base):
+    """
+    Outbox of row changes, written in the transaction of the change itself.
+
+    `id` is the feed cursor, consumers read changes with `id > cursor`.
+    """
+    __tablename__ = 'changes'
+    id: Mapped[int] = mapped_column(sa.BigInteger, primary_key=True)
+    table_name: Mapped[str] = mapped_column(sa.String(64), nullable=False)
+    object_id: Mapped[int] = mapped_column(sa.Integer, nullable=False)
+    op: Mapped[str] = mapped_column(sa.String(10), nullable=False)
+    fields: Mapped[Optional[list]] = mapped_column(sa.JSON, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(sa.DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        sa.Index('ix_changes_table_name_id', 'table_name', 'id'),
+        sa.Index('ix_changes_table_name_op_created_at', 'table_name', 'op', 'created_at'),
+    )
+
+
+def settled_before() -> sa.ColumnElement:
+    """
+    Cutoff for rows old enough to be published, see `CHANGES_SETTLE_SECONDS`
+    """
+    return func.timestampadd(sa.literal_column('SECOND'), -settings.CHANGES_SETTLE_SECONDS, func.now())
+
+
+def add_change(
+        db: Union["Session", "AsyncSession"], db_obj: Base, op: str, fields: Optional[Iterable[str]] = None,
+) -> None:
+    """
+    Stage a change record of `db_obj`, flushed with the session's next statement or commit
+    """
+    db.add(Change(
+        table_name=db_obj.__tablename__,
+        object_id=db_obj.id,
+        op=op,
+        fields=sorted(fields) if fields is not None else None,
+    ))
+
+
+def change_rows(
+        table_name: str, object_ids: Iterable[int], op: str, fields: Optional[Iterable[str]] = None,
+) -> List[dict]:
+    """
+    Parameters of the change records of many rows, for one multi-row `insert(Change)`
+    """
+    fields = sorted(fields) if fields is not None else None
+    return [{'table_name': table_name, 'object_id': object_id, 'op': op, 'fields': fields} for object_id in object_ids]
@@ -1,28 +1,141 @@
+import asyncio
+from collections import defaultdict
 from typing import (
     Generic, Optional, Type, TypeVar, Union, Any, TYPE_CHECKING, Iterable,
-    Dict
+    Dict, List, Sequence, Tuple, Mapping, Iterator, Set, Callable, Awaitable
 )
+from datetime import datetime
 from uuid import UUID
-from sqlalchemy import func, select, text, delete
+from sqlalchemy import func, select, delete, insert, tuple_, literal, union_all
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql import operators
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from pydantic_core import ErrorDetails
 from pydantic import BaseModel
 
+from app.conf.config import settings
 from app.core.enums import Choices
+from app.core.exceptions import InvalidSortField
 
-from .models import Base
+from .counters import Counter, counter_updates, recount_stmts, reference_recount_stmts, relation_counters
+from .models import Base, live_parent_expressions
+from .outbox import Change, ChangeOp, add_change, change_rows, settled_before
+from .retry import run_with_retry, share_retry_budget
+from .timeouts import STATEMENT_TIMEOUT, run_with_timeout
 
 if TYPE_CHECKING:
+    from sqlalchemy import Select, Insert, Update, Delete, Executable, Result, ColumnElement
     from sqlalchemy.orm import Session
-    from sqlalchemy.ext.asyncio import AsyncSession
 
 ModelType = TypeVar("ModelType", bound=Base)
 BaseSchemaType = TypeVar("BaseSchemaType", bound=BaseModel)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
+T = TypeVar("T")
 
 
-class CRUDBaseSync(Generic[ModelType]):
+async def execute_read(async_db: "AsyncSession", statement: "Executable") -> "Result":
+    """
+    Execute a read statement within the time limit, replayed after transient errors,
+    see `run_with_timeout` and `run_with_retry`
+    """
+    return await run_with_retry(async_db, lambda: run_with_timeout(async_db, lambda: async_db.execute(statement)))
+
+
+async def execute_write(async_db: "AsyncSession", statements: Callable[[], Awaitable[T]]) -> T:
+    """
+    Run `statements`, the writes of one transaction, flush them and commit, replayed after
+    transient errors, see `run_with_retry`.
+
+    The time limit of `run_with_timeout` covers the statements and the flush but not the
+    COMMIT, so a write never times out once it may be durable, it commits or fails.
+    """
+    async def write() -> T:
+        result = await statements()
+        await async_db.flush()
+        return result
+
+    async def transaction() -> T:
+        result = await run_with_timeout(async_db, write)
+        await async_db.commit()
+        return result
+
+    return await run_with_retry(async_db, transaction, transaction=True)
+
+
+def dead_parent_message(field: str) -> str:
+    return f"{field.removesuffix('_id').capitalize()} does not exist"
+
+
+def raise_dead_parents(dead: List[str], obj_in: Mapping[str, Any]) -> None:
+    """
+    Reject the request body `obj_in` when `dead`, as returned by `CRUDBase.dead_parents`, is not empty
+    """
+    if dead:
+        raise RequestValidationError([
+            ErrorDetails(msg=dead_parent_message(field), loc=('body', field), type='value_error', input=obj_in[field])
+            for field in dead
+        ])
+
+
+async def gather_reads(async_db: "AsyncSession", *statements: "Executable") -> List["Result"]:
+    """
+    Run independent read statements concurrently, each on its own short-lived
+    session of the `async_db` engine, and return their buffered results in order.
+
+    At most `DATABASE_PARALLEL_READS` connections are taken per request session.
+    Statements run one after another on `async_db` itself when it is in a
+    transaction, so they see its uncommitted writes, or bound to a single connection.
+    Every statement is read with `execute_read`, the sessions replay from the retry
+    budget of `async_db`.
+
+        rows, count = await gather_reads(async_db, user_repo.get_all_stmt(), user_repo.count_stmt())
+    """
+    bind = async_db.bind
+    if len(statements) < 2 or async_db.in_transaction() or not isinstance(bind, AsyncEngine):
+        return [await execute_read(async_db, statement) for statement in statements]
+
+    semaphore = async_db.info.get('read_semaphore')
+    if semaphore is None:
+        semaphore = async_db.info['read_semaphore'] = asyncio.Semaphore(settings.DATABASE_PARALLEL_READS)
+
+    info = {STATEMENT_TIMEOUT: async_db.info.get(STATEMENT_TIMEOUT), **share_retry_budget(async_db)}
+
+    async def read(statement: "Executable") -> "Result":
+        async with semaphore:
+            async with AsyncSession(bind=bind, expire_on_commit=False, info=info) as session:
+                return await execute_read(session, statement)
+
+    return list(await asyncio.gather(*[read(statement) for statement in statements]))
+
+
+def _sort_column(expression: Any) -> Any:
+    # `column.desc()` wraps the column, ORM attributes proxy it
+    expression = getattr(expression, 'element', expression)
+    return getattr(expression, 'expression', expression)
+
+
+class CRUDStatements(Generic[ModelType]):
+    """
+    Statement building shared by `CRUDBaseSync` and `CRUDBase`.
+
+    Both executors run the statements built here, so reads filter, sort and
+    paginate the same way and writes record the same changes whichever driver
+    runs them.
+    """
     __slots__ = ('model', 'primary_field')
+    # Write create/update/delete into the change outbox, in the same transaction
+    track_changes = False
+    # Delete by setting `deleted_at` (see `SoftDeleteBase`), reads skip deleted rows
+    soft_delete = False
+    # Reads skip rows referencing soft deleted rows, writes must reference live ones, see `dead_parents`
+    live_parents = False
+    # Indexed fields lists may be sorted by besides the primary key, see `order_by_clause`
+    sortable_fields: Tuple[str, ...] = ()
+    # Counts on other tables kept up to date by create/update/delete, in the same transaction
+    counters: Tuple[Counter, ...] = ()
 
     def __init__(self, model: Type[ModelType], primary_field: Optional[str] = 'id'):
         """
@@ -32,10 +145,287 @@ class CRUDBaseSync(Generic[ModelType]):
 
 
         * `model`: A SQLAlchemy model class
-        * `schema`: A Pydantic model (schema) class
+        * `primary_field`: Name of the primary key attribute
         """
         self.model = model
         self.primary_field = primary_field
+        if self.counters:
+            relation_counters[model.__table__] = self.counters
+
+    def live_expressions(self) -> tuple:
+        """
+        Filter of the rows reads return, excludes soft deleted rows and with `live_parents`
+        the rows referencing them
+        """
+        expressions = ()
+        if self.soft_delete:
+            expressions += (self.model.deleted_at.is_(None),)
+        if self.live_parents:
+            expressions += tuple(live_parent_expressions(self.model.__table__))
+        return expressions
+
+    def live_parent_keys(self) -> Dict[str, Any]:
+        """
+        Referenced columns of the soft deletable rows checked with `live_parents`, by foreign key field
+        """
+        if not self.live_parents:
+            return {}
+        return {
+            foreign_key.parent.key: foreign_key.column
+            for foreign_key in sorted(self.model.__table__.foreign_keys, key=lambda foreign_key: foreign_key.parent.key)
+            if 'deleted_at' in foreign_key.column.table.c
+        }
+
+    def live_parent_ids_stmt(self, objs_in: Iterable[Mapping[str, Any]]) -> Optional["Select"]:
+        """
+        Statement of the `(field, id)` of the live rows among the soft deletable rows `objs_in`
+        reference, None without such references
+        """
+        objs_in = list(objs_in)
+        stmts = []
+        for field, column in self.live_parent_keys().items():
+            obj_ids = sorted({obj_in[field] for obj_in in objs_in if obj_in.get(field) is not None})
+            if obj_ids:
+                stmts.append(
+                    select(literal(field).label('field'), column.label('id'))
+                    .where(column.in_(obj_ids), column.table.c.deleted_at.is_(None))
+                )
+        if not stmts:
+            return None
+        return union_all(*stmts) if len(stmts) > 1 else stmts[0]
+
+    def dead_parent_fields(self, obj_in: Mapping[str, Any], live_ids: Mapping[str, Set]) -> List[str]:
+        """
+        Fields of `obj_in` referencing a soft deletable row missing from `live_ids`, see `live_parent_ids_stmt`
+        """
+        return [
+            field for field in self.live_parent_keys()
+            if obj_in.get(field) is not None and obj_in[field] not in live_ids.get(field, ())
+        ]
+
+    def order_by_clause(self, order_by: Optional[Iterable] = ()) -> tuple:
+        """
+        Sort expressions of `order_by`, field names (`-name` for descending) or column expressions.
+
+        Field names usually come from clients, so only the primary key and `sortable_fields`
+        are accepted, anything else raises `InvalidSortField`.
+        """
+        allowed = (self.primary_field, *self.sortable_fields)
+        clause = []
+        for item in order_by or ():
+            if not isinstance(item, str):
+                clause.append(item)
+                continue
+            name = item[1:] if item.startswith('-') else item
+            if name not in allowed:
+                raise InvalidSortField(name, allowed)
+            column = self.model.__mapper__.columns[name]
+            clause.append(column.desc() if item.startswith('-') else column.asc())
+        return tuple(clause)
+
+    def stable_order_by_clause(self, order_by: Optional[Iterable] = ()) -> tuple:
+        """
+        `order_by_clause` ending with the primary key, so that every row has one position
+        and pages neither repeat nor skip rows. Lists default to primary key order.
+
+        The primary key follows the direction of the last sort field, which keeps
+        `(field, id)` indexes usable in both directions.
+        """
+        clause = self.order_by_clause(order_by)
+        primary_key = self.model.__mapper__.columns[self.primary_field]
+        for expression in clause:
+            if _sort_column(expression).compare(primary_key):
+                return clause
+        if clause and getattr(clause[-1], 'modifier', None) is operators.desc_op:
+            return (*clause, primary_key.desc())
+        return (*clause, primary_key.asc())
+
+    def filter_stmt(
+            self,
+            *,
+            params: Optional[dict] = None,
+            expressions: Optional[Iterable] = (),
+            options: Optional[Iterable] = (),
+            order_by: Optional[Iterable] = (),
+    ) -> "Select":
+        return select(self.model).options(*options or ()).filter(
+            *self.live_expressions(), *expressions or ()
+        ).filter_by(**params or {}).order_by(*self.order_by_clause(order_by))
+
+    def count_stmt(self, *, expressions: Optional[Iterable] = (), params: Optional[dict] = None) -> "Select":
+        return select(func.count(self.model.id)).filter(
+            *self.live_expressions(), *expressions or ()
+        ).filter_by(**params or {})
+
+    def exists_stmt(self, *, expressions: Optional[Iterable] = (), params: Optional[dict] = None) -> "Select":
+        return select(self.filter_stmt(params=params, expressions=expressions).exists())
+
+    def get_stmt(self, obj_id: Union[int, UUID], options: Optional[Iterable] = ()) -> "Select":
+        return self.filter_stmt(expressions=(getattr(self.model, self.primary_field) == obj_id,), options=options)
+
+    def get_many_stmt(self, obj_ids: Iterable[Union[int, UUID]], options: Optional[Iterable] = ()) -> "Select":
+        return self.filter_stmt(expressions=(getattr(self.model, self.primary_field).in_(obj_ids),), options=options)
+
+    def get_all_stmt(
+            self,
+            *,
+            offset: Optional[int] = 0,
+            limit: Optional[int] = 100,
+            q: Optional[dict] = None,
+            order_by: Optional[Iterable] = (),
+            options: Optional[Iterable] = (),
+            expressions: Optional[Iterable] = (),
+    ) -> "Select":
+        return self.filter_stmt(params=q, expressions=expressions, options=options).order_by(
+            *self.stable_order_by_clause(order_by)
+        ).offset(offset).limit(limit)
+
+    def modified_since_stmt(self, *, after: Tuple[datetime, int], limit: int) -> "Select":
+        """
+        Rows modified after the `(modified_at, id)` keyset position, in that order
+        """
+        model = self.model
+        expressions = [tuple_(model.modified_at, model.id) > tuple_(*after)]
+        if settings.CHANGES_SETTLE_SECONDS:
+            expressions.append(model.modified_at < settled_before())
+        return self.filter_stmt(expressions=expressions, order_by=(model.modified_at, model.id)).limit(limit)
+
+    def deleted_since_stmt(self, *, after: datetime, until: Optional[datetime] = None) -> "Select":
+        """
+        Ids deleted since `after` according to the change outbox, up to `until` or what has settled
+        """
+        expressions = [
+            Change.table_name == self.model.__tablename__,
+            Change.op == ChangeOp.DELETE.value,
+            Change.created_at >= after,
+        ]
+        if until is not None:
+            expressions.append(Change.created_at <= until)
+        elif settings.CHANGES_SETTLE_SECONDS:
+            expressions.append(Change.created_at < settled_before())
+        return select(Change.object_id).filter(*expressions).distinct()
+
+    def insert_stmt(self) -> "Insert":
+        return insert(self.model)
+
+    def inserted_ids_stmt(self, objs_in: List[Dict[str, Any]], unique_fields: Sequence[str]) -> "Select":
+        """
+        Ids of the rows `objs_in` inserted, looked up by their `unique_fields`
+        """
+        columns = [getattr(self.model, field) for field in unique_fields]
+        values = [tuple(obj_in[field] for field in unique_fields) for obj_in in objs_in]
+        if len(columns) == 1:
+            condition = columns[0].in_([value[0] for value in values])
+        else:
+            condition = tuple_(*columns).in_(values)
+        return select(self.model.id).where(condition, *self.live_expressions())
+
+    def remove_stmt(self, expressions: Iterable["ColumnElement"]) -> "Delete":
+        return delete(self.model).where(*expressions)
+
+    def check_bulk_create(self, unique_fields: Optional[Sequence[str]]) -> None:
+        if self.track_changes and not unique_fields:
+            raise ValueError(f'{self.__class__.__name__} tracks changes, bulk_create requires unique_fields')
+
+    def build(self, obj_in: Union[dict, CreateSchemaType]) -> Tuple[ModelType, Dict[str, Any]]:
+        """
+        New instance of the model and the values it was built from
+        """
+        obj_in_data = obj_in if isinstance(obj_in, dict) else obj_in.model_dump()
+        return self.model(**obj_in_data), obj_in_data  # type: ignore
+
+    @staticmethod
+    def apply_update(db_obj: ModelType, obj_in: Union[UpdateSchemaType, Dict[str, Any]]) -> List[str]:
+        """
+        Set the fields of `obj_in` on `db_obj`, return the names of those which changed
+        """
+        obj_data = jsonable_encoder(db_obj, custom_encoder={Choices: lambda x: x.value})
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        else:
+            update_data = obj_in.model_dump(exclude_unset=True)
+
+        changed = []
+        for field in obj_data:
+            if field in update_data:
+                if getattr(db_obj, field) != update_data[field]:
+                    changed.append(field)
+                setattr(db_obj, field, update_data[field])
+        return changed
+
+    def counted_values(self, obj: Union[ModelType, Mapping[str, Any]]) -> Dict[str, Any]:
+        """
+        Fields of a row or of a dict to insert the `counters` depend on, missing keys get the column default
+        """
+        fields = {field for counter in self.counters for field in (counter.foreign_key, counter.condition) if field}
+        if not isinstance(obj, Mapping):
+            return {field: getattr(obj, field) for field in fields}
+        values = {}
+        for field in fields:
+            default = self.model.__table__.c[field].default
+            if field in obj:
+                values[field] = obj[field]
+            elif default is not None and default.is_scalar:
+                values[field] = default.arg
+        return values
+
+    def counter_updates(
+            self,
+            removed: Iterable[Union[ModelType, Mapping[str, Any]]] = (),
+            added: Iterable[Union[ModelType, Mapping[str, Any]]] = (),
+    ) -> List[Tuple["Update", List[dict]]]:
+        """
+        Statements and their executemany parameters moving the `counters` by the rows removed and added
+        """
+        if not self.counters:
+            return []
+        return counter_updates(
+            self.counters,
+            removed=[self.counted_values(obj) for obj in removed],
+            added=[self.counted_values(obj) for obj in added],
+        )
+
+    def recount_stmts(self, target_ids: Iterable[int]) -> List["Update"]:
+        """
+        Statements repairing the `counters` of `target_ids` from the actual rows
+        """
+        return recount_stmts(self.counters, self.model.__table__, target_ids)
+
+    def reference_recount_stmts(self, obj: ModelType) -> List["Update"]:
+        """
+        Statements recounting the counters `obj` takes part in through relation rows, after it is soft deleted
+        """
+        if not self.soft_delete:
+            return []
+        return reference_recount_stmts(self.model.__table__, getattr(obj, self.primary_field))
+
+    def chunked_ids(self, obj_ids: Iterable[Union[int, UUID]]) -> Iterator[List[Union[int, UUID]]]:
+        """
+        Distinct `obj_ids` in chunks of `BATCH_CHUNK_SIZE`, one `IN` list each
+        """
+        unique_ids = list(dict.fromkeys(obj_ids))
+        for start in range(0, len(unique_ids), settings.BATCH_CHUNK_SIZE):
+            yield unique_ids[start:start + settings.BATCH_CHUNK_SIZE]
+
+    def in_request_order(
+            self, obj_ids: Iterable[Union[int, UUID]], rows: Iterable[ModelType],
+    ) -> List[Optional[ModelType]]:
+        found = {getattr(row, self.primary_field): row for row in rows}
+        return [found.get(obj_id) for obj_id in obj_ids]
+
+    @staticmethod
+    def paginate(rows: List[ModelType], limit: int) -> Tuple[List[ModelType], bool]:
+        """
+        Split the `limit + 1` rows of a keyset page into the page and whether more rows follow
+        """
+        return rows[:limit], len(rows) > limit
+
+
+class CRUDBaseSync(CRUDStatements[ModelType]):
+    """
+    Repository on the sync driver, for batch scripts, same semantics as `CRUDBase`
+    """
+    __slots__ = ()
 
     def first(
             self,
@@ -54,29 +444,63 @@ class CRUDBaseSync(Generic[ModelType]):
         :param expressions:
         :return:
         """
-
-        stmt = select(self.model)
-        if options:
-            stmt = stmt.options(*options)
-        if expressions:
-            stmt = stmt.filter(*expressions)
-        if params:
-            stmt = stmt.filter_by(**params)
-        if order_by:
-            stmt = stmt.order_by(*order_by)
+        stmt = self.filter_stmt(params=params, options=options, order_by=order_by, expressions=expressions)
         return db.execute(stmt).scalars().first()
 
-    def create(self, db: "Session", obj_in: dict) -> ModelType:
-        obj_in_data = jsonable_encoder(obj_in, custom_encoder={Choices: lambda x: x.value})
-        db_obj = self.model(**obj_in_data)  # type: ignore
+    def create(self, db: "Session", obj_in: Union[dict, CreateSchemaType]) -> ModelType:
+        db_obj, obj_in_data = self.build(obj_in)
         db.add(db_obj)
+        if self.track_changes:
+            db.flush()
+            add_change(db, db_obj, ChangeOp.CREATE.value, obj_in_data)
+        for stmt, params in self.counter_updates(added=[obj_in_data]):
+            db.execute(stmt, params)
         db.commit()
         db.refresh(db_obj)
         return db_obj
 
+    def bulk_create(
+            self, db: "Session", *,
+            objs_in: List[Dict[str, Any]],
+            unique_fields: Optional[Sequence[str]] = None,
+    ) -> Dict[int, str]:
+        """
+        Insert rows with one multi-row INSERT, without committing, see `CRUDBase.bulk_create`
+        :param db:
+        :param objs_in: dicts with the same keys
+        :param unique_fields: fields identifying the inserted rows, required by `track_changes`
+        :return:
+        """
+        if not objs_in:
+            return {}
+        self.check_bulk_create(unique_fields)
+        stmt = self.insert_stmt()
+        errors = {}
+        try:
+            with db.begin_nested():
+                db.execute(stmt, objs_in)
+        except DBAPIError:
+            for index, obj_in in enumerate(objs_in):
+                try:
+                    with db.begin_nested():
+                        db.execute(stmt, [obj_in])
+                except DBAPIError as e:
+                    errors[index] = str(e.orig)
+
+        created = [obj_in for index, obj_in in enumerate(objs_in) if index not in errors]
+        if self.track_changes and created:
+            object_ids = db.execute(self.inserted_ids_stmt(created, unique_fields)).scalars().all()
+            if object_ids:
+                db.execute(insert(Change), change_rows(
+                    self.model.__tablename__, object_ids, ChangeOp.CREATE.value, created[0]
+                ))
+        for stmt, params in self.counter_updates(added=created):
+            db.execute(stmt, params)
+        return errors
+
     def count(
             self, db: "Session", *,
-            expressions: Optional[list] = None,
+            expressions: Optional[Iterable] = (),
             params: Optional[dict] = None,
     ) -> int:
         """
@@ -86,19 +510,11 @@ class CRUDBaseSync(Generic[ModelType]):
         :param params:
         :return:
         """
-        if params is None:
-            params = {}
-
-        stmt = select(func.count(self.model.id))
-        if expressions:
-            stmt = stmt.filter(*expressions)
-        if params:
-            stmt = stmt.filter_by(**params)
-        return db.execute(stmt).scalar_one()
+        return db.execute(self.count_stmt(expressions=expressions, params=params)).scalar_one()
 
     def exists(
             self, db: "Session",
-            expressions: Optional[Iterable] = None,
+            expressions: Optional[Iterable] = (),
             params: Optional[dict] = None,
     ) -> Any:
         """
@@ -108,78 +524,72 @@ class CRUDBaseSync(Generic[ModelType]):
         :param params:
         :return:
         """
-        stmt = select(self.model)
-        if expressions:
-            stmt = stmt.filter(*expressions)
-        if params:
-            stmt = stmt.filter_by(**params)
-        return db.execute(select(stmt.exists())).scalar_one()
+        return db.execute(self.exists_stmt(expressions=expressions, params=params)).scalar_one()
+
+    def live_parent_ids(self, db: "Session", objs_in: Iterable[Mapping[str, Any]]) -> Dict[str, Set]:
+        """
+        Ids of the live rows among the soft deletable rows `objs_in` reference, by foreign key field
+        """
+        live_ids = defaultdict(set)
+        stmt = self.live_parent_ids_stmt(objs_in)
+        if stmt is not None:
+            for field, obj_id in db.execute(stmt):
+                live_ids[field].add(obj_id)
+        return live_ids
+
+    def dead_parents(self, db: "Session", obj_in: Mapping[str, Any]) -> List[str]:
+        """
+        Fields of `obj_in` referencing a missing or soft deleted row
+        """
+        return self.dead_parent_fields(obj_in, self.live_parent_ids(db, [obj_in]))
 
     def get_all(
             self,
             db: "Session",
             *,
-            offset: int = 0,
-            limit: int = 100,
+            offset: Optional[int] = 0,
+            limit: Optional[int] = 100,
             q: Optional[dict] = None,
-            order_by: Optional[Iterable[str]] = None,
-            options: Optional[Iterable] = None,
-            expressions: Optional[Iterable] = None,
-    ) -> Iterable:
+            order_by: Optional[Iterable] = (),
+            options: Optional[Iterable] = (),
+            expressions: Optional[Iterable] = (),
+    ) -> List[ModelType]:
         """
 
         :param db: sqlalchemy.orm.Session
         :param offset:
         :param limit:
         :param q:
-        :param order_by:
-        :param expressions:
+        :param order_by: field names, `-name` for descending, or column expressions
         :param options:
+        :param expressions:
         :return:
         """
-        stmt = select(self.model)
-
-        if options:
-            stmt = stmt.options(*options)
-        if expressions:
-            stmt = stmt.filter(*expressions)
-        if q:
-            stmt = stmt.filter_by(**q)
-        if not order_by:
-            sort = (getattr(self.model, self.primary_field).desc(),)
-        else:
-            sort = tuple(text(f'{i[1:]} DESC') if i.startswith('-') else text(f'{i} ASC') for i in order_by)
-        stmt = stmt.order_by(*sort).offset(offset=offset).limit(limit=limit)
-
-        result = db.execute(stmt).scalars().fetchall()
-        return result
+        return db.execute(self.get_all_stmt(
+            offset=offset, limit=limit, q=q, order_by=order_by, options=options, expressions=expressions,
+        )).scalars().fetchall()
 
     def get_by_params(
             self, db: "Session",
-
-            options: Optional[Iterable] = (),
             expressions: Optional[Iterable] = (),
-            params: Optional[dict] = None
+            options: Optional[Iterable] = (),
+            params: Optional[dict] = None,
     ) -> ModelType:
         """
         Retrieve items by params
         :param db:
-        :param options:
         :param expressions:
+        :param options:
         :param params:
         :return:
         """
-        if params is None:
-            params = {}
-        result = db.execute(select(self.model).options(*options).filter(*expressions).filter_by(**params))
-
-        return result.scalar_one()
+        return db.execute(self.filter_stmt(params=params, expressions=expressions, options=options)).scalar_one()
 
     def get(
             self,
             db: "Session",
             obj_id: Union[int, UUID],
-            options: Optional[Iterable] = ()
+            options: Optional[Iterable] = (),
     ) -> ModelType:
         """
         Retrieve obj, if does not exist raise exception
@@ -188,62 +598,116 @@ class CRUDBaseSync(Generic[ModelType]):
         :param options:
         :return:
         """
-        result = db.execute(select(self.model).options(*options).where(self.model.id == obj_id))
+        return db.execute(self.get_stmt(obj_id, options=options)).scalar_one()
 
-        return result.scalar_one()
+    def get_many(
+            self,
+            db: "Session",
+            obj_ids: Sequence[Union[int, UUID]],
+            options: Optional[Iterable] = (),
+    ) -> List[Optional[ModelType]]:
+        """
+        Rows of `obj_ids` in the same order, None for missing ones, see `CRUDBase.get_many`
+        """
+        rows = []
+        for chunk in self.chunked_ids(obj_ids):
+            rows.extend(db.execute(self.get_many_stmt(chunk, options=options)).scalars())
+        return self.in_request_order(obj_ids, rows)
+
+    def get_modified_since(
+            self,
+            db: "Session",
+            *,
+            after: Tuple[datetime, int],
+            limit: Optional[int] = 100,
+    ) -> Tuple[List[ModelType], List[int], bool]:
+        """
+        Incremental sync page, see `CRUDBase.get_modified_since`
+        """
+        rows = db.execute(self.modified_since_stmt(after=after, limit=limit + 1)).scalars().all()
+        rows, has_more = self.paginate(rows, limit)
+        if not self.track_changes:
+            return rows, [], has_more
+        until = rows[-1].modified_at if has_more else None
+        deleted = db.execute(self.deleted_since_stmt(after=after[0], until=until)).scalars().all()
+        return rows, deleted, has_more
 
-    @staticmethod
     def update(
+            self,
             db: "Session",
             db_obj: ModelType,
-            obj_in: Dict[str, Any]
+            obj_in: Union[UpdateSchemaType, Dict[str, Any]]
     ) -> ModelType:
-        obj_data = jsonable_encoder(db_obj, custom_encoder={Choices: lambda x: x.value})
-        obj_in = jsonable_encoder(obj_in, custom_encoder={Choices: lambda x: x.value})
-        for field in obj_data:
-            if field in obj_in:
-                setattr(db_obj, field, obj_in[field])
+        before = self.counted_values(db_obj)
+        changed = self.apply_update(db_obj, obj_in)
         db.add(db_obj)
+        if self.track_changes and changed:
+            add_change(db, db_obj, ChangeOp.UPDATE.value, changed)
+        if changed:
+            for stmt, params in self.counter_updates(removed=[before], added=[db_obj]):
+                db.execute(stmt, params)
         db.commit()
         db.refresh(db_obj)
         return db_obj
 
-    @staticmethod
     def delete(
+            self,
             db: "Session",
             db_obj: ModelType
     ) -> ModelType:
         """
-        Delete obj
+        Delete obj, with `soft_delete` only mark it deleted
         :param db_obj:
         :param db:
         :return:
         """
-        db.delete(db_obj)
+        # Read before the row is gone
+        counted = self.counted_values(db_obj)
+        if self.soft_delete:
+            db_obj.deleted_at = func.now()
+            db.add(db_obj)
+        else:
+            db.delete(db_obj)
+        if self.track_changes:
+            add_change(db, db_obj, ChangeOp.DELETE.value)
+        for stmt, params in self.counter_updates(removed=[counted]):
+            db.execute(stmt, params)
+        recounts = self.reference_recount_stmts(db_obj)
+        if recounts:
+            # Sessions don't autoflush, the recounts must see `deleted_at`
+            db.flush()
+        for stmt in recounts:
+            db.execute(stmt)
         db.commit()
+        if self.soft_delete:
+            db.refresh(db_obj)
         return db_obj
 
-    def remove(self, db: "Session", expressions: list):
-        statement = delete(self.model).where(*expressions)
-        result = db.execute(statement)
+    def remove(self, db: "Session", expressions: Iterable["ColumnElement"]):
+        """
+        Hard delete the matching rows with one statement, skips soft delete, the change outbox and
+        the counters, which `recount` repairs
+        """
+        result = db.execute(self.remove_stmt(expressions))
         db.commit()
         return result
 
-
-class CRUDBase(Generic[ModelType]):
-    __slots__ = ('model', 'primary_field')
-
-    def __init__(self, model: Type[ModelType]):
+    def recount(self, db: "Session", target_ids: Iterable[int]) -> None:
         """
-        CRUD object with default methods to Create, Read, Update, Delete (CRUD).
+        Set the `counters` of `target_ids` from the actual rows, without committing
+        """
+        for stmt in self.recount_stmts(target_ids):
+            db.execute(stmt)
 
-        **Parameters**
 
+class CRUDBase(CRUDStatements[ModelType]):
+    __slots__ = ()
 
-        * `model`: A SQLAlchemy model class
-        * `schema`: A Pydantic model (schema) class
+    async def read(self, async_db: "AsyncSession", statement: "Executable") -> "Result":
         """
-        self.model = model
+        Execute a read statement, see `execute_read`
+        """
+        return await execute_read(async_db, statement)
 
     async def count(
             self, async_db: "AsyncSession", *,
@@ -257,9 +721,7 @@ class CRUDBase(Generic[ModelType]):
         :param params:
         :return:
         """
-        if params is None:
-            params = {}
-        query = await async_db.execute(select(func.count(self.model.id)).filter(*expressions).filter_by(**params))
+        query = await self.read(async_db, self.count_stmt(expressions=expressions, params=params))
         return query.scalar_one()
 
     async def exists(
@@ -274,11 +736,26 @@ class CRUDBase(Generic[ModelType]):
         :param params:
         :return:
         """
-        if params is None:
-            params = {}
-        query = await async_db.execute(select(select(self.model).filter(*expressions).filter_by(**params).exists()))
+        query = await self.read(async_db, self.exists_stmt(expressions=expressions, params=params))
         return query.scalar_one()
 
+    async def live_parent_ids(self, async_db: "AsyncSession", objs_in: Iterable[Mapping[str, Any]]) -> Dict[str, Set]:
+        """
+        Ids of the live rows among the soft deletable rows `objs_in` reference, by foreign key field
+        """
+        live_ids = defaultdict(set)
+        stmt = self.live_parent_ids_stmt(objs_in)
+        if stmt is not None:
+            for field, obj_id in await self.read(async_db, stmt):
+                live_ids[field].add(obj_id)
+        return live_ids
+
+    async def dead_parents(self, async_db: "AsyncSession", obj_in: Mapping[str, Any]) -> List[str]:
+        """
+        Fields of `obj_in` referencing a missing or soft deleted row
+        """
+        return self.dead_parent_fields(obj_in, await self.live_parent_ids(async_db, [obj_in]))
+
     async def get_by_params(
             self, async_db: "AsyncSession",
             expressions: Optional[Iterable] = (),
@@ -292,11 +769,7 @@ class CRUDBase(Generic[ModelType]):
         :param params:
         :return:
         """
-        if params is None:
-            params = {}
-        select_q = select(self.model).options(*options).filter(*expressions).filter_by(**params)
-        result = await async_db.execute(select_q)
-
+        result = await self.read(async_db, self.filter_stmt(params=params, expressions=expressions, options=options))
         return result.scalar_one()
 
     async def first(
@@ -306,6 +779,7 @@ class CRUDBase(Generic[ModelType]):
             params: Optional[dict] = None,
             expressions: Optional[Iterable] = (),
             options: Optional[Iterable] = (),
+            order_by: Optional[Iterable] = (),
     ) -> Optional[ModelType]:
         """
         Soft retrieve obj
@@ -313,12 +787,12 @@ class CRUDBase(Generic[ModelType]):
         :param params:
         :param expressions:
         :param options:
+        :param order_by:
         :return:
         """
-        if params is None:
-            params = {}
-        select_q = select(self.model).options(*options).filter(*expressions).filter_by(**params)
-        result = await async_db.execute(select_q)
+        result = await self.read(
+            async_db, self.filter_stmt(params=params, expressions=expressions, options=options, order_by=order_by)
+        )
         return result.scalars().first()
 
     async def get(
@@ -334,10 +808,29 @@ class CRUDBase(Generic[ModelType]):
         :param obj_id:
         :return:
         """
-        result = await async_db.execute(select(self.model).options(*options).where(self.model.id == obj_id))
-
+        result = await self.read(async_db, self.get_stmt(obj_id, options=options))
         return result.scalar_one()
 
+    async def get_many(
+            self,
+            async_db: "AsyncSession",
+            obj_ids: Sequence[Union[int, UUID]],
+            options: Optional[Iterable] = (),
+    ) -> List[Optional[ModelType]]:
+        """
+        Retrieve the rows of `obj_ids` in the same order, duplicates included, None for ids which
+        do not exist. One `IN` query per `BATCH_CHUNK_SIZE` distinct ids.
+        :param async_db:
+        :param obj_ids:
+        :param options:
+        :return:
+        """
+        rows = []
+        for chunk in self.chunked_ids(obj_ids):
+            result = await self.read(async_db, self.get_many_stmt(chunk, options=options))
+            rows.extend(result.scalars())
+        return self.in_request_order(obj_ids, rows)
+
     async def get_all(
             self,
             async_db: "AsyncSession",
@@ -348,71 +841,175 @@ class CRUDBase(Generic[ModelType]):
             order_by: Optional[Iterable] = (),
             options: Optional[Iterable] = (),
             expressions: Optional[Iterable] = (),
-    ):
+    ) -> List[ModelType]:
         """
 
         :param async_db:
         :param offset:
         :param limit:
         :param q:
-        :param order_by:
+        :param order_by: field names, `-name` for descending, or column expressions
         :param options:
         :param expressions:
         :return:
         """
-        if q is None:
-            q = {}
-        result = await async_db.execute(
-            select(self.model).options(*options).filter(*expressions).filter_by(**q).order_by(
-                *order_by).offset(offset).limit(limit)
-        )
+        result = await self.read(async_db, self.get_all_stmt(
+            offset=offset, limit=limit, q=q, order_by=order_by, options=options, expressions=expressions,
+        ))
         return result.scalars().fetchall()
 
+    async def get_modified_since(
+            self,
+            async_db: "AsyncSession",
+            *,
+            after: Tuple[datetime, int],
+            limit: Optional[int] = 100,
+    ) -> Tuple[List[ModelType], List[int], bool]:
+        """
+        Incremental sync page: rows modified after the `(modified_at, id)` keyset position
+        in that order, ids deleted in the same span, and whether more rows follow.
+
+        Deletes come from the change outbox, so only repositories with `track_changes`
+        report them. They may be reported again by a later page, never skipped.
+        :param async_db:
+        :param after: position of the last row seen, `(updated_since, 0)` to start
+        :param limit:
+        :return:
+        """
+        result = await self.read(async_db, self.modified_since_stmt(after=after, limit=limit + 1))
+        rows, has_more = self.paginate(result.scalars().all(), limit)
+        if not self.track_changes:
+            return rows, [], has_more
+        until = rows[-1].modified_at if has_more else None
+        result = await self.read(async_db, self.deleted_since_stmt(after=after[0], until=until))
+        return rows, result.scalars().all(), has_more
+
     async def create(self, async_db: "AsyncSession", *, obj_in: Union[dict, CreateSchemaType]) -> ModelType:
-        # obj_in_data = jsonable_encoder(obj_in, custom_encoder={Choices: lambda x: x.value})
-        if isinstance(obj_in, dict):
-            # obj_in_data = jsonable_encoder(obj_in, custom_encoder={Choices: lambda x: x.value})
-            obj_in_data = obj_in
-        else:
-            obj_in_data = obj_in.model_dump()
-        db_obj = self.model(**obj_in_data)  # type: ignore
-        async_db.add(db_obj)
-        await async_db.commit()
+        async def transaction() -> ModelType:
+            db_obj, obj_in_data = self.build(obj_in)
+            async_db.add(db_obj)
+            if self.track_changes:
+                await async_db.flush()
+                add_change(async_db, db_obj, ChangeOp.CREATE.value, obj_in_data)
+            for stmt, params in self.counter_updates(added=[obj_in_data]):
+                await async_db.execute(stmt, params)
+            return db_obj
+
+        db_obj = await execute_write(async_db, transaction)
         await async_db.refresh(db_obj)
         return db_obj
 
-    @staticmethod
+    async def bulk_create(
+            self, async_db: "AsyncSession", *,
+            objs_in: List[Dict[str, Any]],
+            unique_fields: Optional[Sequence[str]] = None,
+    ) -> Dict[int, str]:
+        """
+        Insert rows with one multi-row INSERT, without committing.
+
+        When the statement fails the rows are inserted one by one, each in its own
+        savepoint, and the errors of the rejected rows are returned by index.
+        :param async_db:
+        :param objs_in: dicts with the same keys
+        :param unique_fields: fields identifying the inserted rows, required by `track_changes`
+        :return:
+        """
+        if not objs_in:
+            return {}
+        self.check_bulk_create(unique_fields)
+        stmt = self.insert_stmt()
+        errors = {}
+        try:
+            async with async_db.begin_nested():
+                await async_db.execute(stmt, objs_in)
+        except DBAPIError:
+            for index, obj_in in enumerate(objs_in):
+                try:
+                    async with async_db.begin_nested():
+                        await async_db.execute(stmt, [obj_in])
+                except DBAPIError as e:
+                    errors[index] = str(e.orig)
+
+        created = [obj_in for index, obj_in in enumerate(objs_in) if index not in errors]
+        if self.track_changes and created:
+            result = await async_db.execute(self.inserted_ids_stmt(created, unique_fields))
+            object_ids = result.scalars().all()
+            if object_ids:
+                await async_db.execute(insert(Change), change_rows(
+                    self.model.__tablename__, object_ids, ChangeOp.CREATE.value, created[0]
+                ))
+        for stmt, params in self.counter_updates(added=created):
+            await async_db.execute(stmt, params)
+        return errors
+
     async def update(
+            self,
             async_db: "AsyncSession",
             *,
             db_obj: ModelType,
             obj_in: Union[UpdateSchemaType, Dict[str, Any]]
     ) -> ModelType:
-        obj_data = jsonable_encoder(db_obj, custom_encoder={Choices: lambda x: x.value})
-        if isinstance(obj_in, dict):
-            update_data = obj_in
-        else:
-            update_data = obj_in.model_dump(exclude_unset=True)
-
-        for field in obj_data:
-            if field in update_data:
-                setattr(db_obj, field, update_data[field])
-        async_db.add(db_obj)
-        await async_db.commit()
+        async def transaction() -> None:
+            before = self.counted_values(db_obj)
+            changed = self.apply_update(db_obj, obj_in)
+            async_db.add(db_obj)
+            if self.track_changes and changed:
+                add_change(async_db, db_obj, ChangeOp.UPDATE.value, changed)
+            if changed:
+                for stmt, params in self.counter_updates(removed=[before], added=[db_obj]):
+                    await async_db.execute(stmt, params)
+
+        await execute_write(async_db, transaction)
         await async_db.refresh(db_obj)
         return db_obj
 
-    @staticmethod
     async def delete(
+            self,
             async_db: "AsyncSession", *,
-            db_obj: Union[CreateSchemaType, Dict[str, Any]]
+            db_obj: ModelType
     ) -> ModelType:
         """
-        Delete obj
+        Delete obj, with `soft_delete` only mark it deleted
         :param db_obj:
         :param async_db:
         :return:
         """
-        await async_db.delete(db_obj)
-        await async_db.commit()
+        async def transaction() -> None:
+            # Read before the row is gone
+            counted = self.counted_values(db_obj)
+            if self.soft_delete:
+                db_obj.deleted_at = func.now()
+                async_db.add(db_obj)
+            else:
+                await async_db.delete(db_obj)
+            if self.track_changes:
+                add_change(async_db, db_obj, ChangeOp.DELETE.value)
+            for stmt, params in self.counter_updates(removed=[counted]):
+                await async_db.execute(stmt, params)
+            recounts = self.reference_recount_stmts(db_obj)
+            if recounts:
+                # Sessions don't autoflush, the recounts must see `deleted_at`
+                await async_db.flush()
+            for stmt in recounts:
+                await async_db.execute(stmt)
+
+        await execute_write(async_db, transaction)
+        if self.soft_delete:
+            await async_db.refresh(db_obj)
         return db_obj
+
+    async def remove(self, async_db: "AsyncSession", expressions: Iterable["ColumnElement"]):
+        """
+        Hard delete the matching rows with one statement, skips soft delete, the change outbox and
+        the counters, which `recount` repairs
+        """
+        return await execute_write(async_db, lambda: async_db.execute(self.remove_stmt(expressions)))
+
+    async def recount(self, async_db: "AsyncSession", target_ids: Iterable[int]) -> None:
+        """
+        Set the `counters` of `target_ids` from the actual rows, without committing.
+
+        Repairs drift left by writes which skip the counters, e.g. `remove` and cascades.
+        """
+        for stmt in self.recount_stmts(target_ids):
+            await async_db.execute(stmt)
@@ -0,0 +1,144 @@
+from typing import Optional, Callable, Awaitable, TypeVar, TYPE_CHECKING
+
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+from tenacity import AsyncRetrying, RetryCallState, wait_random_exponential
+
+from app.conf.config import settings
+from app.core.circuit_breaker import CLOSED
+from app.core.metrics import get_request_metrics
+from app.db.events import get_circuit_breaker
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+T = TypeVar("T")
+
+DEADLOCK = 1213
+LOCK_WAIT_TIMEOUT = 1205
+SERVER_GONE_AWAY = 2006
+LOST_CONNECTION = 2013
+# Errors after which the server rolled back or never saw the statement, safe to replay writes
+TRANSACTION_ERROR_CODES = frozenset({DEADLOCK, LOCK_WAIT_TIMEOUT, SERVER_GONE_AWAY})
+# A connection lost mid-statement may have committed, only reads are replayed after it
+READ_ERROR_CODES = TRANSACTION_ERROR_CODES | {LOST_CONNECTION}
+# Loaded objects are refreshed after the rollback of a replay, sessions holding more are not replayed
+MAX_REFRESHED_OBJECTS = 10
+
+# Session `info` keys
+_WRITES_KEY = 'transaction_writes'
+_RETRY_BUDGET_KEY = 'retry_budget'
+_BUDGET_INFO_KEY = 'retry_budget_info'
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    session.info[_WRITES_KEY] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _do_orm_execute(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[_WRITES_KEY] = True
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_WRITES_KEY, None)
+
+
+def error_code(error: BaseException) -> Optional[int]:
+    orig = getattr(error, 'orig', None)
+    args = getattr(orig, 'args', None)
+    return args[0] if args else None
+
+
+def _budget_info(async_db: "AsyncSession") -> dict:
+    return async_db.info.get(_BUDGET_INFO_KEY, async_db.info)
+
+
+def share_retry_budget(async_db: "AsyncSession") -> dict:
+    """
+    `info` of a session replaying from the budget of `async_db`, for sessions opened on its behalf
+    """
+    return {_BUDGET_INFO_KEY: _budget_info(async_db)}
+
+
+def can_replay(async_db: "AsyncSession") -> bool:
+    """
+    Whether a rollback would lose nothing but the operation about to run: the session
+    owns its transaction, neither wrote nor holds unflushed changes yet, and has few
+    enough objects loaded to refresh them.
+
+    Sessions bound to a connection, as in a batch or a test, are never replayed.
+    """
+    return (
+            settings.DATABASE_RETRY_ATTEMPTS > 1
+            and isinstance(async_db.bind, AsyncEngine)
+            and not async_db.info.get(_WRITES_KEY)
+            and not (async_db.new or async_db.dirty or async_db.deleted)
+            and len(async_db.identity_map) <= MAX_REFRESHED_OBJECTS
+    )
+
+
+async def run_with_retry(
+        async_db: "AsyncSession",
+        operation: Callable[[], Awaitable[T]],
+        *,
+        transaction: Optional[bool] = False,
+) -> T:
+    """
+    Run `operation`, a read or with `transaction` a whole write transaction ending with a
+    commit, and replay it after deadlocks, lock wait timeouts and lost connections.
+
+    The session is rolled back and the objects it had loaded are refreshed before a
+    replay, waits are jittered and grow exponentially. Each session, one per request,
+    replays at most `DATABASE_RETRY_BUDGET` times, sessions it shared its budget with
+    included (see `share_retry_budget`), none while its database circuit is not closed.
+    """
+    if not can_replay(async_db):
+        return await operation()
+    codes = TRANSACTION_ERROR_CODES if transaction else READ_ERROR_CODES
+    loaded = list(async_db.identity_map.values())
+
+    def should_retry(retry_state: RetryCallState) -> bool:
+        error = retry_state.outcome.exception()
+        if not isinstance(error, DBAPIError) or error_code(error) not in codes:
+            return False
+        if retry_state.attempt_number >= settings.DATABASE_RETRY_ATTEMPTS:
+            return False
+        budget_info = _budget_info(async_db)
+        budget = budget_info.get(_RETRY_BUDGET_KEY, settings.DATABASE_RETRY_BUDGET)
+        breaker = get_circuit_breaker(async_db.bind.sync_engine)
+        if budget <= 0 or (breaker is not None and breaker.state != CLOSED):
+            return False
+        budget_info[_RETRY_BUDGET_KEY] = budget - 1
+        return True
+
+    def before_sleep(retry_state: RetryCallState) -> None:
+        error = retry_state.outcome.exception()
+        metrics = get_request_metrics()
+        if metrics is not None:
+            metrics.add_retry()
+        logger.warning(
+            "Retrying after MySQL error {code} in {wait:.3f}s, attempt {attempt}",
+            code=error_code(error), wait=retry_state.next_action.sleep, attempt=retry_state.attempt_number,
+        )
+
+    retrying = AsyncRetrying(
+        wait=wait_random_exponential(multiplier=settings.DATABASE_RETRY_BACKOFF, max=settings.DATABASE_RETRY_MAX_BACKOFF),
+        retry=should_retry,
+        before_sleep=before_sleep,
+        reraise=True,
+    )
+    async for attempt in retrying:
+        with attempt:
+            if attempt.retry_state.attempt_number > 1:
+                await async_db.rollback()
+                for obj in loaded:
+                    await async_db.refresh(obj)
+            return await operation()
@@ -1,28 +1,58 @@
+from functools import lru_cache
+from typing import AsyncIterator, AsyncIterable, Iterable, Optional
+
 from pydantic import MySQLDsn
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
 
 from app.conf.config import settings
+from app.db.events import setup_circuit_breaker
 
 
-def get_database_uri(database: str):
+def get_database_uri(database: str, host: Optional[str] = None, port: Optional[int] = None):
     return MySQLDsn.build(
         scheme='mysql+aiomysql',
-        host=settings.DATABASE_HOST,
+        host=host or settings.DATABASE_HOST,
         username=settings.DATABASE_USER,
-        port=settings.DATABASE_PORT,
+        port=port or settings.DATABASE_PORT,
         password=settings.DATABASE_PASSWORD,
         path=database,
     )
 
 
-def get_async_session(database: str):
-    database_uri = str(get_database_uri(database))
-    async_engine = create_async_engine(database_uri, pool_pre_ping=True, echo=False)
+# Sessions flagged with this `info` key are closed by `ServiceRoute` as soon as the endpoint returns
+RELEASE_AFTER_ENDPOINT = 'release_after_endpoint'
+
+
+def get_async_session(database: str, host: Optional[str] = None, port: Optional[int] = None):
+    """
+    Return the session factory and engine of `database`, created once per process.
+    `host` and `port` default to `DATABASE_HOST` and `DATABASE_PORT`.
+    """
+    return _get_async_session(database, host or settings.DATABASE_HOST, port or settings.DATABASE_PORT)
+
+
+@lru_cache(maxsize=None)
+def _get_async_session(database: str, host: str, port: int):
+    database_uri = str(get_database_uri(database, host, port))
+    async_engine = create_async_engine(
+        database_uri,
+        pool_pre_ping=True,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+        connect_args={'connect_timeout': settings.DATABASE_CONNECT_TIMEOUT},
+        echo=False,
+    )
+    if settings.CIRCUIT_BREAKER_ENABLED:
+        setup_circuit_breaker(async_engine.sync_engine)
 
     db_uri = database_uri.replace('+aiomysql', '+pymysql')
-    engine = create_engine(db_uri, pool_pre_ping=True, echo=False)
+    engine = create_engine(
+        db_uri, pool_pre_ping=True, connect_args={'connect_timeout': settings.DATABASE_CONNECT_TIMEOUT}, echo=False,
+    )
 
     session_local = sessionmaker(
         expire_on_commit=True,
@@ -42,3 +72,15 @@ def get_async_session(database: str):
     )
 
     return async_session_local, async_engine
+
+
+async def close_after_iteration(iterator: AsyncIterable, sessions: Iterable[AsyncSession]) -> AsyncIterator:
+    """
+    Yield from `iterator` and close `sessions` once it is exhausted or abandoned
+    """
+    try:
+        async for chunk in iterator:
+            yield chunk
+    finally:
+        for session in sessions:
+            await session.close()
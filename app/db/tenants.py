@@ -0,0 +1,164 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, NamedTuple
+
+import sqlalchemy as sa
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.conf.config import settings
+from app.core.exceptions import ImproperlyConfigured
+
+# Control table, kept apart from the tenant schema in `app.db.models.metadata`
+directory_metadata = sa.MetaData()
+
+tenants = sa.Table(
+    'tenants', directory_metadata,
+    sa.Column('audience', sa.String(255), primary_key=True),
+    sa.Column('database_name', sa.String(64), nullable=False),
+    sa.Column('host', sa.String(255), nullable=True),
+    sa.Column('port', sa.Integer, nullable=True),
+    sa.Column('is_active', sa.Boolean, nullable=False, default=True, server_default=sa.true()),
+)
+
+
+class Tenant(NamedTuple):
+    database: str
+    host: Optional[str] = None
+    port: Optional[int] = None
+
+    @classmethod
+    def parse(cls, value: str) -> "Tenant":
+        """
+        Tenant of a `TENANTS` value, `database` or `host[:port]/database`
+        """
+        location, _, database = value.rpartition('/')
+        if not database:
+            raise ImproperlyConfigured(f"TENANTS value `{value}` has no database")
+        if not location:
+            return cls(database)
+        host, _, port = location.partition(':')
+        try:
+            return cls(database, host, int(port) if port else None)
+        except ValueError:
+            raise ImproperlyConfigured(f"TENANTS value `{value}` has an invalid port")
+
+
+class TenantDirectory:
+    """
+    Audiences allowed to use the service and where their databases are.
+
+    Tenants come from `TENANTS` and the `tenants` table of `TENANT_DIRECTORY_DATABASE`,
+    reloaded every `TENANT_DIRECTORY_REFRESH` seconds. An audience missing from both is
+    looked up in the table once and then rejected from memory for `TENANT_NEGATIVE_TTL`
+    seconds, so unknown tenants never get an engine or a connection attempt.
+    Without either source every audience is its own database on `DATABASE_HOST`.
+    """
+    __slots__ = ('configured', 'database', 'refresh_interval', 'negative_ttl', 'negative_max_size',
+                 '_tenants', '_negative', '_loaded_at', '_lock')
+
+    def __init__(
+            self,
+            configured: Dict[str, str],
+            database: Optional[str] = None,
+            refresh_interval: Optional[float] = 60,
+            negative_ttl: Optional[float] = 30,
+            negative_max_size: Optional[int] = 10000,
+    ):
+        self.configured = {audience: Tenant.parse(value) for audience, value in configured.items()}
+        self.database = database
+        self.refresh_interval = refresh_interval
+        self.negative_ttl = negative_ttl
+        self.negative_max_size = negative_max_size
+        self._tenants: Dict[str, Tenant] = dict(self.configured)
+        self._negative: "OrderedDict[str, float]" = OrderedDict()
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.configured) or self.database is not None
+
+    def _engine(self):
+        from app.db.session import get_async_session
+        return get_async_session(self.database)[1]
+
+    async def refresh(self) -> None:
+        """
+        Reload the active tenants of the control table
+        """
+        if self.database is None:
+            return
+        async with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+                # Reloaded while waiting for the lock
+                return
+            stmt = select(tenants.c.audience, tenants.c.database_name, tenants.c.host, tenants.c.port).where(
+                tenants.c.is_active.is_(True)
+            )
+            try:
+                async with self._engine().connect() as connection:
+                    rows = (await connection.execute(stmt)).all()
+            except (SQLAlchemyError, OSError):
+                if self._loaded_at is None:
+                    raise
+                logger.exception("Tenant directory refresh failed, keeping the loaded tenants")
+                self._loaded_at = time.monotonic()
+                return
+            self._tenants = {
+                **{row.audience: Tenant(row.database_name, row.host, row.port) for row in rows},
+                **self.configured,
+            }
+            self._negative.clear()
+            self._loaded_at = time.monotonic()
+
+    async def _lookup(self, audience: str) -> Optional[Tenant]:
+        stmt = select(tenants.c.database_name, tenants.c.host, tenants.c.port).where(
+            tenants.c.audience == audience, tenants.c.is_active.is_(True),
+        )
+        async with self._engine().connect() as connection:
+            row = (await connection.execute(stmt)).first()
+        return None if row is None else Tenant(row.database_name, row.host, row.port)
+
+    def _reject(self, audience: str) -> None:
+        self._negative[audience] = time.monotonic() + self.negative_ttl
+        self._negative.move_to_end(audience)
+        while len(self._negative) > self.negative_max_size:
+            self._negative.popitem(last=False)
+
+    async def get(self, audience: str) -> Optional[Tenant]:
+        """
+        Tenant of `audience`, None when it is unknown
+        """
+        if not self.enabled:
+            return Tenant(audience)
+        if self.database is not None and (
+                self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_interval
+        ):
+            await self.refresh()
+        tenant = self._tenants.get(audience)
+        if tenant is not None or self.database is None:
+            return tenant
+
+        expires_at = self._negative.get(audience)
+        if expires_at is not None and expires_at > time.monotonic():
+            return None
+        # Added since the last refresh
+        tenant = await self._lookup(audience)
+        if tenant is None:
+            self._reject(audience)
+        else:
+            self._negative.pop(audience, None)
+            self._tenants[audience] = tenant
+        return tenant
+
+
+tenant_directory = TenantDirectory(
+    configured=settings.TENANTS,
+    database=settings.TENANT_DIRECTORY_DATABASE,
+    refresh_interval=settings.TENANT_DIRECTORY_REFRESH,
+    negative_ttl=settings.TENANT_NEGATIVE_TTL,
+    negative_max_size=settings.TENANT_NEGATIVE_MAX_SIZE,
+)
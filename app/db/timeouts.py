@@ -0,0 +1,58 @@
+import asyncio
+from typing import Optional, Callable, Awaitable, TypeVar, Union, TYPE_CHECKING
+
+from sqlalchemy import event, Select
+from sqlalchemy.orm import Session
+
+from app.conf.config import settings
+from app.core.exceptions import StatementTimeout
+from app.core.statement_timeout import current_statement_timeout
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+T = TypeVar("T")
+
+# Session `info` key of the time limit in milliseconds, set for request sessions by `get_async_db`
+STATEMENT_TIMEOUT = 'statement_timeout'
+
+
+def session_timeout(session: Union[Session, "AsyncSession"]) -> Optional[int]:
+    return current_statement_timeout(session.info.get(STATEMENT_TIMEOUT))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _add_max_execution_time(orm_execute_state):
+    """
+    Let MySQL interrupt SELECTs running longer than the session limit, streams excepted
+    """
+    statement = orm_execute_state.statement
+    if not isinstance(statement, Select):
+        return
+    options = orm_execute_state.execution_options
+    if options.get('stream_results') or options.get('yield_per'):
+        return
+    milliseconds = session_timeout(orm_execute_state.session)
+    if milliseconds:
+        orm_execute_state.statement = statement.prefix_with(
+            f'/*+ MAX_EXECUTION_TIME({int(milliseconds)}) */', dialect='mysql',
+        )
+
+
+async def run_with_timeout(async_db: "AsyncSession", operation: Callable[[], Awaitable[T]]) -> T:
+    """
+    Await `operation`, giving up after the session limit plus `DATABASE_STATEMENT_TIMEOUT_GRACE_MS`.
+
+    The grace lets MySQL interrupt a SELECT itself, which keeps the connection. Past it the
+    session connection is invalidated, as the statement may still be running on it, and
+    `StatementTimeout` is raised.
+    """
+    milliseconds = session_timeout(async_db)
+    if not milliseconds:
+        return await operation()
+    timeout = (milliseconds + settings.DATABASE_STATEMENT_TIMEOUT_GRACE_MS) / 1000
+    try:
+        return await asyncio.wait_for(operation(), timeout)
+    except asyncio.TimeoutError:
+        await async_db.invalidate()
+        raise StatementTimeout(milliseconds)
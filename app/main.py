@@ -6,10 +6,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import ORJSONResponse
 from fastapi.routing import APIRoute
 
-from sqlalchemy.exc import NoResultFound
+from sqlalchemy.exc import NoResultFound, OperationalError, TimeoutError as PoolTimeoutError
 
 from app.conf.config import settings
-from app.core.handlers import request_document_raw_not_found_exception
+from app.core.exceptions import InvalidSortField, StatementTimeout
+from app.core.handlers import (
+    request_document_raw_not_found_exception, invalid_sort_field_exception, statement_timeout_exception,
+    operational_error_exception, pool_timeout_exception,
+)
+from app.core.middleware.compression import CompressionMiddleware
+from app.core.middleware.query_budget import QueryBudgetMiddleware
+from app.core.middleware.timing import TimingMiddleware
+from app.db.events import setup_query_events
 from app.routers.urls import router
 from app.routers.api import api
 
@@ -37,6 +45,10 @@ def get_application(
         generate_unique_id_function=custom_generate_unique_id,
         exception_handlers={
             NoResultFound: request_document_raw_not_found_exception,
+            InvalidSortField: invalid_sort_field_exception,
+            StatementTimeout: statement_timeout_exception,
+            OperationalError: operational_error_exception,
+            PoolTimeoutError: pool_timeout_exception,
         },
     )
     if settings.BACKEND_CORS_ORIGINS:
@@ -56,6 +68,23 @@ def get_application(
             allow_headers=["*"],
         )
 
+    if settings.COMPRESSION_ENABLED:
+        application.add_middleware(CompressionMiddleware)
+
+    query_budget_enabled = settings.QUERY_BUDGET_ENABLED
+    if query_budget_enabled is None:
+        query_budget_enabled = settings.DEBUG
+    if settings.TIMING_ENABLED or query_budget_enabled:
+        setup_query_events()
+    if query_budget_enabled:
+        application.add_middleware(QueryBudgetMiddleware, strict=settings.QUERY_BUDGET_STRICT)
+    if settings.TIMING_ENABLED:
+        application.add_middleware(
+            TimingMiddleware,
+            sample_rate=settings.TIMING_SAMPLE_RATE,
+            slow_request_ms=settings.TIMING_SLOW_REQUEST_MS,
+        )
+
     application.include_router(app_api, prefix=api_prefix)
     application.include_router(app_router)
 
@@ -1,9 +1,19 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 
 from app.contrib.user.api import api as user_api
 from app.contrib.school.api import api as school_api
+from app.contrib.job.api import api as job_api
+from app.contrib.change.api import api as change_api
+from app.contrib.batch.api import api as batch_api
+from app.contrib.auth.api import api as auth_api
+from app.routers.dependency import throttle
 
 api = APIRouter()
 
-api.include_router(user_api)
-api.include_router(school_api, tags=['schools'], prefix="/school")
+api.include_router(user_api, dependencies=[Depends(throttle)])
+api.include_router(school_api, tags=['schools'], prefix="/school", dependencies=[Depends(throttle)])
+api.include_router(job_api, dependencies=[Depends(throttle)])
+api.include_router(change_api, dependencies=[Depends(throttle)])
+api.include_router(batch_api, dependencies=[Depends(throttle)])
+# Throttled per route, refreshing carries no Google ID token to throttle by
+api.include_router(auth_api)
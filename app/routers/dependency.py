@@ -1,6 +1,12 @@
-from typing import Generator, Optional
+import base64
+import binascii
+from datetime import datetime
+from functools import lru_cache
+from typing import Generator, Optional, List, Callable
 
-from fastapi import Depends, Request, HTTPException
+from fastapi import Depends, Request, HTTPException, Query
+from fastapi.exceptions import RequestValidationError
+from pydantic_core import ErrorDetails
 from fastapi.security.utils import get_authorization_scheme_param
 from starlette.status import HTTP_401_UNAUTHORIZED
 
@@ -10,30 +16,48 @@ from google.oauth2 import id_token
 from google.auth.transport.requests import Request as GoogleRequest
 
 from app.conf.config import settings, jwt_settings
-from app.core.exceptions import HTTPInvalidToken
-from app.core.schema import CommonsModel
-from app.db.session import get_async_session
+from app.core.batch import get_batch_context
+from app.core.exceptions import (
+    HTTPInvalidToken, HTTPExpiredSignatureError, HTTPPermissionDenied, InvalidToken, ExpiredSignature,
+)
+from app.core.metrics import timer
+from app.core.schema import CommonsModel, SyncParams, BatchIds
+from app.core.throttling import READ, WRITE, STREAM, check_rate_limit, concurrency_limiter
+from app.db.events import get_circuit_breaker
+from app.db.session import get_async_session, RELEASE_AFTER_ENDPOINT
+from app.db.tenants import tenant_directory
+from app.db.timeouts import STATEMENT_TIMEOUT
+from app.utils.import_utils import import_from_string
+from app.utils.security import ACCESS, service_tokens_enabled
+from app.utils.stream_writers import accepts_ndjson
+
+
+@lru_cache
+def jwt_handler(setting_name: str) -> Callable:
+    """
+    Function configured by a `JWT_*_HANDLER` setting
+    """
+    return import_from_string(getattr(jwt_settings, setting_name), setting_name)
+
+
+def get_bearer_token(request: Request, header_name: str, cookie_name: str) -> Optional[str]:
+    for authorization in (request.headers.get(header_name), request.cookies.get(cookie_name)):
+        scheme, param = get_authorization_scheme_param(authorization)
+        if scheme.lower() == "bearer":
+            return param
+    return None
+
+
+def get_service_token(request: Request) -> Optional[str]:
+    """
+    Service token minted by `/auth/token/`, see `app.utils.security`
+    """
+    return get_bearer_token(request, jwt_settings.JWT_AUTH_HEADER_NAME, jwt_settings.JWT_AUTH_COOKIE_NAME)
 
 
 async def get_google_id_token(request: Request):
-    header_authorization: str = request.headers.get(jwt_settings.JWT_GIT_HEADER_NAME)
-    cookie_authorization: str = request.cookies.get(jwt_settings.JWT_GIT_COOKIE_NAME)
-    header_scheme, header_param = get_authorization_scheme_param(header_authorization)
-    cookie_scheme, cookie_param = get_authorization_scheme_param(cookie_authorization)
-    if header_scheme.lower() == "bearer":
-        authorization = True
-        scheme = header_scheme
-        param = header_param
-    elif cookie_scheme.lower() == "bearer":
-        authorization = True
-        scheme = cookie_scheme
-        param = cookie_param
-    else:
-        authorization = False
-        scheme = ''
-        param = None
-
-    if not authorization or scheme.lower() != "bearer":
+    param = get_bearer_token(request, jwt_settings.JWT_GIT_HEADER_NAME, jwt_settings.JWT_GIT_COOKIE_NAME)
+    if param is None and get_service_token(request) is None:
         if settings.MULTI_TENANCY_DB:
             raise HTTPException(
                 status_code=HTTP_401_UNAUTHORIZED,
@@ -45,9 +69,10 @@ async def get_google_id_token(request: Request):
     return param
 
 
-async def get_audience(token: str = Depends(get_google_id_token)) -> Optional[str]:
-    if not settings.MULTI_TENANCY_DB:
-        return jwt_settings.JWT_AUDIENCE
+def verify_google_id_token(token: str) -> str:
+    """
+    Audience of a Google ID token, verified against Google's certificates
+    """
     try:
         id_info = id_token.verify_oauth2_token(token, GoogleRequest())
     except GoogleAuthError as e:
@@ -58,35 +83,229 @@ async def get_audience(token: str = Depends(get_google_id_token)) -> Optional[st
     return audience
 
 
-async def get_async_db(audience: str = Depends(get_audience)) -> Generator:
-    async_session_local, _ = get_async_session(audience)
+def verify_service_token(token: str, token_type: Optional[str] = ACCESS) -> str:
+    """
+    Audience of a service token, checked with an HMAC. Never trusted while `JWT_SECRET_KEY`
+    is unset or a placeholder, whatever `JWT_DECODE_HANDLER` is.
+    """
+    if not service_tokens_enabled():
+        raise HTTPInvalidToken(detail="Service tokens are disabled")
+    try:
+        claims = jwt_handler('JWT_DECODE_HANDLER')(token, token_type)
+    except ExpiredSignature:
+        raise HTTPExpiredSignatureError()
+    except InvalidToken as e:
+        raise HTTPInvalidToken(detail=str(e))
+    return claims['aud']
+
+
+async def get_audience(request: Request, token: str = Depends(get_google_id_token)) -> Optional[str]:
+    """
+    Tenant of the request, from a service token when the request has one, else from the Google ID token
+    """
+    if not settings.MULTI_TENANCY_DB:
+        return jwt_settings.JWT_AUDIENCE
+    batch = get_batch_context(request)
+    if batch is not None:
+        # Verified once by the batch request
+        return batch.audience
+    service_token = get_service_token(request)
+    with timer('auth'):
+        if service_token is not None:
+            audience = verify_service_token(service_token)
+        else:
+            audience = verify_google_id_token(token)
+        if await tenant_directory.get(audience) is None:
+            raise HTTPPermissionDenied(detail="Unknown tenant")
+    return audience
+
+
+async def get_async_db(request: Request, audience: str = Depends(get_audience)) -> Generator:
+    """
+    Session of the audience database.
+
+    A connection is checked out on the first statement only. `ServiceRoute`
+    closes the session, returning the connection to the pool, as soon as the
+    endpoint returns, or once a streaming response is fully sent.
+
+    Requests fail with 503 while the circuit breaker of the tenant database is open.
+    Statements are limited to the endpoint's `statement_timeout`.
+    Operations of a batch share the batch session instead, a failing operation
+    only rolls back its own savepoint.
+    """
+    timeout = getattr(request.scope.get('endpoint'), 'statement_timeout', settings.DATABASE_STATEMENT_TIMEOUT_MS)
+    batch = get_batch_context(request)
+    if batch is not None:
+        batch.session.info[STATEMENT_TIMEOUT] = timeout
+        try:
+            yield batch.session
+        except Exception:
+            await batch.session.rollback()
+            raise
+        return
+    with timer('db-session'):
+        tenant = await tenant_directory.get(audience)
+        if tenant is None:
+            raise HTTPPermissionDenied(detail="Unknown tenant")
+        async_session_local, async_engine = get_async_session(*tenant)
+    breaker = get_circuit_breaker(async_engine.sync_engine)
+    probe = breaker is not None and breaker.before_request()
+    session = async_session_local()
+    session.info[RELEASE_AFTER_ENDPOINT] = True
+    session.info[STATEMENT_TIMEOUT] = timeout
     try:
-        async with async_session_local() as session:
-            yield session
-    except Exception as e:
-        raise HTTPInvalidToken(detail=str(e), status_code=500)
+        yield session
+    except Exception:
+        await session.rollback()
+        raise
     finally:
         await session.close()
+        if breaker is not None:
+            breaker.after_request(probe)
+
+
+async def throttle(request: Request, audience: str = Depends(get_audience)) -> Generator:
+    """
+    Rate limit and cap concurrent requests per audience.
+
+    GET, HEAD and OPTIONS are throttled as reads and everything else as writes,
+    unless the endpoint declares otherwise with `throttle_class`. Streams are
+    rate limited as reads but don't hold a concurrency slot while open, neither
+    do batch operations, the batch request holds one for all of them.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        yield
+        return
+    route_class = getattr(request.scope.get('endpoint'), 'throttle_class', None)
+    if route_class is None:
+        route_class = READ if request.method in ('GET', 'HEAD', 'OPTIONS') else WRITE
+    if route_class == STREAM:
+        await check_rate_limit(audience, READ)
+        yield
+        return
+    if get_batch_context(request) is not None:
+        await check_rate_limit(audience, route_class)
+        yield
+        return
+    await check_rate_limit(audience, route_class)
+    async with concurrency_limiter.acquire(audience):
+        yield
 
 
 async def get_commons(
+        request: Request,
         page: Optional[int] = 1,
-        limit: Optional[int] = settings.PAGINATION_MAX_SIZE,
+        limit: Optional[int] = Query(
+            settings.PAGINATION_MAX_SIZE, ge=1,
+            description=f"At most {settings.PAGINATION_HARD_MAX}. Send `Accept: application/x-ndjson` "
+                        f"to stream the whole list instead, one JSON row per line",
+        ),
+        sort: Optional[str] = Query(
+            None, description="Comma separated fields to sort by, `-` prefix for descending, e.g. `-modified_at`",
+        ),
 ) -> CommonsModel:
     """
 
     Get commons dict for list pagination
+    :param request:
     :param limit:
     :param page:
+    :param sort:
     :return:
     """
     if not page or not isinstance(page, int):
         page = 1
     elif page < 0:
         page = 1
+    stream = accepts_ndjson(request)
+    if limit > settings.PAGINATION_HARD_MAX and not stream:
+        raise RequestValidationError([ErrorDetails(
+            msg=f'Limit must be at most {settings.PAGINATION_HARD_MAX}, '
+                f'request `Accept: application/x-ndjson` to stream larger lists',
+            loc=('query', 'limit'),
+            type='less_than_equal',
+            input=limit,
+        )])
     offset = (page - 1) * limit
     return CommonsModel(
-        limit=limit,
+        # Without an explicit limit a stream returns every row
+        limit=limit if not stream or 'limit' in request.query_params else None,
         offset=offset,
         page=page,
+        sort=tuple(field.strip() for field in sort.split(',') if field.strip()) if sort else (),
+        stream=stream,
     )
+
+
+# Where a sync starts without `updated_since`, i.e. every row
+SYNC_EPOCH = datetime(1970, 1, 1)
+
+
+def encode_sync_cursor(modified_at: datetime, obj_id: int) -> str:
+    """
+    Opaque cursor of a `(modified_at, id)` keyset position
+    """
+    value = f'{modified_at.isoformat()}|{obj_id}'.encode()
+    return base64.urlsafe_b64encode(value).rstrip(b'=').decode()
+
+
+def decode_sync_cursor(cursor: str) -> tuple:
+    value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    modified_at, _, obj_id = value.rpartition('|')
+    return datetime.fromisoformat(modified_at), int(obj_id)
+
+
+async def get_sync_params(
+        updated_since: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = Query(settings.PAGINATION_MAX_SIZE, ge=1, le=settings.PAGINATION_HARD_MAX),
+) -> SyncParams:
+    """
+    Keyset position of an incremental sync page.
+
+    The first sync passes `updated_since` (or nothing for a full download),
+    every following page and sync passes the `cursor` of the previous response.
+    :param updated_since:
+    :param cursor:
+    :param limit:
+    :return:
+    """
+    if cursor is None:
+        return SyncParams(modified_at=updated_since or SYNC_EPOCH, id=0, limit=limit)
+    try:
+        modified_at, obj_id = decode_sync_cursor(cursor)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise RequestValidationError(
+            [ErrorDetails(msg='Invalid cursor', loc=('query', 'cursor'), type='value_error', input=cursor)]
+        )
+    return SyncParams(modified_at=modified_at, id=obj_id, limit=limit)
+
+
+async def get_batch_ids(ids: List[str] = Query([], description='Comma separated or repeated ids')) -> BatchIds:
+    """
+    Ids of a batch get, `?ids=1,2,3` or `?ids=1&ids=2&ids=3`
+    :param ids:
+    :return:
+    """
+    values = [value for item in ids for value in item.split(',') if value.strip()]
+    try:
+        return BatchIds(ids=[int(value) for value in values])
+    except ValueError:
+        raise RequestValidationError(
+            [ErrorDetails(
+                msg=f'Expected 1 to {settings.BATCH_MAX_IDS} integer ids',
+                loc=('query', 'ids'),
+                type='value_error',
+                input=','.join(ids),
+            )]
+        )
+
+
+def batch_page(ids: List[int], rows: list) -> dict:
+    """
+    Body of an `IBatchBase` response for the `rows` of `get_many`
+    """
+    return {
+        'rows': rows,
+        'missing': list(dict.fromkeys(obj_id for obj_id, row in zip(ids, rows) if row is None)),
+    }
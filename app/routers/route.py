@@ -0,0 +1,216 @@
+import asyncio
+import inspect
+from functools import wraps
+from typing import Any, Callable, Optional
+
+from fastapi import Depends, Request, Response
+from fastapi._compat import lenient_issubclass
+from fastapi.concurrency import run_in_threadpool
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.dependencies.models import Dependant
+from fastapi.dependencies.utils import get_typed_return_annotation, get_dependant, get_flat_dependant
+from fastapi.routing import APIRoute, serialize_response
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import StreamingResponse
+
+from app.conf.config import settings
+from app.core.batch import get_batch_context
+from app.core.schema import is_trusted_model, construct_trusted
+from app.core.single_flight import SingleFlight
+from app.core.throttling import WRITE
+from app.db.session import RELEASE_AFTER_ENDPOINT, close_after_iteration
+from app.routers.dependency import get_audience, get_commons
+from app.utils.compression import negotiate_encoding, is_compressible, compress
+from app.utils.stream_writers import accepts_ndjson
+
+single_flight_calls = SingleFlight()
+
+_REQUEST_PARAM = 'single_flight_request'
+_AUDIENCE_PARAM = 'single_flight_audience'
+
+
+def depends_on(dependant: Dependant, call: Callable[..., Any]) -> bool:
+    return any(sub.call is call or depends_on(sub, call) for sub in dependant.dependencies)
+
+
+class ServiceRoute(APIRoute):
+    """
+    API route with early connection release, trusted output rendering and request coalescing.
+
+    Database sessions of `get_async_db` are closed as soon as the endpoint returns,
+    so their connection goes back to the pool before the response is serialized
+    and written. Streaming responses keep them until the body is sent.
+
+    Responses whose model is built from `VisibleBase` schemas are constructed
+    directly from ORM rows without revalidation (see `construct_trusted`).
+
+    Identical concurrent GET requests of one tenant are coalesced: the endpoint
+    runs once per (audience, method, path, query) and every waiting request
+    receives the same serialized body. Every request still goes through its own
+    dependencies, so authentication is never shared. List endpoints, which answer
+    JSON pages or NDJSON streams depending on `Accept`, are coalesced per representation
+    and send `Vary: Accept`.
+    Endpoints opt out with `single_flight(False)`. GET routes which write, those
+    with a request body or throttled as `WRITE`, are never coalesced, neither are
+    batch operations, they must see the uncommitted writes of their batch.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        # Routes are re-created on `include_router`, always wrap the original endpoint
+        endpoint = getattr(endpoint, 'route_endpoint', endpoint)
+        methods = kwargs.get('methods') or ()
+        response_model = kwargs.get('response_model')
+        if isinstance(response_model, DefaultPlaceholder):
+            response_model = get_typed_return_annotation(endpoint)
+            if lenient_issubclass(response_model, Response):
+                response_model = None
+
+        self.trusted_output = settings.TRUSTED_OUTPUT and is_trusted_model(response_model)
+        coalesce = (
+                settings.SINGLE_FLIGHT_ENABLED
+                and set(methods) <= {'GET', 'HEAD'}
+                and getattr(endpoint, 'single_flight', True)
+                and getattr(endpoint, 'throttle_class', None) != WRITE
+                and not get_flat_dependant(get_dependant(path=path, call=endpoint)).body_params
+        )
+        if coalesce:
+            endpoint = self._single_flight_endpoint(endpoint)
+        else:
+            endpoint = self._rendering_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+        self.vary_accept = depends_on(self.dependant, get_commons)
+
+    def get_response_class(self) -> type:
+        if isinstance(self.response_class, DefaultPlaceholder):
+            return self.response_class.value
+        return self.response_class
+
+    async def render(self, raw_response: Any, is_coroutine: Optional[bool] = True) -> Response:
+        """
+        Serialize an endpoint result the same way FastAPI's request handler does,
+        skipping validation for trusted response models
+        """
+        if isinstance(raw_response, Response):
+            return raw_response
+        if self.trusted_output:
+            content = self.response_field.serialize(
+                construct_trusted(self.response_model, raw_response),
+                mode='json',
+                include=self.response_model_include,
+                exclude=self.response_model_exclude,
+                by_alias=self.response_model_by_alias,
+                exclude_unset=self.response_model_exclude_unset,
+                exclude_defaults=self.response_model_exclude_defaults,
+                exclude_none=self.response_model_exclude_none,
+            )
+        else:
+            content = await serialize_response(
+                field=self.secure_cloned_response_field,
+                response_content=raw_response,
+                include=self.response_model_include,
+                exclude=self.response_model_exclude,
+                by_alias=self.response_model_by_alias,
+                exclude_unset=self.response_model_exclude_unset,
+                exclude_defaults=self.response_model_exclude_defaults,
+                exclude_none=self.response_model_exclude_none,
+                is_coroutine=is_coroutine,
+            )
+        return self.get_response_class()(content, status_code=self.status_code or 200)
+
+    @staticmethod
+    def share_response(response: Response, request: Request) -> Response:
+        """
+        Copy a shared response for one request.
+
+        The body is compressed once per negotiated encoding and kept on the shared
+        response, so requests served from it don't pay for compression again.
+        """
+        body = response.body
+        raw_headers = [(name, value) for name, value in response.raw_headers if name != b'content-length']
+        encoding = None
+        if settings.COMPRESSION_ENABLED and 'content-encoding' not in response.headers:
+            encoding = negotiate_encoding(request.headers.get('accept-encoding'))
+        if encoding and is_compressible(response.headers.get('content-type'), len(body)):
+            encoded_bodies = response.__dict__.setdefault('encoded_bodies', {})
+            if encoding not in encoded_bodies:
+                encoded_bodies[encoding] = compress(body, encoding)
+            body = encoded_bodies[encoding]
+            raw_headers.extend(((b'content-encoding', encoding.encode()), (b'vary', b'Accept-Encoding')))
+        shared = Response(content=body, status_code=response.status_code)
+        shared.raw_headers = [*raw_headers, (b'content-length', str(len(body)).encode())]
+        return shared
+
+    @staticmethod
+    async def release_sessions(raw_response: Any, kwargs: dict) -> None:
+        sessions = [
+            value for value in kwargs.values()
+            if isinstance(value, AsyncSession) and value.info.get(RELEASE_AFTER_ENDPOINT)
+        ]
+        if not sessions:
+            return
+        if isinstance(raw_response, StreamingResponse):
+            raw_response.body_iterator = close_after_iteration(raw_response.body_iterator, sessions)
+            return
+        for session in sessions:
+            await session.close()
+
+    async def _run(self, endpoint: Callable[..., Any], kwargs: dict) -> Response:
+        is_coroutine = asyncio.iscoroutinefunction(endpoint)
+        if is_coroutine:
+            raw_response = await endpoint(**kwargs)
+        else:
+            raw_response = await run_in_threadpool(endpoint, **kwargs)
+        await self.release_sessions(raw_response, kwargs)
+        response = await self.render(raw_response, is_coroutine=is_coroutine)
+        if self.vary_accept:
+            response.headers.append('Vary', 'Accept')
+        return response
+
+    def _rendering_endpoint(self, endpoint: Callable[..., Any]) -> Callable[..., Any]:
+
+        @wraps(endpoint)
+        async def wrapper(**kwargs: Any) -> Response:
+            return await self._run(endpoint, kwargs)
+
+        wrapper.__signature__ = inspect.signature(endpoint)
+        wrapper.route_endpoint = endpoint
+        return wrapper
+
+    def _single_flight_endpoint(self, endpoint: Callable[..., Any]) -> Callable[..., Any]:
+        grace_ms = getattr(endpoint, 'single_flight_grace_ms', None)
+        if grace_ms is None:
+            grace_ms = settings.SINGLE_FLIGHT_GRACE_MS
+
+        @wraps(endpoint)
+        async def wrapper(**kwargs: Any) -> Response:
+            request: Request = kwargs.pop(_REQUEST_PARAM)
+            audience = kwargs.pop(_AUDIENCE_PARAM)
+            if get_batch_context(request) is not None:
+                return await self._run(endpoint, kwargs)
+            key = (
+                audience, request.method, request.url.path, tuple(sorted(request.query_params.multi_items())),
+                accepts_ndjson(request),
+            )
+            computed = False
+
+            async def compute() -> Response:
+                nonlocal computed
+                computed = True
+                return await self._run(endpoint, kwargs)
+
+            response = await single_flight_calls.do(key, compute, grace=grace_ms / 1000)
+            if getattr(response, 'body', None) is None:
+                # Streamed bodies can be consumed once, compute a fresh one
+                return response if computed else await compute()
+            return self.share_response(response, request)
+
+        signature = inspect.signature(endpoint)
+        wrapper.__signature__ = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter(_REQUEST_PARAM, inspect.Parameter.KEYWORD_ONLY, annotation=Request),
+            inspect.Parameter(
+                _AUDIENCE_PARAM, inspect.Parameter.KEYWORD_ONLY, annotation=str, default=Depends(get_audience)
+            ),
+        ])
+        wrapper.route_endpoint = endpoint
+        return wrapper
@@ -0,0 +1,130 @@
+import zlib
+from typing import Optional, Dict, Tuple, List
+
+from app.conf.config import settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    'application/json', 'application/x-ndjson', 'application/javascript', 'application/xml',
+    'text/',
+)
+
+
+class _GzipCompressor:
+    __slots__ = ('_compressor',)
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliCompressor:
+    __slots__ = ('_compressor',)
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdCompressor:
+    __slots__ = ('_compressor',)
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+def get_compressor(encoding: str):
+    """
+    Return an incremental compressor with `compress(data)` and `flush()` for `encoding`
+    """
+    if encoding == 'zstd':
+        return _ZstdCompressor(settings.COMPRESSION_ZSTD_LEVEL)
+    if encoding == 'br':
+        return _BrotliCompressor(settings.COMPRESSION_BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return _GzipCompressor(settings.COMPRESSION_GZIP_LEVEL)
+    raise ValueError(f'Unsupported encoding: {encoding}')
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    compressor = get_compressor(encoding)
+    return compressor.compress(data) + compressor.flush()
+
+
+def available_encodings() -> List[str]:
+    """Supported encodings in order of server preference"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+def _parse_accept_encoding(value: str) -> Dict[str, float]:
+    accepted = {}
+    for item in value.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the best supported encoding for an `Accept-Encoding` header, None for identity
+    """
+    if not accept_encoding:
+        return None
+    accepted = _parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get('*', 0.0)
+    best: Tuple[float, Optional[str]] = (0.0, None)
+    for encoding in available_encodings():
+        quality = accepted.get(encoding, wildcard)
+        if quality > best[0]:
+            best = (quality, encoding)
+    return best[1]
+
+
+def is_compressible(content_type: Optional[str], size: Optional[int] = None) -> bool:
+    if not content_type or not content_type.startswith(COMPRESSIBLE_TYPES):
+        return False
+    if content_type.startswith('text/event-stream'):
+        # Compressors buffer their output, events would be held back
+        return False
+    return size is None or size >= settings.COMPRESSION_MINIMUM_SIZE
@@ -0,0 +1,80 @@
+import math
+from typing import List, Tuple
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Length of one degree on the sphere used by ST_Distance_Sphere, rounded down so boxes err on the large side
+KM_PER_DEGREE = 111.19
+MAX_PRECISION = 12
+
+
+def encode(latitude: float, longitude: float, precision: int = MAX_PRECISION) -> str:
+    """
+    Geohash of a point, the same as MySQL's `ST_GeoHash(longitude, latitude, precision)`
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """
+    Height and width of the cells of `precision` in degrees
+    """
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """
+    `(min_lat, max_lat, delta_lat, delta_lon)` of the box around a circle, deltas are half its size in degrees
+    """
+    delta_lat = radius_km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(min(abs(latitude) + delta_lat, 90.0)))
+    delta_lon = 180.0 if cos_lat < 1e-9 else min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+    return max(latitude - delta_lat, -90.0), min(latitude + delta_lat, 90.0), delta_lat, delta_lon
+
+
+def cover(latitude: float, longitude: float, radius_km: float) -> List[str]:
+    """
+    Geohash prefixes whose cells together contain the circle of `radius_km` around a point.
+
+    The longest precision whose cells are at least as large as the circle's bounding box
+    is used, so the box overlaps at most 2x2 cells and the cells of its corners cover it.
+    Empty when the circle is too large for any prefix to narrow the search.
+    """
+    min_lat, max_lat, delta_lat, delta_lon = bounding_box(latitude, longitude, radius_km)
+    precision = 0
+    while precision < MAX_PRECISION:
+        height, width = cell_size(precision + 1)
+        if height < 2 * delta_lat or width < 2 * delta_lon:
+            break
+        precision += 1
+    if precision == 0:
+        return []
+    prefixes = set()
+    for corner_lat in (min_lat, max_lat):
+        for corner_lon in (longitude - delta_lon, longitude + delta_lon):
+            # Wrap around the antimeridian
+            corner_lon = (corner_lon + 180.0) % 360.0 - 180.0
+            prefixes.add(encode(corner_lat, corner_lon, precision))
+    return sorted(prefixes)
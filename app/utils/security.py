@@ -0,0 +1,120 @@
+"""
+Service tokens, minted in exchange for a verified Google ID token.
+
+They are JWTs signed with `JWT_SECRET_KEY`, so checking one is an HMAC over a few
+hundred bytes instead of the RS256 verification (and certificate fetch) of a Google
+ID token. The handlers are referenced by `JWT_PAYLOAD_HANDLER`, `JWT_ENCODE_HANDLER`
+and `JWT_DECODE_HANDLER`.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import time
+from typing import Optional
+
+import orjson
+
+from app.conf.config import jwt_settings
+from app.core.exceptions import ImproperlyConfigured, InvalidToken, ExpiredSignature
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+# Secrets found in examples and older defaults, never trusted
+_PLACEHOLDER_SECRETS = frozenset({'change_this', 'changethis', 'secret', 'change_me', 'changeme'})
+MIN_SECRET_LENGTH = 32
+
+_HMAC_ALGORITHMS = {
+    'HS256': hashlib.sha256,
+    'HS384': hashlib.sha384,
+    'HS512': hashlib.sha512,
+}
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+def service_tokens_enabled() -> bool:
+    """
+    Whether `JWT_SECRET_KEY` is set to something an attacker can't guess
+    """
+    secret = jwt_settings.JWT_SECRET_KEY
+    return bool(secret) and len(secret) >= MIN_SECRET_LENGTH and secret.lower() not in _PLACEHOLDER_SECRETS
+
+
+def _sign(message: bytes, algorithm: str) -> bytes:
+    digest = _HMAC_ALGORITHMS.get(algorithm)
+    if digest is None:
+        raise ImproperlyConfigured(f"JWT_ALGORITHM `{algorithm}` is not supported, use one of {', '.join(_HMAC_ALGORITHMS)}")
+    if not service_tokens_enabled():
+        raise ImproperlyConfigured(
+            f"Service tokens require JWT_SECRET_KEY, a random value of at least {MIN_SECRET_LENGTH} characters"
+        )
+    return hmac.new(jwt_settings.JWT_SECRET_KEY.encode(), message, digest).digest()
+
+
+def jwt_payload(audience: str, token_type: Optional[str] = ACCESS) -> dict:
+    """
+    Claims of a new token of `audience`, expiring after `JWT_EXPIRATION_MINUTES`,
+    or `JWT_REFRESH_EXPIRATION_MINUTES` for refresh tokens
+    """
+    if token_type == REFRESH:
+        minutes = jwt_settings.JWT_REFRESH_EXPIRATION_MINUTES
+    else:
+        minutes = jwt_settings.JWT_EXPIRATION_MINUTES
+    now = int(time.time())
+    return {
+        'iss': jwt_settings.JWT_ISSUER,
+        'aud': audience,
+        'type': token_type,
+        'iat': now,
+        'exp': now + minutes * 60,
+    }
+
+
+def jwt_encode(payload: dict) -> str:
+    algorithm = jwt_settings.JWT_ALGORITHM
+    header = _b64encode(orjson.dumps({'alg': algorithm, 'typ': 'JWT'}))
+    signing_input = header + b'.' + _b64encode(orjson.dumps(payload))
+    return (signing_input + b'.' + _b64encode(_sign(signing_input, algorithm))).decode()
+
+
+def jwt_decode(token: str, token_type: Optional[str] = ACCESS) -> dict:
+    """
+    Verified claims of `token`, raise `InvalidToken`, or `ExpiredSignature` once it expired.
+    Every token is invalid while `JWT_SECRET_KEY` is unset or a placeholder.
+    """
+    if not service_tokens_enabled():
+        raise InvalidToken("Service tokens are disabled")
+    try:
+        signing_input, _, signature = token.encode().rpartition(b'.')
+        header, _, payload = signing_input.partition(b'.')
+        header = orjson.loads(_b64decode(header))
+        signature = _b64decode(signature)
+    except (ValueError, binascii.Error, orjson.JSONDecodeError):
+        raise InvalidToken("Malformed token")
+    # The algorithm is never taken from the token, only checked against ours
+    if not isinstance(header, dict) or header.get('alg') != jwt_settings.JWT_ALGORITHM:
+        raise InvalidToken("Unexpected token algorithm")
+    if not hmac.compare_digest(signature, _sign(signing_input, jwt_settings.JWT_ALGORITHM)):
+        raise InvalidToken("Invalid token signature")
+
+    try:
+        claims = orjson.loads(_b64decode(payload))
+    except (ValueError, binascii.Error, orjson.JSONDecodeError):
+        raise InvalidToken("Malformed token")
+    if not isinstance(claims, dict) or not claims.get('aud'):
+        raise InvalidToken("Invalid token audience")
+    if claims.get('iss') != jwt_settings.JWT_ISSUER or claims.get('type') != token_type:
+        raise InvalidToken(f"Expected a token of type `{token_type}`")
+    if jwt_settings.JWT_VERIFY_EXPIRATION:
+        expires_at = claims.get('exp')
+        if not isinstance(expires_at, int) or expires_at + jwt_settings.JWT_LEEWAY <= time.time():
+            raise ExpiredSignature("Token signature expired")
+    return claims
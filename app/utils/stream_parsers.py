@@ -0,0 +1,115 @@
+import codecs
+import csv
+from typing import AsyncIterator, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException, Request, status
+
+# Parsed rows are yielded as (row, None) or, for unparsable records, (None, error)
+ParsedRow = Tuple[Optional[dict], Optional[str]]
+
+CSV_CONTENT_TYPES = ('text/csv', 'application/csv')
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], encoding: Optional[str] = 'utf-8') -> AsyncIterator[str]:
+    """
+    Decode a byte stream incrementally and yield it line by line, without line endings
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    buffer = ''
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        if '\n' not in buffer:
+            continue
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            yield line.rstrip('\r')
+    buffer += decoder.decode(b'', final=True)
+    if buffer:
+        yield buffer.rstrip('\r')
+
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes], encoding: Optional[str] = 'utf-8-sig') -> AsyncIterator[ParsedRow]:
+    """
+    Parse a CSV stream with a header record into dicts, empty cells are left out.
+
+    Records may span lines inside quoted fields, a record is complete once its
+    quotes are balanced.
+    """
+    header = None
+    pending = []
+    quotes = 0
+    async for line in iter_lines(chunks, encoding):
+        pending.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        values = next(csv.reader(['\n'.join(pending)]))
+        pending.clear()
+        quotes = 0
+        if not any(values):
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield None, f'Expected {len(header)} columns, got {len(values)}'
+            continue
+        yield {name: value for name, value in zip(header, values) if value != ''}, None
+    if pending:
+        yield None, 'Unterminated quoted field'
+
+
+async def iter_ndjson_rows(chunks: AsyncIterator[bytes], encoding: Optional[str] = 'utf-8') -> AsyncIterator[ParsedRow]:
+    """
+    Parse a stream of JSON objects, one per line
+    """
+    async for line in iter_lines(chunks, encoding):
+        if not line.strip():
+            continue
+        try:
+            value = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(value, dict):
+            yield None, 'Expected a JSON object'
+            continue
+        yield value, None
+
+
+def iter_upload_rows(request: Request) -> AsyncIterator[ParsedRow]:
+    """
+    Parse the request body as it is received, by its content type (CSV or NDJSON)
+    """
+    content_type, _, params = request.headers.get('content-type', '').partition(';')
+    content_type = content_type.strip().lower()
+    charset = None
+    for param in params.split(';'):
+        name, _, value = param.strip().partition('=')
+        if name.lower() == 'charset' and value:
+            charset = value.strip('"')
+    if charset:
+        try:
+            codecs.lookup(charset)
+        except LookupError:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=f"Unknown charset {charset}")
+    if content_type in CSV_CONTENT_TYPES:
+        return iter_csv_rows(request.stream(), charset or 'utf-8-sig')
+    if content_type in NDJSON_CONTENT_TYPES:
+        return iter_ndjson_rows(request.stream(), charset or 'utf-8')
+    raise HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail=f"Unsupported content type, use one of {', '.join(CSV_CONTENT_TYPES + NDJSON_CONTENT_TYPES)}",
+    )
+
+
+# OpenAPI request body of upload endpoints, which read the body themselves
+UPLOAD_REQUEST_BODY = {
+    'required': True,
+    'content': {
+        'text/csv': {'schema': {'type': 'string'}},
+        'application/x-ndjson': {'schema': {'type': 'string'}},
+    },
+}
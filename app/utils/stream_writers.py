@@ -0,0 +1,47 @@
+from typing import AsyncIterator, Type, TYPE_CHECKING
+
+import orjson
+from fastapi import Request
+from starlette.responses import StreamingResponse
+
+from app.conf.config import settings
+from app.core.schema import VisibleBase
+
+if TYPE_CHECKING:
+    from sqlalchemy import Select
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+# `responses` entry of list endpoints which stream with `stream_rows`
+NDJSON_RESPONSE = {
+    200: {
+        'content': {NDJSON_MEDIA_TYPE: {'schema': {'type': 'string'}}},
+        'description': 'With `Accept: application/x-ndjson`, one row per line',
+    },
+}
+
+
+def accepts_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get('accept', '')
+
+
+async def iter_ndjson(async_db: "AsyncSession", stmt: "Select", schema: Type[VisibleBase]) -> AsyncIterator[bytes]:
+    """
+    Serialize the rows of `stmt` as NDJSON, one chunk per `PAGINATION_STREAM_CHUNK` rows.
+
+    Rows come from a server side cursor, so only one chunk is held in memory.
+    """
+    result = await async_db.stream_scalars(stmt.execution_options(yield_per=settings.PAGINATION_STREAM_CHUNK))
+    async for rows in result.partitions():
+        yield b''.join(
+            orjson.dumps(schema.from_trusted(row).model_dump(mode='json'), option=orjson.OPT_APPEND_NEWLINE)
+            for row in rows
+        )
+
+
+def stream_rows(async_db: "AsyncSession", stmt: "Select", schema: Type[VisibleBase]) -> StreamingResponse:
+    """
+    Stream the rows of `stmt` as `schema` objects, one JSON object per line
+    """
+    return StreamingResponse(iter_ndjson(async_db, stmt, schema), media_type=NDJSON_MEDIA_TYPE)
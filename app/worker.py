@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import signal
+from typing import List
+
+from app.conf.config import settings, jwt_settings
+
+
+async def run(databases: List[str], concurrency: int) -> None:
+    from app.contrib.job.worker import JobWorker
+    worker = JobWorker(databases, concurrency=concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+
+async def purge(databases: List[str]) -> None:
+    from loguru import logger
+    from app.contrib.job.handlers import load_job_modules
+    from app.contrib.job.purge import enqueue_purge
+    from app.db.session import get_async_session
+    load_job_modules()
+    for database in databases:
+        async_session_local, async_engine = get_async_session(database)
+        async with async_session_local() as async_db:
+            job = await enqueue_purge(async_db)
+        await async_engine.dispose()
+        if job is not None:
+            logger.info("Queued purge job {job_id} of {total} rows in {database}",
+                        job_id=job.id, total=job.total, database=database)
+
+
+async def recount(databases: List[str]) -> None:
+    from loguru import logger
+    from app.contrib.job.handlers import load_job_modules, enqueue_all
+    from app.contrib.school.jobs import recount_school_members
+    from app.contrib.school.models import School
+    from app.contrib.user.jobs import recount_group_members
+    from app.contrib.user.models import Group
+    from app.db.session import get_async_session
+    load_job_modules()
+    for database in databases:
+        async_session_local, async_engine = get_async_session(database)
+        async with async_session_local() as async_db:
+            jobs = [
+                *await enqueue_all(async_db, recount_group_members, Group.__table__),
+                *await enqueue_all(async_db, recount_school_members, School.__table__),
+            ]
+        await async_engine.dispose()
+        logger.info("Queued {count} recount jobs in {database}", count=len(jobs), database=database)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Process background jobs")
+    parser.add_argument(
+        'databases', nargs='*',
+        help="Tenant databases to poll, required when MULTI_TENANCY_DB is enabled",
+    )
+    parser.add_argument('--concurrency', type=int, default=settings.JOB_WORKER_CONCURRENCY)
+    parser.add_argument(
+        '--purge', action='store_true',
+        help="Queue the purge of expired soft deleted rows and exit, e.g. from cron",
+    )
+    parser.add_argument(
+        '--recount', action='store_true',
+        help="Queue the repair of the group and school member counters and exit, e.g. after --purge",
+    )
+    args = parser.parse_args()
+
+    databases = args.databases
+    if not databases:
+        if settings.MULTI_TENANCY_DB:
+            parser.error("databases are required when MULTI_TENANCY_DB is enabled")
+        databases = [jwt_settings.JWT_AUDIENCE]
+    if args.purge:
+        asyncio.run(purge(databases))
+    elif args.recount:
+        asyncio.run(recount(databases))
+    else:
+        asyncio.run(run(databases, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
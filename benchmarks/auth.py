@@ -0,0 +1,70 @@
+"""
+Per-request cost of authenticating with a service token vs a Google ID token.
+
+The Google ID token is signed with a local RSA key and verified against its certificate,
+so the numbers leave out the certificate fetch `verify_oauth2_token` does on a cold cache.
+
+    python -m benchmarks.auth
+"""
+import datetime
+import secrets
+import time
+import timeit
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt as google_jwt
+
+from app.conf.config import jwt_settings
+from app.utils.security import jwt_payload, jwt_encode, jwt_decode, service_tokens_enabled
+
+NUMBER = 2000
+AUDIENCE = 'client'
+
+
+def make_google_token() -> tuple:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'benchmark')])
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    )
+    signer = crypt.RSASigner.from_string(private_pem, key_id='benchmark')
+    issued_at = int(time.time())
+    payload = {
+        'iss': 'https://accounts.google.com', 'aud': AUDIENCE, 'sub': '1',
+        'iat': issued_at, 'exp': issued_at + 3600,
+    }
+    certs = {'benchmark': certificate.public_bytes(serialization.Encoding.PEM)}
+    return google_jwt.encode(signer, payload), certs
+
+
+def main() -> None:
+    if not service_tokens_enabled():
+        jwt_settings.JWT_SECRET_KEY = secrets.token_urlsafe(32)
+    google_token, certs = make_google_token()
+    service_token = jwt_encode(jwt_payload(AUDIENCE))
+
+    def google():
+        return google_jwt.decode(google_token, certs=certs, audience=AUDIENCE)['aud']
+
+    def service():
+        return jwt_decode(service_token)['aud']
+
+    assert google() == service() == AUDIENCE
+    for name, fn in (('google', google), ('service', service)):
+        seconds = min(timeit.repeat(fn, number=NUMBER, repeat=5)) / NUMBER
+        print(f'{name:>7}: {seconds * 1e6:8.2f} us per request')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Rows per second of the import pipeline without the database: streaming CSV
+parsing and `UserCreate` validation of 100k rows.
+
+    python -m benchmarks.imports
+"""
+import asyncio
+import time
+
+from app.contrib.job.handlers import import_rows
+from app.contrib.user.schema import UserCreate
+from app.utils.stream_parsers import iter_csv_rows
+
+ROWS = 100_000
+CHUNK_SIZE = 64 * 1024
+
+
+def make_csv() -> bytes:
+    lines = ['name,first_name,last_name,date_of_birth,date_of_join,date_of_left,business_email,is_active']
+    for i in range(ROWS):
+        lines.append(f'user{i},First,Last,2000-01-01,2023-01-01,2023-12-01,user{i}@example.com,true')
+    return '\n'.join(lines).encode()
+
+
+async def stream(data: bytes):
+    for i in range(0, len(data), CHUNK_SIZE):
+        yield data[i:i + CHUNK_SIZE]
+
+
+class NoopSession:
+    async def commit(self) -> None:
+        pass
+
+
+async def validate(async_db, rows) -> dict:
+    for row in rows:
+        UserCreate.model_validate(row).model_dump()
+    return {}
+
+
+async def main() -> None:
+    data = make_csv()
+
+    started = time.perf_counter()
+    rows = [row async for row in iter_csv_rows(stream(data))]
+    parsed = time.perf_counter() - started
+    assert len(rows) == ROWS
+
+    started = time.perf_counter()
+    report = await import_rows(NoopSession(), validate, iter_csv_rows(stream(data)))
+    total = time.perf_counter() - started
+    assert report['succeeded'] == ROWS
+
+    print(f'    parse: {ROWS / parsed:10,.0f} rows/s')
+    print(f' validate: {ROWS / total:10,.0f} rows/s (parse + validate)')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+"""
+Per-row cost of rendering a 100 user page, validated vs trusted output.
+
+    python -m benchmarks.serialization
+"""
+import asyncio
+import timeit
+from datetime import datetime, date, timezone
+from types import SimpleNamespace
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.contrib.user.schema import UserVisible
+from app.core.schema import IPaginationDataBase, construct_trusted
+
+ROWS = 100
+NUMBER = 200
+
+
+def make_page() -> dict:
+    now = datetime.now(tz=timezone.utc)
+    rows = [
+        SimpleNamespace(
+            id=i, name=f'user{i}', created_at=now, modified_at=now,
+            first_name='First', middle_name='Middle', last_name='Last',
+            date_of_birth=date(2000, 1, 1), date_of_join=date(2023, 1, 1), date_of_left=date(2023, 12, 1),
+            business_email=f'business{i}@example.com', personal_email=f'personal{i}@example.com',
+            is_active=True,
+        )
+        for i in range(ROWS)
+    ]
+    return {'page': 1, 'limit': ROWS, 'count': ROWS, 'rows': rows}
+
+
+def main() -> None:
+    model = IPaginationDataBase[UserVisible]
+    field = create_response_field(name='Response', type_=model, mode='serialization')
+    page = make_page()
+    loop = asyncio.new_event_loop()
+
+    def validated():
+        return loop.run_until_complete(serialize_response(field=field, response_content=page))
+
+    def trusted():
+        return field.serialize(construct_trusted(model, page), mode='json')
+
+    assert validated() == trusted()
+    for name, fn in (('validated', validated), ('trusted', trusted)):
+        seconds = min(timeit.repeat(fn, number=NUMBER, repeat=5)) / NUMBER
+        print(f'{name:>9}: {seconds * 1e3:8.3f} ms per page, {seconds / ROWS * 1e6:7.2f} us per row')
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import pytest
+from starlette import status
+
+from typing import TYPE_CHECKING
+
+from app.conf.config import settings
+from app.contrib.user.repository import group_repo
+
+if TYPE_CHECKING:
+    from httpx import AsyncClient
+
+
+@pytest.mark.asyncio
+async def test_batch(async_client: "AsyncClient", async_db) -> None:
+    operations = [
+        {'method': 'POST', 'path': '/group/create/', 'body': {'name': 'batch_group'}},
+        {'method': 'GET', 'path': '/group/', 'query': {'sort': '-name'}},
+        {'method': 'GET', 'path': '/changes/'},
+    ]
+    response = await async_client.post(
+        f'{settings.API_V1_STR}/batch/', json={'operations': operations, 'atomic': False}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert result['committed'] is True
+    assert [item['status'] for item in result['results']] == [201, 200, 400]
+    group_id = result['results'][0]['body']['data']['id']
+    assert await group_repo.exists(async_db=async_db, params={'id': group_id})
+
+    # Atomic batches stop at the first failure
+    response = await async_client.post(f'{settings.API_V1_STR}/batch/', json={'operations': operations[::-1]})
+    result = response.json()
+    assert result['committed'] is False
+    assert [item['status'] for item in result['results']] == [400]
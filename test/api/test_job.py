@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+
+import pytest
+from starlette import status
+
+from typing import TYPE_CHECKING
+
+from app.conf.config import settings
+from app.contrib.job.backends import get_job_backend
+from app.contrib.job.models import Job, JobStatus
+from app.contrib.job.worker import JobWorker
+from app.contrib.user.repository import user_repo
+
+if TYPE_CHECKING:
+    from httpx import AsyncClient
+
+
+@pytest.mark.asyncio
+async def test_user_bulk_create_job(async_client: "AsyncClient", async_db) -> None:
+    rows = [
+        {
+            'name': f"bulk_user_{i}",
+            'date_of_birth': "2000-01-01",
+            'date_of_join': "2023-01-01",
+            'date_of_left': "2023-12-01",
+        }
+        for i in range(3)
+    ]
+    rows.append(dict(rows[0]))
+    response = await async_client.post(f'{settings.API_V1_STR}/user/bulk-create/', json={'rows': rows})
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    job_id = response.json()['data']['id']
+
+    job = await get_job_backend().claim(async_db, 'test-worker')
+    assert job.id == job_id
+    await JobWorker(['test']).process(async_db, job)
+
+    response = await async_client.get(f'{settings.API_V1_STR}/jobs/{job_id}/')
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert result['status'] == JobStatus.SUCCEEDED.value
+    assert (result['total'], result['processed'], result['succeeded'], result['failed']) == (4, 4, 3, 1)
+    assert result['errors'][0]['row'] == 3
+
+    count = await user_repo.count(async_db=async_db, expressions=(user_repo.model.name.like('bulk_user_%'),))
+    assert count == 3
+
+
+@pytest.mark.asyncio
+async def test_stale_jobs_run_out_of_attempts(async_db) -> None:
+    stale = dict(kind='test.stale', payload={'rows': []}, status=JobStatus.RUNNING.value,
+                 locked_by='lost-worker', locked_at=datetime(2000, 1, 1, tzinfo=timezone.utc))
+    exhausted = Job(attempts=settings.JOB_MAX_ATTEMPTS, **stale)
+    retryable = Job(attempts=settings.JOB_MAX_ATTEMPTS - 1, **stale)
+    async_db.add_all([exhausted, retryable])
+    await async_db.commit()
+
+    job = await get_job_backend().claim(async_db, 'test-worker')
+    assert job.id == retryable.id
+    await async_db.refresh(exhausted)
+    assert exhausted.status == JobStatus.FAILED.value
+    assert exhausted.finished_at is not None
@@ -18,8 +18,8 @@ async def test_school_apis(async_client: "AsyncClient", async_db) -> None:
         'address_line_1': "address_line_1",
         'address_line_2': "address_line_2",
         'web_site': "http://example.com",
-        'latitude': 123456789.987654321,
-        'longitude': 123456789.987654321,
+        'latitude': 37.950000,
+        'longitude': 58.380000,
         'pin_code': 1234,
     }
     response = await async_client.post(f'{settings.API_V1_STR}/school/create/', json=data)
@@ -45,8 +45,8 @@ async def test_school_apis(async_client: "AsyncClient", async_db) -> None:
         'address_line_1': "address_line_1_updated",
         'address_line_2': "address_line_2_updated",
         'web_site': "http://updated.example.com",
-        'latitude': 987654321.123456789,
-        'longitude': 987654321.123456789,
+        'latitude': 37.960000,
+        'longitude': 58.390000,
     }
     response = await async_client.patch(f'{settings.API_V1_STR}/school/{school_id}/update/', json=data)
     assert response.status_code == status.HTTP_200_OK
@@ -58,3 +58,21 @@ async def test_school_apis(async_client: "AsyncClient", async_db) -> None:
     assert response.status_code == status.HTTP_200_OK
     is_exists = await school_repo.exists(async_db=async_db, params={'id': school_id})
     assert is_exists is False
+
+
+@pytest.mark.asyncio
+async def test_school_nearby(async_client: "AsyncClient", async_db) -> None:
+    for name, latitude, longitude in (('near', 37.951, 58.381), ('nearer', 37.9501, 58.3801), ('far', 38.5, 58.38)):
+        await school_repo.create(async_db=async_db, obj_in={
+            'name': f'nearby_{name}', 'latitude': latitude, 'longitude': longitude,
+        })
+
+    params = {'lat': 37.95, 'lon': 58.38, 'radius_km': 5}
+    response = await async_client.get(f'{settings.API_V1_STR}/school/nearby/', params=params)
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert [row['name'] for row in result] == ['nearby_nearer', 'nearby_near']
+    assert result[0]['distance_km'] < result[1]['distance_km'] < 5
+
+    response = await async_client.get(f'{settings.API_V1_STR}/school/nearby/', params={**params, 'lat': 91})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
@@ -1,5 +1,6 @@
 from pprint import pprint
 
+import orjson
 import pytest
 from starlette import status
 
@@ -112,3 +113,87 @@ async def test_group_apis(async_client: "AsyncClient", async_db) -> None:
     assert response.status_code == status.HTTP_200_OK
     is_exists = await group_repo.exists(async_db=async_db, params={'id': group_id})
     assert is_exists is False
+
+
+@pytest.mark.asyncio
+async def test_user_import(async_client: "AsyncClient", async_db) -> None:
+    data = (
+        "name,first_name,date_of_birth,date_of_join,date_of_left,business_email\n"
+        "import_user_1,First,2000-01-01,2023-01-01,2023-12-01,one@example.com\n"
+        "import_user_2,First,2000-01-01,2023-01-01,2023-12-01,not-an-email\n"
+        "import_user_1,First,2000-01-01,2023-01-01,2023-12-01,one@example.com\n"
+    )
+    response = await async_client.post(
+        f'{settings.API_V1_STR}/user/import/', content=data.encode(), headers={'Content-Type': 'text/csv'}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    report = response.json()['data']
+    assert (report['total'], report['succeeded'], report['failed']) == (3, 1, 2)
+    assert [error['row'] for error in report['errors']] == [1, 2]
+
+    response = await async_client.post(
+        f'{settings.API_V1_STR}/user/import/', content=b'{}', headers={'Content-Type': 'application/json'}
+    )
+    assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+
+
+@pytest.mark.asyncio
+async def test_user_sync(async_client: "AsyncClient", async_db, monkeypatch) -> None:
+    monkeypatch.setattr(settings, 'CHANGES_SETTLE_SECONDS', 0)
+    response = await async_client.post(f'{settings.API_V1_STR}/group/create/', json={'name': 'sync_group'})
+    group_id = response.json()['data']['id']
+
+    response = await async_client.get(f'{settings.API_V1_STR}/group/sync/', params={'limit': 1000})
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert group_id in [row['id'] for row in result['rows']]
+    assert result['has_more'] is False
+    cursor = result['cursor']
+
+    response = await async_client.get(f'{settings.API_V1_STR}/group/{group_id}/delete/')
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await async_client.get(f'{settings.API_V1_STR}/group/sync/', params={'cursor': cursor})
+    result = response.json()
+    assert group_id not in [row['id'] for row in result['rows']]
+    assert group_id in result['deleted']
+
+    response = await async_client.get(f'{settings.API_V1_STR}/group/sync/', params={'cursor': 'not a cursor'})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_user_list_limit(async_client: "AsyncClient", async_db) -> None:
+    limit = settings.PAGINATION_HARD_MAX + 1
+    response = await async_client.get(f'{settings.API_V1_STR}/user/', params={'limit': limit})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    response = await async_client.get(
+        f'{settings.API_V1_STR}/user/', params={'limit': limit}, headers={'Accept': 'application/x-ndjson'}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    rows = [orjson.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == await user_repo.count(async_db)
+    assert [row['id'] for row in rows] == sorted(row['id'] for row in rows)
+
+
+@pytest.mark.asyncio
+async def test_group_batch(async_client: "AsyncClient", async_db) -> None:
+    groups = [await group_repo.create(async_db=async_db, obj_in={'name': f'batch_{i}'}) for i in range(3)]
+    ids = [groups[2].id, 0, groups[0].id, groups[2].id]
+
+    response = await async_client.get(
+        f'{settings.API_V1_STR}/group/batch/', params={'ids': ','.join(str(obj_id) for obj_id in ids)}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert [row and row['id'] for row in result['rows']] == [groups[2].id, None, groups[0].id, groups[2].id]
+    assert result['missing'] == [0]
+
+    response = await async_client.post(f'{settings.API_V1_STR}/group/batch/', json={'ids': ids})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == result
+
+    response = await async_client.get(f'{settings.API_V1_STR}/group/batch/', params={'ids': 'a,b'})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
@@ -1,12 +1,18 @@
+import os
 import pytest
 import asyncio
 import sys
-from typing import TYPE_CHECKING, Generator, Any, Iterator
+from typing import TYPE_CHECKING, Generator, Any, Iterator, Callable
 
 from asgi_lifespan import LifespanManager
 from httpx import AsyncClient
 
-from app.main import app
+# Endpoints exceeding their declared query budget fail the test
+os.environ.setdefault('QUERY_BUDGET_ENABLED', 'True')
+os.environ.setdefault('QUERY_BUDGET_STRICT', 'True')
+
+from app.core.query_budget import QueryBudget  # noqa: E402
+from app.main import app  # noqa: E402
 
 if TYPE_CHECKING:
     from fastapi import FastAPI
@@ -70,6 +76,17 @@ async def async_db():
         drop_database(database_uri)
 
 
+@pytest.fixture
+def query_budget() -> Callable[..., QueryBudget]:
+    """
+    Fail the test when the block executes more statements than allowed::
+
+        with query_budget(2):
+            await async_client.get(...)
+    """
+    return QueryBudget
+
+
 @pytest.fixture(autouse=True)
 async def application() -> Generator["FastAPI", Any, None]:
     yield app
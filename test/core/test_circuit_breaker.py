@@ -0,0 +1,43 @@
+import pytest
+from fastapi import HTTPException
+
+from app.core import circuit_breaker
+from app.core.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+def test_circuit_opens_and_recovers(monkeypatch) -> None:
+    now = [100.0]
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', lambda: now[0])
+    breaker = CircuitBreaker('db', failure_threshold=3, window=10, reset_timeout=5)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    now[0] += 11
+    # The first two failures left the window
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    with pytest.raises(HTTPException) as exc_info:
+        breaker.before_request()
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers['Retry-After'] == '5'
+
+    now[0] += 5
+    assert breaker.before_request() is True
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(HTTPException):
+        # One probe at a time
+        breaker.before_request()
+    breaker.record_failure()
+    breaker.after_request(True)
+    assert breaker.state == OPEN
+
+    now[0] += 5
+    probe = breaker.before_request()
+    breaker.record_success()
+    breaker.after_request(probe)
+    assert breaker.state == CLOSED
+    assert breaker.before_request() is False
@@ -0,0 +1,56 @@
+import pytest
+from httpx import AsyncClient
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from app.core.middleware.compression import CompressionMiddleware
+from app.utils.compression import negotiate_encoding
+
+
+async def _large(request):
+    return JSONResponse({'rows': ['row'] * 1000})
+
+
+async def _small(request):
+    return JSONResponse({'rows': []})
+
+
+async def _stream(request):
+    async def content():
+        for _ in range(100):
+            yield b'{"row": 1}\n' * 20
+
+    return StreamingResponse(content(), media_type='application/x-ndjson')
+
+
+compressed_app = CompressionMiddleware(Starlette(routes=[
+    Route('/large', _large), Route('/small', _small), Route('/stream', _stream),
+]))
+
+
+def test_negotiate_encoding() -> None:
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding('identity') is None
+    assert negotiate_encoding('gzip, deflate') == 'gzip'
+    assert negotiate_encoding('gzip;q=0, *;q=0.5') != 'gzip'
+
+
+@pytest.mark.asyncio
+async def test_compression_middleware() -> None:
+    async with AsyncClient(app=compressed_app, base_url="http://test", headers={'accept-encoding': 'gzip'}) as client:
+        response = await client.get('/large')
+        assert response.headers['content-encoding'] == 'gzip'
+        assert int(response.headers['content-length']) < 6000
+        assert len(response.json()['rows']) == 1000
+
+        response = await client.get('/small')
+        assert 'content-encoding' not in response.headers
+
+        response = await client.get('/stream')
+        assert response.headers['content-encoding'] == 'gzip'
+        assert response.text.count('\n') == 2000
+
+    async with AsyncClient(app=compressed_app, base_url="http://test") as client:
+        response = await client.get('/large', headers={'accept-encoding': 'identity'})
+        assert 'content-encoding' not in response.headers
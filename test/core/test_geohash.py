@@ -0,0 +1,24 @@
+import pytest
+
+from app.utils.geohash import encode, cover
+
+
+def test_encode() -> None:
+    assert encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert encode(-90, -180, 3) == '000'
+    assert encode(37.95, 58.38, 12).startswith('tq9')
+
+
+@pytest.mark.parametrize('latitude, longitude', [(37.95, 58.38), (0, 179.99), (-33.87, -0.01), (64.1, -21.9)])
+@pytest.mark.parametrize('radius_km', [0.5, 5, 50])
+def test_cover(latitude: float, longitude: float, radius_km: float) -> None:
+    prefixes = cover(latitude, longitude, radius_km)
+    assert 0 < len(prefixes) <= 4
+    delta = radius_km / 111.2 * 0.99
+    for point in ((latitude, longitude), (latitude + delta, longitude), (latitude - delta, longitude)):
+        assert any(encode(*point).startswith(prefix) for prefix in prefixes)
+
+
+def test_cover_too_large() -> None:
+    assert cover(89.9, 0, 50) == []
+    assert cover(0, 0, 5000) == []
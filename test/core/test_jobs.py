@@ -0,0 +1,142 @@
+from types import SimpleNamespace
+from typing import Dict, List
+
+import pytest
+
+from app.conf.config import settings
+from app.contrib.job.backends import JobBackend
+from app.contrib.job.handlers import job_handler
+from app.contrib.job.models import JobStatus
+from app.contrib.job.purge import purge_deleted
+from app.contrib.job.worker import JobWorker
+
+
+class RecordingBackend(JobBackend):
+    def __init__(self):
+        self.progress = []
+        self.finished = None
+        self.released = None
+
+    async def save_progress(self, async_db, job, **progress) -> None:
+        self.progress.append(progress)
+
+    async def finish(self, async_db, job, *, status, error=None) -> None:
+        self.finished = (status, error)
+
+    async def release(self, async_db, job, *, delay=0, error=None) -> None:
+        self.released = (delay, error)
+
+
+class FakeSession:
+    async def rollback(self) -> None:
+        pass
+
+
+def make_job(kind: str, rows: List[dict], **fields) -> SimpleNamespace:
+    values = dict(id=1, kind=kind, payload={'rows': rows}, processed=0, succeeded=0, failed=0, errors=None, attempts=0)
+    values.update(fields)
+    return SimpleNamespace(**values)
+
+
+@job_handler('test.odd-rows-fail')
+async def odd_rows_fail(async_db, rows: List[dict]) -> Dict[int, str]:
+    return {index: 'odd' for index, row in enumerate(rows) if row['value'] % 2}
+
+
+@job_handler('test.broken')
+async def broken(async_db, rows: List[dict]) -> Dict[int, str]:
+    raise RuntimeError('broken')
+
+
+@pytest.mark.asyncio
+async def test_worker_processes_chunks(monkeypatch) -> None:
+    monkeypatch.setattr(settings, 'JOB_CHUNK_SIZE', 2)
+    backend = RecordingBackend()
+    worker = JobWorker(['test'], backend=backend)
+    job = make_job('test.odd-rows-fail', [{'value': i} for i in range(5)])
+
+    await worker.process(FakeSession(), job)
+
+    assert [p['processed'] for p in backend.progress] == [2, 4, 5]
+    last = backend.progress[-1]
+    assert (last['succeeded'], last['failed']) == (3, 2)
+    assert last['errors'] == [{'row': 1, 'detail': 'odd'}, {'row': 3, 'detail': 'odd'}]
+    assert backend.finished == (JobStatus.SUCCEEDED.value, None)
+
+
+@pytest.mark.asyncio
+async def test_worker_resumes_and_retries(monkeypatch) -> None:
+    monkeypatch.setattr(settings, 'JOB_CHUNK_SIZE', 2)
+    backend = RecordingBackend()
+    worker = JobWorker(['test'], backend=backend)
+
+    job = make_job('test.odd-rows-fail', [{'value': i} for i in range(5)], processed=4, succeeded=3, failed=1)
+    await worker.process(FakeSession(), job)
+    assert backend.progress == [{'processed': 5, 'succeeded': 4, 'failed': 1, 'errors': []}]
+
+    await worker.process(FakeSession(), make_job('test.broken', [{}]))
+    assert backend.released == (settings.JOB_RETRY_DELAY, 'broken')
+
+    await worker.process(FakeSession(), make_job('test.broken', [{}], attempts=settings.JOB_MAX_ATTEMPTS - 1))
+    assert backend.finished == (JobStatus.FAILED.value, 'broken')
+
+
+class PurgeSession:
+    def __init__(self, rowcounts: List[int]):
+        self.rowcounts = rowcounts
+        self.statements = []
+        self.commits = 0
+
+    async def execute(self, statement):
+        self.statements.append(str(statement))
+        return SimpleNamespace(rowcount=self.rowcounts.pop(0) if self.rowcounts else 0)
+
+    async def commit(self) -> None:
+        self.commits += 1
+
+
+@pytest.mark.asyncio
+async def test_purge_deletes_references_in_batches(monkeypatch) -> None:
+    import app.contrib.school.models  # noqa: F401
+    monkeypatch.setattr(settings, 'SOFT_DELETE_PURGE_BATCH', 2)
+    # Two full batches of relations, then the rest
+    async_db = PurgeSession([2, 2, 1])
+
+    errors = await purge_deleted(async_db, [{'table': 'schools', 'id': 1}, {'table': 'user_school', 'id': 1}])
+    assert list(errors) == [1]
+    assert async_db.commits == 2
+    assert [statement.split(' WHERE')[0] for statement in async_db.statements] == [
+        'DELETE FROM user_school', 'DELETE FROM user_school', 'DELETE FROM user_school', 'DELETE FROM schools',
+    ]
+
+
+class CountedPurgeSession(PurgeSession):
+    def __init__(self, batches: List[List[dict]]):
+        super().__init__([])
+        self.batches = batches
+
+    async def execute(self, statement):
+        result = await super().execute(statement)
+        if self.statements[-1].startswith('SELECT user_group'):
+            rows = [SimpleNamespace(**row) for row in (self.batches.pop(0) if self.batches else [])]
+            result.all = lambda: rows
+        elif self.statements[-1].startswith('SELECT'):
+            result.all = list
+        return result
+
+
+@pytest.mark.asyncio
+async def test_purge_recounts_counted_relations(monkeypatch) -> None:
+    import app.contrib.user.repository  # noqa: F401
+    monkeypatch.setattr(settings, 'SOFT_DELETE_PURGE_BATCH', 2)
+    async_db = CountedPurgeSession([[{'id': 1, 'group_id': 5}, {'id': 2, 'group_id': 6}], [{'id': 3, 'group_id': 5}]])
+
+    assert await purge_deleted(async_db, [{'table': 'users', 'id': 1}]) == {}
+    # Each batch is deleted and the groups it counted on recounted together
+    assert async_db.commits == 1
+    statements = [statement for statement in async_db.statements if 'user_group' in statement]
+    assert [' '.join(statement.split()[:2]) for statement in statements] == [
+        'SELECT user_group.id,', 'DELETE FROM', 'UPDATE groups', 'SELECT user_group.id,', 'DELETE FROM', 'UPDATE groups',
+    ]
+    # Memberships of users soft deleted meanwhile are not counted
+    assert 'users.deleted_at IS NULL' in statements[2]
@@ -0,0 +1,35 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import create_engine, text
+from starlette import status
+
+from app.core.metrics import get_request_metrics, start_request_metrics, stop_request_metrics, timer
+from app.db.events import setup_query_events
+
+
+def test_request_metrics_collect_statements() -> None:
+    setup_query_events()
+    engine = create_engine("sqlite://")
+    metrics, token = start_request_metrics()
+    try:
+        with timer('auth'):
+            pass
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+    finally:
+        stop_request_metrics(token)
+
+    assert get_request_metrics() is None
+    assert metrics.query_count == 2
+    assert metrics.slowest_statement[0] in ("SELECT 1", "SELECT 2")
+    assert 'auth' in metrics.timings
+    assert 'db;dur=' in metrics.server_timing()
+
+
+@pytest.mark.asyncio
+async def test_server_timing_header(application) -> None:
+    async with AsyncClient(app=application, base_url="http://test") as client:
+        response = await client.get('/')
+    assert response.status_code == status.HTTP_200_OK
+    assert 'total;dur=' in response.headers['server-timing']
@@ -0,0 +1,36 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.core.query_budget import QueryBudgetExceeded, statement_shape
+from app.db.events import setup_query_events
+
+
+@pytest.fixture
+def engine():
+    setup_query_events()
+    return create_engine("sqlite://")
+
+
+def test_statement_shape() -> None:
+    assert statement_shape("SELECT * FROM users WHERE id IN (%s, %s, %s)") == "SELECT * FROM users WHERE id IN (...)"
+    assert statement_shape("SELECT 1\n  FROM  t WHERE a = 'x'") == "SELECT ? FROM t WHERE a = ?"
+
+
+def test_budget_exceeded(engine, query_budget) -> None:
+    with pytest.raises(QueryBudgetExceeded, match='executed 2 queries, budget is 1'):
+        with query_budget(1), engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+
+
+def test_repeated_statement_reported(engine, query_budget) -> None:
+    with pytest.raises(QueryBudgetExceeded, match='possible N\\+1'):
+        with query_budget(None, repeat_threshold=3), engine.connect() as conn:
+            for i in range(3):
+                conn.execute(text("SELECT :value"), {'value': i})
+
+
+def test_within_budget(engine, query_budget) -> None:
+    with query_budget(2) as budget, engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert budget.count == 1
@@ -0,0 +1,125 @@
+import asyncio
+from typing import List
+
+import pytest
+from fastapi import APIRouter, Depends, FastAPI
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from httpx import AsyncClient
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.schema import CommonsModel
+from app.core.throttling import throttle_class, WRITE
+from app.db.session import RELEASE_AFTER_ENDPOINT
+from app.routers.dependency import get_audience, get_commons
+from app.routers.route import ServiceRoute
+from app.utils.stream_writers import NDJSON_MEDIA_TYPE
+
+events: List[str] = []
+
+
+class RecordingSession(AsyncSession):
+    async def close(self) -> None:
+        events.append('close')
+        await super().close()
+
+
+class RecordingResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        events.append('render')
+        return super().render(content)
+
+
+async def get_session():
+    session = RecordingSession()
+    session.info[RELEASE_AFTER_ENDPOINT] = True
+    yield session
+
+
+api = APIRouter(route_class=ServiceRoute)
+
+
+@api.post('/plain/', response_class=RecordingResponse)
+async def plain(async_db: AsyncSession = Depends(get_session)) -> dict:
+    events.append('endpoint')
+    return {'ok': True}
+
+
+@api.post('/stream/')
+async def stream(async_db: AsyncSession = Depends(get_session)):
+    async def body():
+        events.append('chunk')
+        yield b'{}'
+
+    return StreamingResponse(body())
+
+
+@api.get('/list/')
+async def listing(commons: CommonsModel = Depends(get_commons)) -> dict:
+    await asyncio.sleep(0.01)
+    return {'stream': commons.stream}
+
+
+class Update(BaseModel):
+    is_active: bool
+
+
+@api.get('/item/update/')
+async def update_item(obj_in: Update) -> dict:
+    events.append('update')
+    await asyncio.sleep(0.01)
+    return {'is_active': obj_in.is_active}
+
+
+@api.get('/item/delete/')
+@throttle_class(WRITE)
+async def delete_item() -> dict:
+    events.append('delete')
+    await asyncio.sleep(0.01)
+    return {}
+
+
+@pytest.mark.asyncio
+async def test_sessions_released_before_response() -> None:
+    application = FastAPI()
+    application.include_router(api)
+    async with AsyncClient(app=application, base_url="http://test") as client:
+        events.clear()
+        response = await client.post('/plain/')
+        assert response.json() == {'ok': True}
+        assert events[:3] == ['endpoint', 'close', 'render']
+
+        events.clear()
+        response = await client.post('/stream/')
+        assert response.content == b'{}'
+        assert events[:2] == ['chunk', 'close']
+
+
+@pytest.mark.asyncio
+async def test_list_representations_are_not_shared() -> None:
+    application = FastAPI()
+    application.include_router(api)
+    application.dependency_overrides[get_audience] = lambda: 'tenant'
+    async with AsyncClient(app=application, base_url="http://test") as client:
+        page, stream = await asyncio.gather(
+            client.get('/list/'), client.get('/list/', headers={'Accept': NDJSON_MEDIA_TYPE}),
+        )
+    assert page.json() == {'stream': False}
+    assert stream.json() == {'stream': True}
+    assert 'Accept' in page.headers.get_list('vary')
+
+
+@pytest.mark.asyncio
+async def test_writing_get_routes_are_not_shared() -> None:
+    application = FastAPI()
+    application.include_router(api)
+    application.dependency_overrides[get_audience] = lambda: 'tenant'
+    async with AsyncClient(app=application, base_url="http://test") as client:
+        events.clear()
+        first, second = await asyncio.gather(
+            client.request('GET', '/item/update/', json={'is_active': True}),
+            client.request('GET', '/item/update/', json={'is_active': False}),
+        )
+        assert (first.json(), second.json()) == ({'is_active': True}, {'is_active': False})
+        await asyncio.gather(client.get('/item/delete/'), client.get('/item/delete/'))
+    assert events == ['update', 'update', 'delete', 'delete']
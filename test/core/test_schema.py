@@ -0,0 +1,19 @@
+import pytest
+from pydantic import TypeAdapter, ValidationError, EmailStr as PydanticEmailStr
+
+from app.core.schema import EmailStr
+
+
+@pytest.mark.parametrize('value', [
+    'user@Example.COM', 'a.b+c@mail.example.org', 'Name <name@example.com>', ' user@example.com ',
+    'user@münchen.de', 'user@xn--bcher-kva.example',
+    'user@localhost', 'a..b@example.com', 'user@-example.com', 'user@exa_mple.com', 'user@example.com.',
+])
+def test_email_str_matches_pydantic(value: str) -> None:
+    results = []
+    for adapter in (TypeAdapter(PydanticEmailStr), TypeAdapter(EmailStr)):
+        try:
+            results.append(adapter.validate_python(value))
+        except ValidationError as e:
+            results.append(e.errors()[0]['msg'])
+    assert results[0] == results[1]
@@ -0,0 +1,77 @@
+import base64
+import hashlib
+import hmac
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+from app.conf.config import jwt_settings
+from app.core.exceptions import ImproperlyConfigured, InvalidToken, ExpiredSignature
+from app.routers.dependency import verify_service_token
+from app.utils.security import ACCESS, REFRESH, jwt_payload, jwt_encode, jwt_decode
+
+
+@pytest.fixture(autouse=True)
+def secret_key(monkeypatch) -> None:
+    monkeypatch.setattr(jwt_settings, 'JWT_SECRET_KEY', 'k' * 32)
+
+
+def forge(secret: str, claims: dict) -> str:
+    def encode(data: bytes) -> bytes:
+        return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+    signing_input = encode(orjson.dumps({'alg': 'HS256', 'typ': 'JWT'})) + b'.' + encode(orjson.dumps(claims))
+    signature = hmac.new(secret.encode(), signing_input, hashlib.sha256).digest()
+    return (signing_input + b'.' + encode(signature)).decode()
+
+
+def test_token_roundtrip() -> None:
+    token = jwt_encode(jwt_payload('tenant'))
+    claims = jwt_decode(token)
+    assert claims['aud'] == 'tenant'
+    assert claims['type'] == ACCESS
+    assert claims['exp'] - claims['iat'] == jwt_settings.JWT_EXPIRATION_MINUTES * 60
+
+
+def test_tampered_token_is_rejected(monkeypatch) -> None:
+    header, payload, signature = jwt_encode(jwt_payload('tenant')).split('.')
+    other = jwt_encode(jwt_payload('other')).split('.')[1]
+    with pytest.raises(InvalidToken, match='signature'):
+        jwt_decode(f'{header}.{other}.{signature}')
+    with pytest.raises(InvalidToken, match='Malformed'):
+        jwt_decode('not-a-token')
+
+    monkeypatch.setattr(jwt_settings, 'JWT_ALGORITHM', 'HS512')
+    with pytest.raises(InvalidToken, match='algorithm'):
+        jwt_decode(f'{header}.{payload}.{signature}')
+
+
+def test_token_type_is_checked() -> None:
+    refresh = jwt_encode(jwt_payload('tenant', REFRESH))
+    assert jwt_decode(refresh, REFRESH)['aud'] == 'tenant'
+    with pytest.raises(InvalidToken, match='type'):
+        jwt_decode(refresh)
+
+
+def test_expired_token_is_rejected(monkeypatch) -> None:
+    monkeypatch.setattr(jwt_settings, 'JWT_EXPIRATION_MINUTES', -1)
+    token = jwt_encode(jwt_payload('tenant'))
+    with pytest.raises(ExpiredSignature):
+        jwt_decode(token)
+    monkeypatch.setattr(jwt_settings, 'JWT_LEEWAY', 120)
+    assert jwt_decode(token)['aud'] == 'tenant'
+
+
+@pytest.mark.parametrize('secret', [None, '', 'change_this', 'short'])
+def test_tokens_are_refused_without_a_real_secret(monkeypatch, secret) -> None:
+    claims = {'iss': 'backend', 'aud': 'mysql', 'type': 'access', 'exp': 2 ** 40}
+    monkeypatch.setattr(jwt_settings, 'JWT_SECRET_KEY', secret)
+    token = forge(secret or 'change_this', claims)
+    with pytest.raises(InvalidToken, match='disabled'):
+        jwt_decode(token)
+    with pytest.raises(HTTPException) as exc_info:
+        verify_service_token(token)
+    assert exc_info.value.status_code == 401
+    with pytest.raises(ImproperlyConfigured):
+        jwt_encode(jwt_payload('tenant'))
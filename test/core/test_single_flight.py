@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from app.core.single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_result() -> None:
+    calls = SingleFlight()
+    executed = 0
+
+    async def compute():
+        nonlocal executed
+        executed += 1
+        await asyncio.sleep(0.01)
+        return b'body'
+
+    results = await asyncio.gather(*[calls.do('key', compute) for _ in range(5)])
+    assert results == [b'body'] * 5
+    assert executed == 1
+    assert len(calls) == 0
+
+    await calls.do('key', compute)
+    assert executed == 2
+
+
+@pytest.mark.asyncio
+async def test_grace_window_and_errors() -> None:
+    calls = SingleFlight()
+    executed = 0
+
+    async def compute():
+        nonlocal executed
+        executed += 1
+        return executed
+
+    assert await calls.do('key', compute, grace=60) == 1
+    assert await calls.do('key', compute, grace=60) == 1
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('failed')
+
+    results = await asyncio.gather(*[calls.do('error', fail) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
@@ -0,0 +1,65 @@
+from typing import Dict, List
+
+import pytest
+
+from app.conf.config import settings
+from app.contrib.job.handlers import import_rows
+from app.utils.stream_parsers import iter_csv_rows, iter_ndjson_rows
+
+
+async def stream(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('size', [1, 7, 1024])
+async def test_csv_rows(size: int) -> None:
+    data = '﻿name,first_name,is_active\r\nu1,"A, ""B""\nC",true\r\n\r\nu2,,false\nbroken\n"open'.encode()
+    rows = [row async for row in iter_csv_rows(stream(data, size))]
+    assert rows == [
+        ({'name': 'u1', 'first_name': 'A, "B"\nC', 'is_active': 'true'}, None),
+        ({'name': 'u2', 'is_active': 'false'}, None),
+        (None, 'Expected 3 columns, got 1'),
+        (None, 'Unterminated quoted field'),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_rows() -> None:
+    data = '{"name": "é"}\n\n[1]\n{broken\n{"name": "u2"}'.encode()
+    rows = [row async for row in iter_ndjson_rows(stream(data, 3))]
+    assert rows[0] == ({'name': 'é'}, None)
+    assert rows[1] == (None, 'Expected a JSON object')
+    assert rows[2][0] is None and rows[2][1].startswith('Invalid JSON')
+    assert rows[3] == ({'name': 'u2'}, None)
+
+
+class FakeSession:
+    commits = 0
+
+    async def commit(self) -> None:
+        self.commits += 1
+
+
+@pytest.mark.asyncio
+async def test_import_rows(monkeypatch) -> None:
+    monkeypatch.setattr(settings, 'JOB_CHUNK_SIZE', 2)
+    chunks = []
+
+    async def handler(async_db, rows: List[dict]) -> Dict[int, str]:
+        chunks.append(len(rows))
+        return {index: 'duplicate' for index, row in enumerate(rows) if row['name'] == 'dup'}
+
+    async def rows():
+        for row in ({'name': 'a'}, None, {'name': 'dup'}, {'name': 'b'}, {'name': 'c'}):
+            yield (row, None) if row else (None, 'broken')
+
+    session = FakeSession()
+    report = await import_rows(session, handler, rows())
+    assert chunks == [2, 2]
+    assert session.commits == 2
+    assert report == {
+        'total': 5, 'succeeded': 3, 'failed': 2,
+        'errors': [{'row': 1, 'detail': 'broken'}, {'row': 2, 'detail': 'duplicate'}],
+    }
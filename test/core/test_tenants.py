@@ -0,0 +1,48 @@
+import pytest
+
+from app.core.exceptions import ImproperlyConfigured
+from app.db.tenants import Tenant, TenantDirectory
+
+
+def test_parse_tenant() -> None:
+    assert Tenant.parse('school') == Tenant('school')
+    assert Tenant.parse('db.internal/school') == Tenant('school', 'db.internal')
+    assert Tenant.parse('db.internal:3307/school') == Tenant('school', 'db.internal', 3307)
+    with pytest.raises(ImproperlyConfigured):
+        Tenant.parse('db.internal/')
+
+
+@pytest.mark.asyncio
+async def test_directory_without_sources() -> None:
+    directory = TenantDirectory(configured={})
+    assert await directory.get('anything') == Tenant('anything')
+
+
+@pytest.mark.asyncio
+async def test_unknown_audiences_are_cached(monkeypatch) -> None:
+    lookups = []
+
+    async def refresh(self) -> None:
+        self._loaded_at = 0.0
+
+    async def lookup(self, audience: str):
+        lookups.append(audience)
+        return Tenant('added') if audience == 'added' else None
+
+    monkeypatch.setattr(TenantDirectory, 'refresh', refresh)
+    monkeypatch.setattr(TenantDirectory, '_lookup', lookup)
+    directory = TenantDirectory(
+        configured={'known': 'db.internal/known'}, database='control', refresh_interval=1e12, negative_max_size=2,
+    )
+    assert await directory.get('known') == Tenant('known', 'db.internal')
+    assert await directory.get('typo') is None
+    assert await directory.get('typo') is None
+    assert await directory.get('added') == Tenant('added')
+    assert await directory.get('added') == Tenant('added')
+    assert lookups == ['typo', 'added']
+
+    # Oldest rejections are evicted past `negative_max_size`
+    assert await directory.get('other') is None
+    assert await directory.get('another') is None
+    assert await directory.get('typo') is None
+    assert lookups == ['typo', 'added', 'other', 'another', 'typo']
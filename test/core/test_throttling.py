@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+from starlette import status
+
+from app.core.exceptions import HTTPServiceUnavailable
+from app.core.throttling import InMemoryRateLimitBackend, ConcurrencyLimiter
+
+
+@pytest.mark.asyncio
+async def test_token_bucket() -> None:
+    backend = InMemoryRateLimitBackend()
+    for _ in range(3):
+        assert await backend.consume('tenant:read', rate=1, capacity=3) == 0
+    wait = await backend.consume('tenant:read', rate=1, capacity=3)
+    assert 0 < wait <= 1
+    # Other tenants have their own bucket
+    assert await backend.consume('other:read', rate=1, capacity=3) == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter_sheds() -> None:
+    limiter = ConcurrencyLimiter(limit=1, queue_size=1, timeout=0.05)
+    release = asyncio.Event()
+
+    async def hold():
+        async with limiter.acquire('tenant'):
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+
+    # Queued request times out
+    with pytest.raises(HTTPServiceUnavailable) as exc_info:
+        async with limiter.acquire('tenant'):
+            pass
+    assert exc_info.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert exc_info.value.headers['Retry-After'] == '1'
+
+    release.set()
+    await holder
+    async with limiter.acquire('tenant'):
+        pass
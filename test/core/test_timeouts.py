@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.dialects import mysql
+
+from app.conf.config import settings
+from app.contrib.user.models import User
+from app.core.exceptions import StatementTimeout
+from app.core.statement_timeout import statement_timeout_scope
+from app.db.repository import execute_write
+from app.db.timeouts import STATEMENT_TIMEOUT, _add_max_execution_time, run_with_timeout
+
+
+def executed(statement, timeout, **options) -> str:
+    state = SimpleNamespace(statement=statement, execution_options=options, session=SimpleNamespace(info={
+        STATEMENT_TIMEOUT: timeout,
+    }))
+    _add_max_execution_time(state)
+    return str(state.statement.compile(dialect=mysql.dialect()))
+
+
+def test_selects_get_max_execution_time() -> None:
+    assert executed(select(User.id), 500).startswith('SELECT /*+ MAX_EXECUTION_TIME(500) */ users.id')
+    assert 'MAX_EXECUTION_TIME' not in executed(select(User.id), None)
+    assert 'MAX_EXECUTION_TIME' not in executed(select(User.id), 500, stream_results=True)
+    assert 'MAX_EXECUTION_TIME' not in executed(update(User).values(name='a'), 500)
+    with statement_timeout_scope(50):
+        assert 'MAX_EXECUTION_TIME(50)' in executed(select(User.id), 500)
+    with statement_timeout_scope(None):
+        assert 'MAX_EXECUTION_TIME' not in executed(select(User.id), 500)
+
+
+@pytest.mark.asyncio
+async def test_await_gives_up_after_the_limit(monkeypatch) -> None:
+    monkeypatch.setattr(settings, 'DATABASE_STATEMENT_TIMEOUT_GRACE_MS', 10)
+    invalidated = []
+
+    async def invalidate():
+        invalidated.append(True)
+
+    async_db = SimpleNamespace(info={STATEMENT_TIMEOUT: 10}, invalidate=invalidate)
+    assert await run_with_timeout(async_db, lambda: asyncio.sleep(0, 'rows')) == 'rows'
+    with pytest.raises(StatementTimeout):
+        await run_with_timeout(async_db, lambda: asyncio.sleep(1))
+    assert invalidated == [True]
+
+
+@pytest.mark.asyncio
+async def test_writes_do_not_time_out_while_committing(monkeypatch) -> None:
+    monkeypatch.setattr(settings, 'DATABASE_STATEMENT_TIMEOUT_GRACE_MS', 10)
+    events = []
+
+    class SlowCommitSession:
+        bind = None
+        new = dirty = deleted = ()
+        identity_map = {}
+
+        def __init__(self):
+            self.info = {STATEMENT_TIMEOUT: 10}
+
+        async def flush(self):
+            events.append('flush')
+
+        async def commit(self):
+            await asyncio.sleep(0.1)
+            events.append('commit')
+
+        async def invalidate(self):
+            events.append('invalidate')
+
+    async_db = SlowCommitSession()
+    assert await execute_write(async_db, lambda: asyncio.sleep(0, 'written')) == 'written'
+    assert events == ['flush', 'commit']
+
+    # Slow statements time out before the commit
+    events.clear()
+    with pytest.raises(StatementTimeout):
+        await execute_write(async_db, lambda: asyncio.sleep(1))
+    assert events == ['invalidate']
@@ -0,0 +1,41 @@
+from datetime import datetime, date, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.contrib.school.schema import SchoolVisible
+from app.contrib.user.schema import UserVisible
+from app.core.schema import IPaginationDataBase, IResponseBase, is_trusted_model, construct_trusted
+
+
+def test_is_trusted_model() -> None:
+    assert is_trusted_model(UserVisible)
+    assert is_trusted_model(IResponseBase[UserVisible])
+    assert is_trusted_model(IPaginationDataBase[SchoolVisible])
+    assert not is_trusted_model(dict)
+    assert not is_trusted_model(IResponseBase[dict])
+
+
+@pytest.mark.asyncio
+async def test_trusted_output_matches_validated_output() -> None:
+    now = datetime.now(tz=timezone.utc)
+    user = SimpleNamespace(
+        id=1, name='user', created_at=now, modified_at=None, first_name='First', middle_name=None,
+        last_name='Last', date_of_birth=date(2000, 1, 1), date_of_join=None, date_of_left=None,
+        business_email='business@example.com', personal_email=None, is_active=True,
+    )
+    school = SimpleNamespace(
+        id=1, name='school', created_at=now, modified_at=now, address_line_1=None, address_line_2=None,
+        pin_code=1234, web_site=None, latitude=Decimal('0.123456'), longitude=None,
+    )
+    cases = (
+        (IResponseBase[UserVisible], {'message': 'ok', 'data': user}),
+        (IPaginationDataBase[SchoolVisible], {'page': 1, 'limit': 10, 'count': 1, 'rows': [school]}),
+    )
+    for model, content in cases:
+        field = create_response_field(name='Response', type_=model, mode='serialization')
+        validated = await serialize_response(field=field, response_content=content)
+        assert field.serialize(construct_trusted(model, content), mode='json') == validated